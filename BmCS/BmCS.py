@@ -8,19 +8,31 @@ This module establishes command line arguments and provides code to run the syst
 import argparse
 import json
 import datetime
-from pkg_resources import resource_string
+import os
+
+import numpy as np
 
 from .model_utils import *
-from .daily_update_file_parser import parse_update_file
+from .resources import resource_filename
+from .daily_update_file_parser import parse_update_file, iterparse_update_file, filter_citations
 from .preprocess_CNN_data import get_batch_data 
+from .word_tokenizer import TOKENIZERS, DEFAULT_TOKENIZER
 from .preprocess_voting_data import preprocess_data
-from .BmCS_tests.BmCS_test import BmCS_test_main
 
-from .bmcs_cnn_model import CnnModel
+from .bmcs_cnn_model import CnnModel, CNN_BACKENDS, DEFAULT_CNN_BACKEND, CNN_PRECISIONS, DEFAULT_CNN_PRECISION
 from .bmcs_scilearn_model import SciLearnModel
+from .journal_policy import JournalPolicy
+from .citation_batch import CitationBatch
+from .citation_cache import cache_from_args, CACHE_DIR_ENV, DEFAULT_CACHE_MAX_MB
+from .pipeline import run_pipeline, DEFAULT_PIPELINE_BATCH_SIZE, DEFAULT_PIPELINE_DEPTH, PIPELINE_BATCH_MULTIPLE
+from .precision_check import require_checked_precision
+from .prediction_writer import (
+        write_predictions, format_prediction_text, predictions_file_name,
+        OUTPUT_FORMATS, DEFAULT_OUTPUT_FORMAT, OUTPUT_NAMES, DEFAULT_OUTPUT_NAME, WRITE_CHUNK_ROWS)
+from .prediction_cache import citation_keys, prediction_cache_from_args, DEFAULT_MAX_ENTRIES, DEFAULT_MAX_AGE_DAYS
 
-import tensorflow as tf
-tf.compat.v1.disable_eager_execution()
+# TensorFlow, scikit-learn and NLTK are imported by the stages that use them,
+# so that --help, argument errors and the server start without loading them.
 
 def get_args():
     """
@@ -38,7 +50,40 @@ def get_args():
                         help="Path to ensemble")
     parser.add_argument("--path",
                         dest="path",
-                        help="Path to XML containing batch of citations")
+                        help="Path to XML containing batch of citations. May be gzip, bzip2 or zstandard compressed (e.g. pubmed24n0001.xml.gz)")
+    parser.add_argument("--batch",
+                        dest="batch",
+                        help="Directory or glob of update files (e.g. \"updates/*.xml.gz\") to score in one run. Files are shared out to a pool of worker processes that each load the models once. Do not include with --path.")
+    parser.add_argument("--workers",
+                        dest="workers",
+                        type=int,
+                        default=os.cpu_count(),
+                        help="Number of worker processes for --batch. Defaults to the number of CPUs.")
+    parser.add_argument("--merge-output",
+                        dest="merge_output",
+                        action="store_true",
+                        help="If included with --batch, write the predictions for all files to one citation_predictions_YYYY-MM-DD.txt file, in input order, instead of one citation_predictions_<input name>.txt file per input.")
+    parser.add_argument("--serve",
+                        dest="serve",
+                        action="store_true",
+                        help="If included, run a scoring server instead of scoring --path. The models are loaded once. POST PubMed XML to /predict to get the prediction lines. GET /health and /ready report the server state. The filtering options apply to every request. Cannot be combined with --concurrent, or with --prep-workers or --ensemble-workers above 1.")
+    parser.add_argument("--host",
+                        dest="host",
+                        default="127.0.0.1",
+                        help="Address for --serve to listen on. Default 127.0.0.1.")
+    parser.add_argument("--port",
+                        dest="port",
+                        type=int,
+                        default=8080,
+                        help="Port for --serve to listen on. Default 8080.")
+    parser.add_argument("--socket",
+                        dest="socket",
+                        default=None,
+                        help="Path of a Unix socket for --serve to listen on, instead of --host and --port.")
+    parser.add_argument("--stream",
+                        dest="stream",
+                        action="store_true",
+                        help="If included, parse the XML incrementally, one PubmedArticle at a time, instead of loading the whole element tree. Keeps parser memory flat for large update and baseline files.")
     parser.add_argument("--filter",
                         dest="predict_all",
                         action="store_false",
@@ -51,10 +96,107 @@ def get_args():
                         dest="pub_type_filter",
                         action="store_true",
                         help="If included, turn on the prediction adjustment for pub types. This means comments, erratum, etc will be marked with a 3 in the output. Can be used with or without --filter") 
+    parser.add_argument("--pipeline",
+                        dest="pipeline",
+                        action="store_true",
+                        help="If included, score the --path file in micro-batches, with parsing, preprocessing, the models, the thresholds and writing running at the same time on separate threads. Memory use is set by --pipeline-batch-size rather than the size of the file, unless the parsed citation cache is on: then the whole file is parsed or loaded, and split. Same output file. Cannot be combined with --prep-workers or --ensemble-workers above 1.")
+    parser.add_argument("--pipeline-batch-size",
+                        dest="pipeline_batch_size",
+                        type=int,
+                        default=DEFAULT_PIPELINE_BATCH_SIZE,
+                        help="Citations per micro-batch with --pipeline, a multiple of {0}. Default {1}.".format(PIPELINE_BATCH_MULTIPLE, DEFAULT_PIPELINE_BATCH_SIZE))
+    parser.add_argument("--pipeline-depth",
+                        dest="pipeline_depth",
+                        type=int,
+                        default=DEFAULT_PIPELINE_DEPTH,
+                        help="Micro-batches each --pipeline stage may run ahead of the next. Default {0}.".format(DEFAULT_PIPELINE_DEPTH))
+    parser.add_argument("--cache-dir",
+                        dest="cache_dir",
+                        default=None,
+                        help="Directory for the parsed citation cache. If set, the citations parsed from each update file are cached, keyed by file content, and later runs with any filtering options reuse them instead of parsing the XML again. Defaults to the {0} environment variable; off if neither is set.".format(CACHE_DIR_ENV))
+    parser.add_argument("--cache-max-mb",
+                        dest="cache_max_mb",
+                        type=float,
+                        default=DEFAULT_CACHE_MAX_MB,
+                        help="Maximum size of the parsed citation cache in MB. Least recently used files are evicted first. Must be above 0. Default {0}.".format(DEFAULT_CACHE_MAX_MB))
+    parser.add_argument("--no-cache",
+                        dest="no_cache",
+                        action="store_true",
+                        help="If included, do not read or write the parsed citation cache, even if --cache-dir or {0} is set.".format(CACHE_DIR_ENV))
+    parser.add_argument("--prediction-cache",
+                        dest="prediction_cache",
+                        default=None,
+                        help="Path of an SQLite prediction cache. If set, the ensemble and CNN probabilities of each citation are stored, keyed by a hash of the model inputs and the model files, and citations seen before are not run through the models again. Off by default.")
+    parser.add_argument("--prediction-cache-max-entries",
+                        dest="prediction_cache_max_entries",
+                        type=int,
+                        default=DEFAULT_MAX_ENTRIES,
+                        help="Maximum number of citations in the prediction cache. Least recently used citations are removed first. Default {0}.".format(DEFAULT_MAX_ENTRIES))
+    parser.add_argument("--prediction-cache-max-age-days",
+                        dest="prediction_cache_max_age_days",
+                        type=float,
+                        default=DEFAULT_MAX_AGE_DAYS,
+                        help="Citations not used for this many days are removed from the prediction cache. Default {0}.".format(DEFAULT_MAX_AGE_DAYS))
+    parser.add_argument("--tokenizer",
+                        dest="tokenizer",
+                        choices=TOKENIZERS,
+                        default=DEFAULT_TOKENIZER,
+                        help="Word tokenizer for the CNN input. regex gives the same tokens as nltk, faster. nltk uses nltk.tokenize.word_tokenize directly. Both split sentences with NLTK's punkt model. Default {0}.".format(DEFAULT_TOKENIZER))
+    parser.add_argument("--prep-workers",
+                        dest="prep_workers",
+                        type=int,
+                        default=1,
+                        help="Number of processes that tokenize and vectorize the CNN input. Default 1, in the main process. Results are the same for any number.")
+    parser.add_argument("--ensemble-workers",
+                        dest="ensemble_workers",
+                        type=int,
+                        default=1,
+                        help="Number of processes that run the voting ensemble, on chunks of citations. Default 1, in the main process. Results are the same for any number.")
+    parser.add_argument("--concurrent",
+                        dest="concurrent",
+                        action="store_true",
+                        help="If included, run the voting ensemble on --ensemble-workers processes (at least one), forked before the CNN is loaded, while this process vectorizes the CNN input and runs the CNN on the remaining CPUs. Same predictions as running them one after the other.")
+    parser.add_argument("--cascade",
+                        dest="cascade",
+                        action="store_true",
+                        help="If included, run the voting ensemble first and the CNN only on citations whose label can still depend on it. Same labels; the probability of citations that skip the CNN is written as nan.")
+    parser.add_argument("--ensemble-chunk-size",
+                        dest="ensemble_chunk_size",
+                        type=int,
+                        default=SCORING_CHUNK_SIZE,
+                        help="Citations per chunk with --ensemble-workers. Files with fewer than two chunks are scored in the main process. Default {0}.".format(SCORING_CHUNK_SIZE))
+    parser.add_argument("--cnn-backend",
+                        dest="cnn_backend",
+                        choices=CNN_BACKENDS,
+                        default=DEFAULT_CNN_BACKEND,
+                        help="Runtime for the CNN. numpy runs the same forward pass in NumPy, without loading TensorFlow; probabilities match tensorflow to within float32 rounding. Default {0}.".format(DEFAULT_CNN_BACKEND))
+    parser.add_argument("--length-buckets",
+                        dest="length_buckets",
+                        action="store_true",
+                        help="If included, run the CNN on citations sorted by length, computing only up to the last word of the longest title and abstract in each batch rather than all padded positions. Same predictions, to within float32 rounding. Requires --cnn-backend numpy.")
+    parser.add_argument("--cnn-precision",
+                        dest="cnn_precision",
+                        choices=CNN_PRECISIONS,
+                        default=DEFAULT_CNN_PRECISION,
+                        help="Precision of the CNN embedding table. float16 and int8 (quantized per word) use less memory, the rest of the network runs in float32. Reduced precisions are refused for scoring until a --validation or --test run with them has metrics within --tolerance of float32. Requires --cnn-backend numpy. Default {0}.".format(DEFAULT_CNN_PRECISION))
+    parser.add_argument("--precision-record",
+                        dest="precision_record",
+                        default=None,
+                        help="JSON file of the passed --cnn-precision checks, written by --validation and --test and read when scoring. Default precision_checks.json in $XDG_CACHE_HOME/BmCS or ~/.cache/BmCS, or in --dest if that directory is not writable.")
     parser.add_argument("--dest",
                         dest="destination",
                         default="./",
                         help="Destination directory for predictions or testing metrics. Will default to the current directory")
+    parser.add_argument("--output-format",
+                        dest="output_format",
+                        choices=OUTPUT_FORMATS,
+                        default=DEFAULT_OUTPUT_FORMAT,
+                        help="Format of the predictions file. text is the pipe-delimited citation_predictions file; text.gz the same, gzipped; jsonl one JSON object per citation; npz and parquet (requires pyarrow) columns of pmid, label, probability and journal_id. Default {0}.".format(DEFAULT_OUTPUT_FORMAT))
+    parser.add_argument("--output-name",
+                        dest="output_name",
+                        choices=OUTPUT_NAMES,
+                        default=DEFAULT_OUTPUT_NAME,
+                        help="Name the predictions file for the --path file by today's date, citation_predictions_YYYY-MM-DD, or after the input file, e.g. citation_predictions_pubmed24n0001 for pubmed24n0001.xml.gz, so that runs on different files never overwrite each other. Default {0}.".format(DEFAULT_OUTPUT_NAME))
     parser.add_argument("--validation",
                         dest="validation",
                         action="store_true",
@@ -78,89 +220,342 @@ def get_args():
     return parser
 
 
-def save_predictions(adjusted_predictions, prediction_dict, pmids, destination):
+def format_predictions(adjusted_predictions, prediction_dict, pmids):
+    """
+    Generate the prediction lines, in format
+    pmid|binary prediction|probability|journal
+
+    Each item is the text of up to WRITE_CHUNK_ROWS lines, formatted from whole columns.
+    """
+
+    journal_ids = prediction_dict['journal_ids']
+    for start in range(0, len(pmids), WRITE_CHUNK_ROWS):
+        end = start + WRITE_CHUNK_ROWS
+        chunk_dict = {'predictions': prediction_dict['predictions'][start:end], 'journal_ids': journal_ids[start:end]}
+        yield format_prediction_text(adjusted_predictions[start:end], chunk_dict, pmids[start:end])
+
+
+def save_predictions(adjusted_predictions, prediction_dict, pmids, destination, file_name=None, mode="w", output_format=DEFAULT_OUTPUT_FORMAT):
     """
     Save predictions to file in format
     pmid|binary prediction|probability|journal
+    or in another of prediction_writer.OUTPUT_FORMATS.
+
+    By default the file is named by date. 
+    Batch mode provides a name derived from the input file instead.
+    Files are written to a temporary file and renamed, except when appending with mode "a".
     """
     
-    with open("{0}citation_predictions_{1}.txt".format(destination, datetime.datetime.today().strftime('%Y-%m-%d')), "w") as f:
-        for i, prediction in enumerate(adjusted_predictions):
-            f.write("{0}|{1}|{2}|{3}\n".format(
-                pmids[i], 
-                prediction, 
-                prediction_dict['predictions'][i], 
-                prediction_dict['journal_ids'][i]
+    if file_name is None:
+        file_name = predictions_file_name(None, output_format)
+    path = "{0}{1}".format(destination, file_name)
+
+    if mode == "a":
+        if output_format != 'text':
+            msg = "Can't append to a {} predictions file. Use a PredictionWriter to write several batches to one file.".format(output_format)
+            raise BmCS_Exception(msg)
+        with open(path, mode) as f:
+            f.writelines(format_predictions(adjusted_predictions, prediction_dict, pmids))
+    else:
+        write_predictions(adjusted_predictions, prediction_dict, pmids, path, output_format)
+
+
+def output_file_name(args):
+    """
+    Name of the predictions file for the --path file, by date or after the input file as set by --output-name
+    """
+
+    return predictions_file_name(args.path if args.output_name == 'input' else None, args.output_format)
+
+
+def load_config():
+    """
+    Load the journal id config files into a JournalPolicy
+    """
+
+    return JournalPolicy.from_config()
+
+
+def load_models(args, num_threads=None):
+    """
+    Load the ensemble and the CNN. If num_threads is given, the CNN and BLAS use at most that many threads.
+    """
+
+    require_checked_precision(args)
+
+    o_sci_model = SciLearnModel(workers=args.ensemble_workers, chunk_size=args.ensemble_chunk_size)
+    o_sci_model.from_file(args.ensemble_path)
+    if args.concurrent or args.ensemble_workers > 1:
+        # Forked before TensorFlow is loaded and the BLAS threads are limited,
+        # so that no other thread holds a lock when the workers are forked
+        o_sci_model.start_workers(max(1, args.ensemble_workers))
+
+    if args.concurrent:
+        # The ensemble runs on its own processes, and the CNN on the other CPUs
+        from .batch_runner import available_cpus
+        num_threads = max(1, (num_threads or available_cpus()) - max(1, args.ensemble_workers))
+    if num_threads is not None:
+        from .batch_runner import limit_threads
+        limit_threads(num_threads, args.cnn_backend)
+
+    o_cnn_model = CnnModel()
+    o_cnn_model.from_file(resource_filename(__name__, "models/model_CNN.json"), args.CNN_path, backend=args.cnn_backend, length_buckets=args.length_buckets, precision=args.cnn_precision)
+
+    return o_sci_model, o_cnn_model
+
+
+def parse_citations(XML_path, args, journal_policy):
+    """
+    Parse and filter the citations in an update file, into a CitationBatch
+    """
+
+    selectively_indexed_ids = journal_policy.selectively_indexed_ids
+    misindexed_ids = journal_policy.misindexed_ids
+
+    # Load the unfiltered citations from the cache, or parse and cache them,
+    # then apply the filtering options to the columns. Cache misses are read
+    # incrementally, as with --stream, so the option holds with a cache as well.
+    cache = cache_from_args(args)
+    if cache is not None:
+        citations = cache.load_or_parse(XML_path)
+        return filter_citations(
+                citations, args.journal_drop, args.predict_medline,
+                selectively_indexed_ids, args.predict_all, misindexed_ids
+                )
+
+    # All dropping options are considered in parse_update_file
+    if args.stream:
+        citations = CitationBatch.from_citations(iterparse_update_file(
+                XML_path, args.journal_drop, args.predict_medline,
+                selectively_indexed_ids, args.predict_all, misindexed_ids
                 ))
+    else:
+        citations = parse_update_file(
+                XML_path, args.journal_drop, args.predict_medline, 
+                selectively_indexed_ids, args.predict_all, misindexed_ids 
+                ) 
+    return citations
 
 
-def main():
+def cnn_input(citations, args):
     """
-    Main function to run ensemble and CNN, combine results, adjust decision threshold, and make predictions. 
+    Tokenize and vectorize a CitationBatch for the CNN
     """
 
-    args = get_args().parse_args()
     journal_ids_path = resource_filename(__name__, "models/journal_ids.txt")
     word_indices_path = resource_filename(__name__, "models/word_indices.txt")
+    return get_batch_data(citations, journal_ids_path, word_indices_path, args.tokenizer, args.prep_workers)
 
-    selectively_indexed_id_path = resource_filename(__name__, "config/selectively_indexed_id_mapping.json")
-    with open(selectively_indexed_id_path, "r") as f:
-        selectively_indexed_ids = json.load(f) 
 
-    misindexed_id_path = resource_filename(__name__, "config/misindexed_journal_ids.json")
-    with open(misindexed_id_path, "r") as f:
-        misindexed_ids = json.load(f) 
-        misindexed_ids = misindexed_ids['misindexed_ids']
+def run_models(citations, o_sci_model, o_cnn_model, args, journal_policy=None):
+    """
+    Run the ensemble and the CNN on a CitationBatch. Returns the voting and CNN predictions.
+    journal_policy gives the group thresholds for --cascade.
+    """
+
+    if args.concurrent:
+        return run_models_concurrently(citations, o_sci_model, o_cnn_model, args)
+    if args.cascade:
+        return run_cascade(citations, o_sci_model, o_cnn_model, journal_policy, args)
+
+    voting_citations, _, _ = preprocess_data(citations)
+    voting_predictions = o_sci_model.process(voting_citations)
+
+    #voting_predictions = run_voting(args.ensemble_path, voting_citations)
+    CNN_citations = cnn_input(citations, args)
+    cnn_predictions = o_cnn_model.process(CNN_citations)
 
-    group_id_path = resource_filename(__name__, "config/group_ids.json") 
-    with open(group_id_path, "r") as f:
-        group_ids = json.load(f)
+    # cnn_predictions = run_CNN(args.CNN_path, CNN_citations)
+    return voting_predictions, cnn_predictions
+
+
+def run_models_concurrently(citations, o_sci_model, o_cnn_model, args):
+    """
+    Run the ensemble on forked processes while this process vectorizes the CNN input and runs the CNN.
+    Returns the same voting and CNN predictions as run_models, in about the time of the slower of the two.
+    """
+
+    voting_citations, _, _ = preprocess_data(citations)
+    # On the worker processes started by load_models
+    voting_result = o_sci_model.process_async(voting_citations, max(1, args.ensemble_workers))
+    try:
+        CNN_citations = cnn_input(citations, args)
+        cnn_predictions = o_cnn_model.process(CNN_citations)
+    finally:
+        voting_predictions = voting_result()
+
+    return voting_predictions, cnn_predictions
+
+
+def run_cascade(citations, o_sci_model, o_cnn_model, journal_policy, args):
+    """
+    Run the ensemble, then the CNN only on the citations whose label can depend on it.
+    The CNN predictions of the other citations are nan, and so are their combined predictions.
+    """
+
+    if journal_policy is None:
+        journal_policy = load_config()
+
+    voting_citations, journal_ids, _ = preprocess_data(citations)
+    voting_predictions = o_sci_model.process(voting_citations)
+
+    undecided = np.flatnonzero(cnn_needed(voting_predictions, journal_ids, journal_policy, args.group_thresh))
+    cnn_predictions = np.full(len(citations), np.nan, dtype=np.float32)
+    if len(undecided) > 0:
+        CNN_citations = cnn_input(citations.take(undecided), args)
+        cnn_predictions[undecided] = o_cnn_model.process(CNN_citations)
+
+    skipped = len(citations) - len(undecided)
+    print("Cascade: CNN skipped for {0} of {1} citations, {2:.1%} of CNN work".format(
+        skipped, len(citations), skipped / len(citations) if len(citations) > 0 else 0))
+    return voting_predictions, cnn_predictions
+
+
+def model_fingerprint(o_sci_model, o_cnn_model, args):
+    """
+    Identifies the models, and any options that change their predictions, for the prediction cache
+    """
+
+    return "{0}:{1}:{2}:{3}:{4}".format(o_sci_model.fingerprint(), o_cnn_model.fingerprint(), args.cnn_backend, int(args.length_buckets), args.cnn_precision)
+
+
+def predict_citations(citations, o_sci_model, o_cnn_model, journal_policy, args):
+    """
+    Run ensemble and CNN on parsed citations, combine results, and adjust decision thresholds.
+
+    Returns the adjusted predictions, the prediction dictionary and the pmids,
+    as used by save_predictions
+    """
+
+    prediction_cache = prediction_cache_from_args(args)
+    if prediction_cache is None:
+        voting_predictions, cnn_predictions = run_models(citations, o_sci_model, o_cnn_model, args, journal_policy)
+    else:
+        # Only run the models on citations that were not scored before with the same inputs and models
+        try:
+            keys = citation_keys(citations, model_fingerprint(o_sci_model, o_cnn_model, args))
+            voting_predictions, cnn_predictions, missing = prediction_cache.lookup(keys)
+            if len(missing) > 0:
+                missing_voting_predictions, missing_cnn_predictions = run_models(citations.take(missing), o_sci_model, o_cnn_model, args, journal_policy)
+                voting_predictions[missing] = missing_voting_predictions
+                cnn_predictions[missing] = missing_cnn_predictions
+                # Citations that skipped the CNN with --cascade have no CNN prediction to store
+                scored = np.flatnonzero(~np.isnan(missing_cnn_predictions))
+                prediction_cache.store([keys[i] for i in missing[scored].tolist()], missing_voting_predictions[scored], missing_cnn_predictions[scored])
+            print(prediction_cache.summary())
+        finally:
+            prediction_cache.close()
+
+    return decide_predictions(citations, voting_predictions, cnn_predictions, journal_policy, args)
+
+
+def decide_predictions(citations, voting_predictions, cnn_predictions, journal_policy, args, verbose=True):
+    """
+    Combine the voting and CNN predictions of a CitationBatch, and adjust decision thresholds.
+
+    Returns the adjusted predictions, an int8 array of labels, the prediction dictionary and the pmids,
+    as used by save_predictions. With verbose False, the progress messages are not printed,
+    e.g. for each micro-batch of --pipeline.
+    """
+
+    _, journal_ids, pmids = preprocess_data(citations)
+
+    combined_predictions = combine_predictions(voting_predictions, cnn_predictions)
+    prediction_dict = {'predictions': combined_predictions, 'journal_ids': journal_ids}
+
+    if verbose:
+        print("Combining predictions")
+    group_indices = None
+    if args.group_thresh:
+        citations = as_citation_batch(citations)
+        group_indices = as_journal_policy(journal_policy).coded_group_indices(citations.journal_codes, citations.journal_vocab)
+    # Mark pub types based on string matching rules in title 
+    # and PublicationType rules
+    review_mask = None
+    if args.pub_type_filter:
+        if verbose:
+            print("Marking specified Publication Types")
+        review_mask = default_rules().review_mask(citations)
+    # Threshold, mark pub types, and mark citations for automatic selection if above prediction threshold
+    adjusted_predictions = decide_labels(combined_predictions, group_indices, review_mask)
+
+    return adjusted_predictions, prediction_dict, pmids
+
+
+def check_args(parser, args):
+    """
+    Check combinations of command line options. Exits with a usage error, as parse_args does, if they conflict.
+    """
+
+    if args.length_buckets and args.cnn_backend != 'numpy':
+        parser.error("--length-buckets requires --cnn-backend numpy")
+    if args.cascade and (args.concurrent or args.pipeline):
+        parser.error("--cascade runs the CNN after the ensemble, and cannot be combined with --concurrent or --pipeline")
+    if args.pipeline and (args.batch or args.serve or args.concurrent):
+        parser.error("--pipeline scores a single --path file, and cannot be combined with --batch, --serve or --concurrent")
+    if args.pipeline and (args.prep_workers > 1 or args.ensemble_workers > 1):
+        # Forking worker pools from a stage thread, while another stage holds TensorFlow or BLAS locks, can deadlock the workers
+        parser.error("--pipeline runs its stages on threads, and cannot be combined with --prep-workers or --ensemble-workers above 1")
+    if args.serve and (args.concurrent or args.prep_workers > 1 or args.ensemble_workers > 1):
+        # The server loads the models while its request threads run, and forking worker processes then can deadlock them
+        parser.error("--serve cannot be combined with --concurrent, or with --prep-workers or --ensemble-workers above 1")
+    if args.pipeline_batch_size < 1 or args.pipeline_batch_size % PIPELINE_BATCH_MULTIPLE != 0:
+        parser.error("--pipeline-batch-size must be a multiple of {0}".format(PIPELINE_BATCH_MULTIPLE))
+    if args.pipeline_depth < 1:
+        parser.error("--pipeline-depth must be at least 1")
+    if args.cache_max_mb <= 0:
+        # An entry would be written, then evicted straight away. --no-cache turns the cache off.
+        parser.error("--cache-max-mb must be above 0. Use --no-cache to turn the cache off.")
+    if args.ensemble_chunk_size < 1:
+        parser.error("--ensemble-chunk-size must be at least 1")
+    if args.cnn_precision != DEFAULT_CNN_PRECISION and args.cnn_backend != 'numpy':
+        parser.error("--cnn-precision {0} requires --cnn-backend numpy".format(args.cnn_precision))
+
+
+def main():
+    """
+    Main function to run ensemble and CNN, combine results, adjust decision threshold, and make predictions. 
+    """
+
+    parser = get_args()
+    args = parser.parse_args()
+    check_args(parser, args)
+    journal_ids_path = resource_filename(__name__, "models/journal_ids.txt")
+    word_indices_path = resource_filename(__name__, "models/word_indices.txt")
+
+    journal_policy = load_config()
 
     group_thresh = args.group_thresh
     journal_drop = args.journal_drop
-    pub_type_filter = args.pub_type_filter
     destination = args.destination
-    predict_medline = args.predict_medline
-    predict_all = args.predict_all
 
     # Run system on test or validation set if specified
     # Predict MEDLINE has no effect
     if args.test or args.validation:
+        from .BmCS_tests.BmCS_test import BmCS_test_main
         dataset = "test" if args.test else "validation"
         BmCS_test_main(
             dataset, journal_ids_path, word_indices_path, 
-            group_thresh, journal_drop, destination, group_ids, misindexed_ids, args)
-
-    #Otherwise run on batch of citations
-    else:
-        XML_path = args.path
-        # All dropping options are considered in parse_update_file
-        citations = parse_update_file(
-                XML_path, journal_drop, predict_medline, 
-                selectively_indexed_ids, predict_all, misindexed_ids 
-                ) 
-        voting_citations, journal_ids, pmids = preprocess_data(citations)
+            group_thresh, journal_drop, destination, journal_policy, journal_policy.misindexed_ids, args)
 
-        o_sci_model = SciLearnModel()
-        o_sci_model.from_file(args.ensemble_path)
-        voting_predictions = o_sci_model.process(voting_citations)
+    # Serve predictions over HTTP until interrupted
+    elif args.serve:
+        from .scoring_server import serve
+        serve(args)
 
-        #voting_predictions = run_voting(args.ensemble_path, voting_citations)
-        CNN_citations = get_batch_data(citations, journal_ids_path, word_indices_path)
+    # Run on a directory or glob of update files, on a pool of workers
+    elif args.batch:
+        from .batch_runner import run_batch
+        run_batch(args)
 
-        o_cnn_model = CnnModel()
-        o_cnn_model.from_file(resource_filename(__name__, "models/model_CNN.json"), args.CNN_path)
-        cnn_predictions = o_cnn_model.process(CNN_citations)
+    # Score the file in micro-batches, with the stages running at the same time
+    elif args.pipeline:
+        o_sci_model, o_cnn_model = load_models(args)
+        run_pipeline(args.path, o_sci_model, o_cnn_model, journal_policy, args, file_name=output_file_name(args))
 
-        # cnn_predictions = run_CNN(args.CNN_path, CNN_citations)
-        combined_predictions = combine_predictions(voting_predictions, cnn_predictions)
-        prediction_dict = {'predictions': combined_predictions, 'journal_ids': journal_ids}
-        adjusted_predictions = adjust_thresholds(prediction_dict, group_ids, group_thresh) 
-        # Convert predictions for pub types based on string matching rules in title 
-        # and PublicationType rules
-        if pub_type_filter:
-            print("Marking specified Publication Types")
-            adjusted_predictions = filter_pub_type(citations, adjusted_predictions)
-        # Mark citations for automatic selection if above prediction threshold
-        adjusted_predictions = adjust_in_scope_predictions(adjusted_predictions, prediction_dict)
-        save_predictions(adjusted_predictions, prediction_dict, pmids, destination)
+    #Otherwise run on batch of citations
+    else:
+        citations = parse_citations(args.path, args, journal_policy)
+        o_sci_model, o_cnn_model = load_models(args)
+        adjusted_predictions, prediction_dict, pmids = predict_citations(citations, o_sci_model, o_cnn_model, journal_policy, args)
+        save_predictions(adjusted_predictions, prediction_dict, pmids, destination, file_name=output_file_name(args), output_format=args.output_format)
@@ -14,7 +14,11 @@ from ..model_utils import *
 from ..preprocess_CNN_data import get_batch_data
 from ..preprocess_voting_data import preprocess_data
 from ..thresholds import *
+from ..journal_policy import as_journal_policy
+from ..citation_batch import CitationBatch
+from ..precision_check import FULL_PRECISION, compare_metrics, record_check
 import gzip
+from collections import OrderedDict
 
 
 def parse_test_citations(XML_path, journal_drop, misindexed_ids):
@@ -45,18 +49,11 @@ def evaluate_individual_models(cnn_predictions, voting_predictions, labels, grou
         adj_cnn_preds = [1 if y >= CNN_THRESH else 0 for y in cnn_predictions]
     # Performance doesn't necessarily improve as expected, as validation thresholds don't apply to test set.
     else:
-        adj_voting_preds = []
-        adj_cnn_preds = []
-        for cnn_prob, voting_prob, journal_id in zip(cnn_predictions, voting_predictions, journal_ids):
-            if journal_id in group_ids['science']:
-                adj_voting_preds.append(1 if voting_prob >= VOTING_SCIENCE_THRESH else 0)
-                adj_cnn_preds.append(1 if cnn_prob >= CNN_SCIENCE_THRESH else 0)
-            elif journal_id in group_ids['jurisprudence']:
-                adj_voting_preds.append(1 if voting_prob >= VOTING_JURISPRUDENCE_THRESH else 0)
-                adj_cnn_preds.append(1 if cnn_prob >= CNN_JURISPRUDENCE_THRESH else 0)
-            else:
-                adj_voting_preds.append(1 if voting_prob >= VOTING_THRESH else 0)
-                adj_cnn_preds.append(1 if cnn_prob >= CNN_THRESH else 0)
+        journal_policy = as_journal_policy(group_ids)
+        voting_thresholds = journal_policy.voting_thresholds(journal_ids)
+        cnn_thresholds = journal_policy.cnn_thresholds(journal_ids)
+        adj_voting_preds = [1 if voting_prob >= thresh else 0 for voting_prob, thresh in zip(voting_predictions, voting_thresholds)]
+        adj_cnn_preds = [1 if cnn_prob >= thresh else 0 for cnn_prob, thresh in zip(cnn_predictions, cnn_thresholds)]
 
     voting_precision = precision_score(labels, adj_voting_preds)
     voting_recall = recall_score(labels, adj_voting_preds)
@@ -66,6 +63,33 @@ def evaluate_individual_models(cnn_predictions, voting_predictions, labels, grou
     return cnn_recall, cnn_precision, voting_recall, voting_precision
 
 
+def compute_metrics(labels, voting_predictions, cnn_predictions, journal_ids, group_ids, group_thresh):
+    """
+    Recall and precision of BmCS, of each model, and of the in-scope predictions, in the order of the results file
+    """
+
+    combined_predictions = combine_predictions(voting_predictions, cnn_predictions)
+    prediction_dict = {'predictions': combined_predictions, 'journal_ids': journal_ids}
+    adjusted_predictions = adjust_thresholds(prediction_dict, group_ids, group_thresh) 
+    adjusted_predictions = adjust_in_scope_predictions(adjusted_predictions, prediction_dict)
+
+    cnn_recall, cnn_precision, voting_recall, voting_precision = evaluate_individual_models(cnn_predictions, voting_predictions, labels, group_thresh, journal_ids, group_ids)
+
+    all_pos_pred = [1 if pred == 1 or pred == 2 else 0 for pred in adjusted_predictions]
+    in_scope_preds = [1 if pred == 1 else 0 for pred in adjusted_predictions]
+
+    return OrderedDict([
+        ("BmCS recall", recall_score(labels, all_pos_pred, pos_label=1)),
+        ("BmCS precision", precision_score(labels, all_pos_pred, pos_label=1)),
+        ("Voting recall", voting_recall),
+        ("Voting precision", voting_precision),
+        ("CNN recall", cnn_recall),
+        ("CNN precision", cnn_precision),
+        ("BmCS in-scope recall", recall_score(labels, in_scope_preds, pos_label=1)),
+        ("BmCS in-scope precision", precision_score(labels, in_scope_preds, pos_label=1)),
+        ])
+
+
 def BmCS_test_main(
         dataset, journal_ids_path, word_indicies_path, 
         group_thresh, journal_drop, destination, group_ids, misindexed_ids, args):
@@ -81,40 +105,39 @@ def BmCS_test_main(
         XML_path = resource_filename(__name__, "datasets/test_set.json.gz")
    
     citations = parse_test_citations(XML_path, journal_drop, misindexed_ids)
-    voting_citations, journal_ids, _ = preprocess_data(citations)
     labels = [c["is_indexed"] for c in citations]
-    voting_predictions = run_voting(args.ensemble_path, voting_citations)
-    CNN_citations = get_batch_data(citations, journal_ids_path, word_indicies_path)
-    cnn_predictions = run_CNN(args.CNN_path, CNN_citations)
-    combined_predictions = combine_predictions(voting_predictions, cnn_predictions)
-    prediction_dict = {'predictions': combined_predictions, 'journal_ids': journal_ids}
-    adjusted_predictions = adjust_thresholds(prediction_dict, group_ids, group_thresh) 
-    adjusted_predictions = adjust_in_scope_predictions(adjusted_predictions, prediction_dict)
-
-    cnn_recall, cnn_precision, voting_recall, voting_precision = evaluate_individual_models(cnn_predictions, voting_predictions, labels, group_thresh, journal_ids, group_ids)
-
-    all_pos_pred = [1 if pred == 1 or pred == 2 else 0 for pred in adjusted_predictions]
-    BmCS_recall = recall_score(labels, all_pos_pred, pos_label=1)
-    BmCS_precision = precision_score(labels, all_pos_pred, pos_label=1)
+    citations = CitationBatch.from_citations(citations)
+    voting_citations, journal_ids, _ = preprocess_data(citations)
+    voting_predictions = run_voting(args.ensemble_path, voting_citations, args.ensemble_workers, args.ensemble_chunk_size)
+    CNN_citations = get_batch_data(citations, journal_ids_path, word_indicies_path, args.tokenizer, args.prep_workers)
+    cnn_predictions = run_CNN(args.CNN_path, CNN_citations, args.cnn_backend, args.length_buckets, args.cnn_precision)
+    metrics = compute_metrics(labels, voting_predictions, cnn_predictions, journal_ids, group_ids, group_thresh)
 
-    in_scope_preds = [1 if pred == 1 else 0 for pred in adjusted_predictions]
-    BmCS_in_scope_recall = recall_score(labels, in_scope_preds, pos_label=1)
-    BmCS_in_scope_precision = precision_score(labels, in_scope_preds, pos_label=1)
+    # Reduced precision is checked against float32, on the same citations
+    if args.cnn_precision != FULL_PRECISION:
+        reference_cnn_predictions = run_CNN(args.CNN_path, CNN_citations, args.cnn_backend, args.length_buckets, FULL_PRECISION)
+        reference_metrics = compute_metrics(labels, voting_predictions, reference_cnn_predictions, journal_ids, group_ids, group_thresh)
 
     results_path = "{}/BmCS_test_results.txt".format(destination)
     with open(results_path, "a") as f:
         f.write("\n\n")
         for arg in vars(args):
             f.write("{0}: {1}\n".format(arg, vars(args)[arg]))
-        f.write("""BmCS recall: {0}\nBmCS precision: {1}\nVoting recall: {2}\nVoting precision: {3}\nCNN recall: {4}\nCNN precision: {5}\nBmCS in-scope recall: {6}\nBmCS in-scope precision: {7}\n""".format(
-                BmCS_recall,
-                BmCS_precision,
-                voting_recall,
-                voting_precision,
-                cnn_recall,
-                cnn_precision,
-                BmCS_in_scope_recall,
-                BmCS_in_scope_precision))
+        for name, value in metrics.items():
+            f.write("{0}: {1}\n".format(name, value))
+        if args.cnn_precision != FULL_PRECISION:
+            for name, value in reference_metrics.items():
+                f.write("{0} ({1}): {2}\n".format(name, FULL_PRECISION, value))
+
+    if args.cnn_precision != FULL_PRECISION:
+        compare_metrics(metrics, reference_metrics, args.cnn_precision, args.tolerance)
+        record_path = record_check(args, dataset, metrics, reference_metrics)
+        print("CNN precision {0} passed, metrics within {1} of {2}, recorded in {3}".format(args.cnn_precision, args.tolerance, FULL_PRECISION, record_path))
+
+    BmCS_recall = metrics["BmCS recall"]
+    BmCS_precision = metrics["BmCS precision"]
+    BmCS_in_scope_recall = metrics["BmCS in-scope recall"]
+    BmCS_in_scope_precision = metrics["BmCS in-scope precision"]
 
     # Values computed using generate_validation_vs_test_vs_group_thresholds.py, not included in this repository.
     if not group_thresh and not journal_drop:
@@ -10,7 +10,7 @@ import argparse
 import sys
 import json
 import datetime
-from pkg_resources import resource_string
+from ..resources import resource_filename
 import unittest
 from unittest.mock import patch
 
@@ -139,6 +139,8 @@ class test_BmCS_cli(unittest.TestCase):
         self.assertIsInstance(voting_citations, dict)
         for key in voting_citations:
             self.assertIsInstance(voting_citations[key], list)
+        self.assertIsInstance(journal_ids, list)
+        self.assertIsInstance(pmids, list)
         voting_predictions = run_voting(ensemble_path, voting_citations)
         self.assertEqual(len(voting_predictions), len(citations))
         CNN_citations = get_batch_data(citations, journal_ids_path, word_indicies_path)
@@ -0,0 +1,158 @@
+"""
+Module to run pytest unittests for the batch runner
+
+Batch mode must write, for each update file, the same predictions as a
+run on that file alone, and merge them in input order. Runs that need the
+models are skipped if the packaged model files are not available.
+"""
+
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from unittest import mock
+
+from ..BmCS import get_args, main
+from ..batch_runner import available_cpus, find_update_files, limit_threads, run_batch
+from ..bmcs_exceptions import BmCS_Exception
+from .test_daily_update_file_parser import XML_PATH
+
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
+CNN_PATH = os.path.join(MODELS_DIR, "model_CNN_weights.hdf5")
+ENSEMBLE_PATH = os.path.join(MODELS_DIR, "ensemble.joblib")
+
+
+def _write_update_file(path, articles):
+    """
+    Update file with the given PubmedArticle elements, gzipped if path ends with .gz
+    """
+
+    root = ET.Element("PubmedArticleSet")
+    root.extend(articles)
+    with (gzip.open if path.endswith(".gz") else open)(path, "wb") as f:
+        ET.ElementTree(root).write(f, encoding="utf-8", xml_declaration=True)
+    return path
+
+
+class test_batch_runner(unittest.TestCase):
+    """
+    Class to test finding the update files, scoring them on worker processes, and sharing the CPUs between workers
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.input_dir = os.path.join(self.temp_dir, "input")
+        os.makedirs(self.input_dir)
+        articles = ET.parse(XML_PATH).getroot().findall("PubmedArticle")
+        # Files of different sizes and compression, listed out of order
+        self.paths = [
+            _write_update_file(os.path.join(self.input_dir, "pubmed_b.xml.gz"), articles[4:]),
+            _write_update_file(os.path.join(self.input_dir, "pubmed_a.xml"), articles[:4]),
+            _write_update_file(os.path.join(self.input_dir, "pubmed_c.xml"), articles[2:6]),
+            ]
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _args(self, destination, options=[]):
+        return get_args().parse_args([CNN_PATH, ENSEMBLE_PATH, "--cnn-backend", "numpy", "--dest", destination] + options)
+
+    def _destination(self, name):
+        destination = os.path.join(self.temp_dir, name, "")
+        os.makedirs(destination)
+        return destination
+
+    def _require_models(self):
+        for path in [CNN_PATH, ENSEMBLE_PATH]:
+            if not os.path.isfile(path):
+                self.skipTest("{} is not available".format(os.path.basename(path)))
+
+    def _serial_outputs(self):
+        """
+        Predictions of a run on each file alone, by input name
+        """
+
+        destination = self._destination("serial")
+        for path in sorted(self.paths):
+            with mock.patch.object(sys, "argv", ["BmCS", CNN_PATH, ENSEMBLE_PATH, "--cnn-backend", "numpy",
+                                                 "--dest", destination, "--path", path, "--output-name", "input"]):
+                main()
+        outputs = {}
+        for name in os.listdir(destination):
+            with open(os.path.join(destination, name)) as f:
+                outputs[name] = f.read()
+        return outputs
+
+    def test_find_update_files(self):
+        for name in ["pubmed_d.xml.bz2", "pubmed_e.xml.zst", "notes.txt", "pubmed_f.xml.tmp"]:
+            with open(os.path.join(self.input_dir, name), "wb") as f:
+                f.write(b"")
+        # A directory with an update file suffix is not a file
+        os.makedirs(os.path.join(self.input_dir, "pubmed_g.xml"))
+
+        expected = sorted(self.paths + [os.path.join(self.input_dir, name) for name in ["pubmed_d.xml.bz2", "pubmed_e.xml.zst"]])
+        self.assertEqual(find_update_files(self.input_dir), expected)
+        self.assertEqual(find_update_files(os.path.join(self.input_dir, "*.xml")), [os.path.join(self.input_dir, "pubmed_a.xml"), os.path.join(self.input_dir, "pubmed_c.xml")])
+        with self.assertRaises(BmCS_Exception):
+            find_update_files(os.path.join(self.temp_dir, "missing", "*.xml"))
+
+    def test_worker_error(self):
+        # The workers can't load the model files, and the error is raised here
+        model_paths = [os.path.join(self.temp_dir, "model_CNN_weights.hdf5"), os.path.join(self.temp_dir, "ensemble.joblib")]
+        for path in model_paths:
+            with open(path, "wb") as f:
+                f.write(b"not a model")
+        args = get_args().parse_args(model_paths + ["--cnn-backend", "numpy", "--batch", self.input_dir, "--workers", "2", "--dest", self._destination("batch")])
+        with self.assertRaises(BmCS_Exception) as context:
+            run_batch(args)
+        self.assertIn("initialize batch worker", str(context.exception))
+
+    def test_same_as_serial(self):
+        self._require_models()
+        serial_outputs = self._serial_outputs()
+        self.assertEqual(len(serial_outputs), len(self.paths))
+
+        destination = self._destination("batch")
+        run_batch(self._args(destination, ["--batch", self.input_dir, "--workers", "2"]))
+        self.assertEqual(sorted(os.listdir(destination)), sorted(serial_outputs))
+        for name, expected in serial_outputs.items():
+            with open(os.path.join(destination, name)) as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_merged_order(self):
+        self._require_models()
+        serial_outputs = self._serial_outputs()
+        # In input order, whichever worker finishes first
+        expected = "".join(serial_outputs[name] for name in sorted(serial_outputs))
+
+        for run in range(2):
+            destination = self._destination("merged_{0}".format(run))
+            run_batch(self._args(destination, ["--batch", self.input_dir, "--workers", "2", "--merge-output"]))
+            names = os.listdir(destination)
+            self.assertEqual(len(names), 1)
+            with open(os.path.join(destination, names[0])) as f:
+                self.assertEqual(f.read(), expected)
+
+    def test_file_error(self):
+        self._require_models()
+        with open(os.path.join(self.input_dir, "pubmed_d.xml"), "w") as f:
+            f.write("<PubmedArticleSet><PubmedArticle>")
+
+        with self.assertRaises(BmCS_Exception) as context:
+            run_batch(self._args(self._destination("batch"), ["--batch", self.input_dir, "--workers", "2"]))
+        self.assertIn("pubmed_d.xml", str(context.exception))
+
+    def test_limit_threads_without_threadpoolctl(self):
+        # An entry of None in sys.modules makes the import fail
+        with mock.patch.dict(os.environ), mock.patch.dict(sys.modules, {"threadpoolctl": None}):
+            limit_threads(2, 'numpy')
+            self.assertEqual(os.environ["OMP_NUM_THREADS"], "2")
+            self.assertEqual(available_cpus(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
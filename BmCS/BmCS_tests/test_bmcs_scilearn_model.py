@@ -0,0 +1,92 @@
+"""
+Module to run pytest unittests for the voting ensemble model
+
+Scoring in chunks of rows on worker processes must give exactly the same
+probabilities as a single predict_proba call on the whole input.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..bmcs_scilearn_model import SciLearnModel, predict_proba_chunked
+from ..citation_batch import CitationBatch
+from ..daily_update_file_parser import parse_update_file
+from ..preprocess_voting_data import preprocess_data
+from .test_daily_update_file_parser import XML_PATH
+
+
+def _ensemble():
+    """
+    Unfitted pipeline with the same steps as the packaged ensemble
+    """
+
+    from sklearn.ensemble import VotingClassifier
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import MultinomialNB
+    from sklearn.pipeline import FeatureUnion, Pipeline
+    from ..item_select import ItemSelector
+
+    union = FeatureUnion([(column, Pipeline([('sel', ItemSelector(column)), ('tfidf', TfidfVectorizer())]))
+                          for column in ['abstract', 'titles', 'author_list']])
+    classifier = VotingClassifier([('lr', LogisticRegression()), ('nb', MultinomialNB())], voting='soft')
+    return Pipeline([('union', union), ('clf', classifier)])
+
+
+class test_bmcs_scilearn_model(unittest.TestCase):
+    """
+    Class to test chunked parallel scoring against predict_proba
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        citations = parse_update_file(XML_PATH, False, False, [], True, [])
+        # Enough citations for several chunks, with a partial last chunk
+        citations = CitationBatch.concatenate([citations] * 7)
+        self.dX, _, _ = preprocess_data(citations)
+
+        self.model = _ensemble()
+        labels = np.arange(len(citations)) % 3 == 0
+        self.model.fit(self.dX, labels)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_predict_proba_chunked(self):
+        expected = self.model.predict_proba(self.dX)
+        for workers, chunk_size in [(1, 8), (3, 8), (2, 10), (2, len(self.dX['titles']))]:
+            np.testing.assert_array_equal(predict_proba_chunked(self.model, self.dX, workers, chunk_size), expected)
+
+    def test_process(self):
+        import joblib
+        path = os.path.join(self.temp_dir, "ensemble.joblib")
+        joblib.dump(self.model, path)
+
+        serial = SciLearnModel()
+        serial.from_file(path)
+        parallel = SciLearnModel(workers=3, chunk_size=8)
+        parallel.from_file(path)
+        np.testing.assert_array_equal(parallel.process(self.dX), serial.process(self.dX))
+        np.testing.assert_array_equal(serial.process(self.dX), self.model.predict_proba(self.dX)[:, 0])
+
+        # Started on other processes, with a single chunk or several
+        for workers in [None, 1, 3]:
+            result = parallel.process_async(self.dX, workers)
+            np.testing.assert_array_equal(result(), serial.process(self.dX))
+
+        # On worker processes started once, and used for each call
+        parallel.start_workers()
+        try:
+            for _ in range(2):
+                np.testing.assert_array_equal(parallel.process(self.dX), serial.process(self.dX))
+                np.testing.assert_array_equal(parallel.process_async(self.dX)(), serial.process(self.dX))
+        finally:
+            parallel.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Module to run pytest unittests for the --cascade mode
+
+Citations that skip the CNN must get exactly the labels they would have
+been given with any CNN prediction.
+"""
+
+import argparse
+import itertools
+import unittest
+
+import numpy as np
+
+from ..BmCS import decide_predictions, run_cascade
+from ..daily_update_file_parser import parse_update_file
+from ..journal_policy import JournalPolicy
+from ..model_utils import cnn_needed
+from ..preprocess_voting_data import preprocess_data
+from ..thresholds import *
+from .test_daily_update_file_parser import XML_PATH
+
+
+class _FixedModel:
+    """
+    Returns fixed predictions, by citation, and counts the citations it is given
+    """
+
+    def __init__(self, predictions):
+        self.predictions = predictions
+        self.num_processed = 0
+
+    def process(self, dX):
+        # Both models take a dictionary of columns
+        num_rows = len(next(iter(dX.values())))
+        self.num_processed += num_rows
+        return self.predictions[:num_rows]
+
+
+class test_cascade(unittest.TestCase):
+    """
+    Class to test the cascade against deciding with every CNN prediction
+    """
+
+    def setUp(self):
+        self.journal_policy = JournalPolicy.from_config()
+        self.citations = parse_update_file(XML_PATH, False, False, {}, True, [])
+        _, self.journal_ids, _ = preprocess_data(self.citations)
+
+    def _voting_predictions(self, rng, group_thresh):
+        # Probabilities on and either side of every threshold, and random ones
+        thresholds = [COMBINED_THRESH, PRECISION_THRESH]
+        if group_thresh:
+            thresholds.extend(self.journal_policy.combined_thresholds(self.journal_ids))
+        edges = np.array([np.nextafter(t, direction) for t in thresholds for direction in [0, t, 1]])
+        return np.where(rng.random(len(self.citations)) < 0.5,
+                        rng.choice(edges, len(self.citations)), rng.random(len(self.citations)))
+
+    def test_same_labels(self):
+        rng = np.random.default_rng(0)
+        for group_thresh, pub_type_filter in itertools.product([False, True], [False, True]):
+            args = argparse.Namespace(group_thresh=group_thresh, pub_type_filter=pub_type_filter)
+            for _ in range(20):
+                voting_predictions = self._voting_predictions(rng, group_thresh)
+                # CNN predictions at the bounds, 0 and 1, as well as in between
+                cnn_predictions = rng.choice([0, 1, rng.random()], len(self.citations)).astype(np.float32)
+                needed = cnn_needed(voting_predictions, self.journal_ids, self.journal_policy, group_thresh)
+                cascade_predictions = np.where(needed, cnn_predictions, np.nan).astype(np.float32)
+
+                expected, _, _ = decide_predictions(self.citations, voting_predictions, cnn_predictions, self.journal_policy, args)
+                labels, prediction_dict, _ = decide_predictions(self.citations, voting_predictions, cascade_predictions, self.journal_policy, args)
+                np.testing.assert_array_equal(labels, expected)
+                np.testing.assert_array_equal(np.isnan(prediction_dict['predictions']), ~needed)
+
+    def test_run_cascade(self):
+        args = argparse.Namespace(group_thresh=False, tokenizer="regex", prep_workers=1)
+        num_citations = len(self.citations)
+        voting_predictions = np.linspace(0, 1, num_citations)
+        o_sci_model = _FixedModel(voting_predictions)
+        o_cnn_model = _FixedModel(np.ones(num_citations, dtype=np.float32))
+
+        voting, cnn = run_cascade(self.citations, o_sci_model, o_cnn_model, self.journal_policy, args)
+        needed = voting_predictions > min(COMBINED_THRESH, PRECISION_THRESH)
+        np.testing.assert_array_equal(voting, voting_predictions)
+        np.testing.assert_array_equal(np.isnan(cnn), ~needed)
+        self.assertEqual(o_cnn_model.num_processed, needed.sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
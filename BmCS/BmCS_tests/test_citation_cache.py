@@ -0,0 +1,87 @@
+"""
+Module to run pytest unittests for the parsed citation cache
+
+Citations loaded from the cache and then filtered must match
+the citations parsed and filtered directly from the XML.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..BmCS import check_args, get_args, parse_citations
+from ..citation_cache import CitationCache, cache_from_args, file_fingerprint, DEFAULT_CACHE_MAX_MB
+from ..daily_update_file_parser import iterparse_update_file, parse_update_file, filter_citations
+from ..journal_policy import JournalPolicy
+from .test_daily_update_file_parser import XML_PATH, _load_ids
+
+
+class test_citation_cache(unittest.TestCase):
+    """
+    Class to test CitationCache round trips, filtering and eviction
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_filter_cached_citations(self):
+        cache = CitationCache(self.cache_dir)
+        # Parse and store, then load from the cache
+        cache.load_or_parse(XML_PATH)
+        self.assertTrue(os.path.isfile(cache.entry_path(file_fingerprint(XML_PATH))))
+        cached_citations = cache.load_or_parse(XML_PATH)
+
+        selectively_indexed_ids, misindexed_ids = _load_ids()
+        for journal_drop, predict_medline, predict_all in itertools.product([False, True], repeat=3):
+            args = (journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids)
+            expected = parse_update_file(XML_PATH, *args).to_citations()
+            self.assertEqual(filter_citations(cached_citations, *args).to_citations(), expected)
+
+    def test_eviction(self):
+        cache = CitationCache(self.cache_dir)
+        citations = cache.load_or_parse(XML_PATH)
+        entry_size = os.path.getsize(cache.entry_path(file_fingerprint(XML_PATH)))
+
+        # Room for two entries. The least recently used one is removed when a third is added.
+        cache.max_bytes = 2 * entry_size
+        cache.put("a" * 64, citations)
+        os.utime(cache.entry_path(file_fingerprint(XML_PATH)), (0, 0))
+        cache.put("b" * 64, citations)
+
+        self.assertFalse(os.path.isfile(cache.entry_path(file_fingerprint(XML_PATH))))
+        self.assertTrue(os.path.isfile(cache.entry_path("a" * 64)))
+        self.assertTrue(os.path.isfile(cache.entry_path("b" * 64)))
+
+    def test_max_mb(self):
+        def cache_for(max_mb):
+            args = argparse.Namespace(cache_dir=self.cache_dir, no_cache=False, cache_max_mb=max_mb)
+            return cache_from_args(args)
+
+        self.assertEqual(cache_for(None).max_bytes, DEFAULT_CACHE_MAX_MB * 1024 * 1024)
+        self.assertEqual(cache_for(1.5).max_bytes, int(1.5 * 1024 * 1024))
+
+        parser = get_args()
+        check_args(parser, parser.parse_args(["weights", "ensemble", "--cache-max-mb", "0.5"]))
+        # Every entry would be evicted as soon as it is written
+        for max_mb in ["0", "-1"]:
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                check_args(parser, parser.parse_args(["weights", "ensemble", "--cache-max-mb", max_mb]))
+
+    def test_stream(self):
+        journal_policy = JournalPolicy.from_config()
+        args = get_args().parse_args(["weights", "ensemble", "--path", XML_PATH, "--stream", "--cache-dir", self.cache_dir, "--filter"])
+        expected = list(iterparse_update_file(XML_PATH, False, False, journal_policy.selectively_indexed_ids, False, journal_policy.misindexed_ids))
+        # A cache miss with --stream never builds the whole element tree
+        with mock.patch("xml.etree.ElementTree.parse", side_effect=AssertionError("the whole tree was parsed")):
+            citations = parse_citations(XML_PATH, args, journal_policy)
+        self.assertEqual(citations.to_citations(), expected)
+        self.assertTrue(os.path.isfile(CitationCache(self.cache_dir).entry_path(file_fingerprint(XML_PATH))))
@@ -0,0 +1,88 @@
+"""
+Module to run pytest unittests for the update file parser
+
+The streaming and tree based parsers are run on the curated test citations
+with every combination of filtering options, and must return the same citations.
+"""
+
+import bz2
+import gzip
+import itertools
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from .. import daily_update_file_parser
+from ..bmcs_exceptions import BmCS_Exception
+from ..daily_update_file_parser import ZSTD_MAGIC, open_update_file, parse_update_file, iterparse_update_file
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+XML_PATH = os.path.join(TEST_DIR, "datasets", "test_citations.xml")
+
+
+def _load_ids():
+    with open(os.path.join(TEST_DIR, "..", "config", "selectively_indexed_id_mapping.json"), "r") as f:
+        selectively_indexed_ids = json.load(f)
+    with open(os.path.join(TEST_DIR, "..", "config", "misindexed_journal_ids.json"), "r") as f:
+        misindexed_ids = json.load(f)['misindexed_ids']
+    return selectively_indexed_ids, misindexed_ids
+
+
+class test_daily_update_file_parser(unittest.TestCase):
+    """
+    Class to test the parsing modes of daily_update_file_parser
+    """
+
+    def test_iterparse_matches_parse(self):
+        selectively_indexed_ids, misindexed_ids = _load_ids()
+        for journal_drop, predict_medline, predict_all in itertools.product([False, True], repeat=3):
+            args = (journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids)
+            citations = parse_update_file(XML_PATH, *args)
+            streamed_citations = list(iterparse_update_file(XML_PATH, *args))
+            self.assertEqual(citations.to_citations(), streamed_citations)
+
+    def test_iterparse_no_citations(self):
+        # No journal is selectively indexed, so nothing is kept
+        with self.assertRaises(Exception):
+            list(iterparse_update_file(XML_PATH, False, False, {}, False, []))
+
+    def test_compressed_input(self):
+        selectively_indexed_ids, misindexed_ids = _load_ids()
+        args = (False, False, selectively_indexed_ids, True, misindexed_ids)
+        citations = parse_update_file(XML_PATH, *args).to_citations()
+        with open(XML_PATH, "rb") as f:
+            xml_bytes = f.read()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for suffix, compress in [(".xml.gz", gzip.compress), (".xml.bz2", bz2.compress)]:
+                compressed_path = os.path.join(tmp_dir, "test_citations" + suffix)
+                with open(compressed_path, "wb") as f:
+                    f.write(compress(xml_bytes))
+                self.assertEqual(parse_update_file(compressed_path, *args).to_citations(), citations)
+                self.assertEqual(list(iterparse_update_file(compressed_path, *args)), citations)
+
+    def test_zstandard_errors(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "test_citations.xml.zst")
+            with open(path, "wb") as f:
+                f.write(ZSTD_MAGIC + b"not a frame")
+
+            with mock.patch.object(daily_update_file_parser, "zstandard", None):
+                with self.assertRaises(BmCS_Exception):
+                    open_update_file(path)
+
+            # The file is closed if the decompressor can't be set up
+            raw_files = []
+            def stream_reader(raw, closefd):
+                raw_files.append(raw)
+                raise ValueError("no decompressor")
+            zstandard = mock.Mock()
+            zstandard.ZstdDecompressor.return_value.stream_reader.side_effect = stream_reader
+            with mock.patch.object(daily_update_file_parser, "zstandard", zstandard):
+                with self.assertRaises(BmCS_Exception):
+                    open_update_file(path)
+            self.assertEqual(len(raw_files), 1)
+            self.assertTrue(raw_files[0].closed)
+
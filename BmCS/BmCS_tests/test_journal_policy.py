@@ -0,0 +1,82 @@
+"""
+Module to run pytest unittests for the compiled journal policy
+
+Decisions made with the JournalPolicy must match the list scans
+over the raw json config that it replaces.
+"""
+
+import json
+import os
+import unittest
+
+import numpy as np
+
+from ..journal_policy import JournalPolicy, GROUP_DEFAULT, GROUP_SCIENCE, GROUP_JURISPRUDENCE
+from ..model_utils import adjust_thresholds
+from ..thresholds import *
+
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config")
+
+
+class test_journal_policy(unittest.TestCase):
+    """
+    Class to test JournalPolicy against the raw config files
+    """
+
+    def setUp(self):
+        with open(os.path.join(CONFIG_DIR, "selectively_indexed_id_mapping.json")) as f:
+            self.selectively_indexed_ids = json.load(f)
+        with open(os.path.join(CONFIG_DIR, "misindexed_journal_ids.json")) as f:
+            self.misindexed_ids = json.load(f)['misindexed_ids']
+        with open(os.path.join(CONFIG_DIR, "group_ids.json")) as f:
+            self.group_ids = json.load(f)
+        self.journal_policy = JournalPolicy.from_config()
+
+        # Every configured journal, plus one that is in no list
+        journal_ids = set(self.selectively_indexed_ids) | set(self.misindexed_ids) | {"0000000"}
+        for ids in self.group_ids.values():
+            journal_ids.update(ids)
+        self.journal_ids = sorted(journal_ids)
+
+    def test_membership(self):
+        for journal_id in self.journal_ids:
+            self.assertEqual(self.journal_policy.is_selectively_indexed(journal_id), journal_id in self.selectively_indexed_ids)
+            self.assertEqual(self.journal_policy.is_misindexed(journal_id), journal_id in self.misindexed_ids)
+        np.testing.assert_array_equal(
+                self.journal_policy.selectively_indexed_mask(self.journal_ids),
+                [journal_id in self.selectively_indexed_ids for journal_id in self.journal_ids])
+
+    def test_groups(self):
+        for journal_id, group_index in zip(self.journal_ids, self.journal_policy.group_indices(self.journal_ids)):
+            if journal_id in self.group_ids['science']:
+                self.assertEqual(group_index, GROUP_SCIENCE)
+            elif journal_id in self.group_ids['jurisprudence']:
+                self.assertEqual(group_index, GROUP_JURISPRUDENCE)
+            else:
+                self.assertEqual(group_index, GROUP_DEFAULT)
+
+    def test_coded_group_indices(self):
+        journal_codes = np.arange(len(self.journal_ids))[::-1].repeat(2)
+        np.testing.assert_array_equal(
+                self.journal_policy.coded_group_indices(journal_codes, self.journal_ids),
+                self.journal_policy.group_indices([self.journal_ids[code] for code in journal_codes]))
+
+    def test_adjust_thresholds(self):
+        # Predictions on and either side of every group threshold
+        thresholds = [COMBINED_THRESH, SCIENCE_THRESH, JURISPRUDENCE_THRESH]
+        predictions = np.array([t + d for t in thresholds for d in (-1e-6, 0, 1e-6)])
+        journal_ids = [journal_id for journal_id in self.journal_ids for _ in predictions]
+        prediction_dict = {'predictions': np.tile(predictions, len(self.journal_ids)), 'journal_ids': journal_ids}
+
+        expected = []
+        for y, journal_id in zip(prediction_dict['predictions'], journal_ids):
+            if journal_id in self.group_ids['science']:
+                expected.append(2 if y >= SCIENCE_THRESH else 0)
+            elif journal_id in self.group_ids['jurisprudence']:
+                expected.append(2 if y >= JURISPRUDENCE_THRESH else 0)
+            else:
+                expected.append(2 if y >= COMBINED_THRESH else 0)
+
+        self.assertEqual(adjust_thresholds(prediction_dict, self.journal_policy, True), expected)
+        self.assertEqual(adjust_thresholds(prediction_dict, self.group_ids, True), expected)
@@ -0,0 +1,54 @@
+"""
+Module to test that the command line starts without the heavy frameworks
+
+TensorFlow, scikit-learn, NLTK and pkg_resources are imported by the stages
+that use them. Importing the command line module, or running --help, must not load them.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+HEAVY_MODULES = ("tensorflow", "keras", "sklearn", "joblib", "nltk", "pkg_resources")
+
+
+class test_lazy_imports(unittest.TestCase):
+
+    def _loaded_heavy_modules(self, code):
+        code += "\nimport sys\nprint(' '.join(m for m in {0!r} if m in sys.modules), file=sys.stderr)".format(HEAVY_MODULES)
+        result = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.assertEqual(result.returncode, 0, result.stderr.decode())
+        return result.stderr.decode().split()
+
+    def test_import(self):
+        self.assertEqual(self._loaded_heavy_modules("import BmCS.BmCS"), [])
+
+    def test_help(self):
+        code = "\n".join([
+            "import sys",
+            "from BmCS.BmCS import get_args",
+            "try:",
+            "    get_args().parse_args(['--help'])",
+            "except SystemExit:",
+            "    pass"])
+        self.assertEqual(self._loaded_heavy_modules(code), [])
+
+    def test_resource_filename(self):
+        from ..resources import resource_filename
+        self.assertTrue(os.path.isfile(resource_filename("BmCS.journal_policy", "config/group_ids.json")))
+        self.assertTrue(os.path.isfile(resource_filename(__name__, "datasets/test_citations.xml")))
+        self.assertTrue(os.path.isfile(resource_filename(__name__, "../config/group_ids.json")))
+        # In a fresh process, where the named module is not imported yet
+        code = "\n".join([
+            "import os",
+            "from BmCS.resources import resource_filename",
+            "assert os.path.isfile(resource_filename('BmCS.journal_policy', 'config/group_ids.json'))"])
+        self.assertEqual(self._loaded_heavy_modules(code), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+Module to run pytest unittests for the vectorized decision kernel
+
+decide_labels must give the same labels as adjust_thresholds, filter_pub_type
+and adjust_in_scope_predictions applied in turn.
+"""
+
+import itertools
+import unittest
+
+import numpy as np
+
+from ..journal_policy import JournalPolicy, COMBINED_GROUP_THRESHOLDS
+from ..model_utils import adjust_thresholds, adjust_in_scope_predictions, decide_labels
+from ..thresholds import *
+
+
+class test_model_utils(unittest.TestCase):
+    """
+    Class to test decide_labels against the per-citation functions
+    """
+
+    def setUp(self):
+        self.journal_policy = JournalPolicy.from_config()
+        group_ids = self.journal_policy.group_ids
+        # Journals in each group, and in none
+        self.journal_ids = [sorted(group_ids['science'])[0], sorted(group_ids['jurisprudence'])[0], "0000000"]
+
+    def _expected(self, prediction_dict, group_thresh, review_mask):
+        labels = adjust_thresholds(prediction_dict, self.journal_policy, group_thresh)
+        # As filter_pub_type marks them
+        for i in np.flatnonzero(review_mask):
+            labels[i] = 3
+        return adjust_in_scope_predictions(labels, prediction_dict)
+
+    def test_decide_labels(self):
+        rng = np.random.default_rng(0)
+        # Predictions on and either side of every threshold, at the bounds, nan, and random
+        thresholds = np.concatenate([COMBINED_GROUP_THRESHOLDS, [PRECISION_THRESH]])
+        edges = np.concatenate([np.nextafter(thresholds, 0), thresholds, np.nextafter(thresholds, 1), [0, 1, np.nan]])
+        num_citations = 3000
+        predictions = np.where(rng.random(num_citations) < 0.5, rng.choice(edges, num_citations), rng.random(num_citations))
+        journal_ids = [self.journal_ids[i] for i in rng.integers(len(self.journal_ids), size=num_citations)]
+        prediction_dict = {'predictions': predictions, 'journal_ids': journal_ids}
+
+        for group_thresh, pub_type_filter in itertools.product([False, True], [False, True]):
+            review_mask = rng.random(num_citations) < 0.3 if pub_type_filter else np.zeros(num_citations, dtype=bool)
+            group_indices = self.journal_policy.group_indices(journal_ids) if group_thresh else None
+            labels = decide_labels(predictions, group_indices, review_mask if pub_type_filter else None)
+            self.assertEqual(labels.dtype, np.int8)
+            self.assertEqual(labels.tolist(), self._expected(prediction_dict, group_thresh, review_mask))
+
+    def test_empty(self):
+        self.assertEqual(decide_labels(np.array([]), np.array([], dtype=np.int8), np.array([], dtype=bool)).tolist(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
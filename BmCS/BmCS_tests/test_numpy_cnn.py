@@ -0,0 +1,217 @@
+"""
+Module to run pytest unittests for the NumPy CNN backend
+
+The NumPy forward pass must match Keras model.predict: on a small model with
+the same kinds of layers as the CNN, and on the validation set with the
+packaged CNN, if the weights and the dataset are available.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..bmcs_cnn_model import CnnModel
+from ..bmcs_exceptions import BmCS_Exception
+from ..numpy_cnn import NumpyCnn, embedding_lookup, quantize_int8, sequence_lengths
+from ..preprocess_CNN_data import PADDING_INDEX
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.path.join(TEST_DIR, "..", "models")
+VALIDATION_SET_PATH = os.path.join(TEST_DIR, "datasets", "validation_set.json.gz")
+
+TOLERANCE = 1e-5
+# Probabilities with the float16 and int8 embedding tables, on the small model
+REDUCED_PRECISION_TOLERANCE = {'float16': 1e-3, 'int8': 1e-2}
+
+
+def _keras():
+    """
+    Keras 2, which reads and writes the same JSON and HDF5 formats as the CNN files, or None
+    """
+
+    try:
+        import tf_keras as keras
+    except ImportError:
+        try:
+            from tensorflow import keras
+        except ImportError:
+            return None
+    return keras if keras.__version__.startswith("2.") else None
+
+
+def _padded_word_indices(rng, num_rows, max_words):
+    """
+    Word indices of random lengths, from empty to max_words, padded at the end
+    """
+
+    word_indices = rng.integers(1, 50, size=(num_rows, max_words)).astype(np.int32)
+    lengths = rng.integers(0, max_words + 1, size=num_rows)
+    word_indices[np.arange(max_words) >= lengths[:, np.newaxis]] = PADDING_INDEX
+    return word_indices
+
+
+def _layer(class_name, name, inbound_nodes, **config):
+    config['name'] = name
+    return {'class_name': class_name, 'name': name, 'config': config, 'inbound_nodes': inbound_nodes}
+
+
+class test_numpy_cnn(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_small_model(self):
+        """
+        Embedding, flatten and sigmoid dense layer, against the same computation written out
+        """
+
+        rng = np.random.default_rng(0)
+        embeddings = rng.normal(size=(10, 3)).astype(np.float32)
+        kernel = rng.normal(size=(12, 1)).astype(np.float32)
+        bias = np.array([0.1], dtype=np.float32)
+        model_config = {'class_name': 'Functional', 'config': {
+            'layers': [
+                _layer('InputLayer', 'ids', [], dtype='float32'),
+                _layer('Embedding', 'embedding', [[['ids', 0, 0, {}]]]),
+                _layer('Flatten', 'flatten', [[['embedding', 0, 0, {}]]]),
+                _layer('Dropout', 'dropout', [[['flatten', 0, 0, {}]]], rate=0.5),
+                _layer('Dense', 'dense', [[['dropout', 0, 0, {}]]], activation='sigmoid', use_bias=True),
+                ],
+            'input_layers': [['ids', 0, 0]],
+            'output_layers': [['dense', 0, 0]]}}
+        weights = {'embedding': {'embeddings': embeddings}, 'dense': {'kernel': kernel, 'bias': bias}}
+        model = NumpyCnn(model_config, weights)
+
+        ids = rng.integers(0, 10, size=(300, 4)).astype(np.int32)
+        expected = 1 / (1 + np.exp(-(embeddings[ids].reshape(300, 12) @ kernel + bias)))
+        np.testing.assert_allclose(model.predict({'ids': ids}, batch_size=128), expected, rtol=0, atol=TOLERANCE)
+
+        # No rows
+        self.assertEqual(model.predict({'ids': ids[:0]}).shape, (0, 1))
+
+    def test_sequence_lengths(self):
+        word_indices = np.array([[5, 3, 0, 0], [0, 0, 0, 0], [7, 0, 2, 0], [1, 2, 3, 4]], dtype=np.int32)
+        self.assertEqual(sequence_lengths(word_indices).tolist(), [2, 0, 3, 4])
+
+    def test_reduced_precision_embeddings(self):
+        rng = np.random.default_rng(2)
+        embeddings = rng.normal(size=(20, 6)).astype(np.float32)
+        embeddings[3] = 0
+        ids = rng.integers(0, 20, size=(5, 7)).astype(np.int32)
+
+        table, scales = quantize_int8(embeddings)
+        self.assertEqual(table.dtype, np.int8)
+        self.assertEqual(np.abs(table).max(axis=1).tolist()[:3], [127] * 3)
+        self.assertTrue(np.all(np.abs(table * scales[:, np.newaxis] - embeddings) <= scales[:, np.newaxis] / 2 + 1e-6))
+
+        for precision, atol in [('float32', 0), ('float16', 1e-2), ('int8', scales.max() / 2 + 1e-6)]:
+            embedded = embedding_lookup(embeddings, precision)(ids)
+            self.assertEqual(embedded.dtype, np.float32)
+            np.testing.assert_allclose(embedded, embeddings[ids], rtol=0, atol=atol)
+        # The padding tail of length buckets is a single index
+        self.assertEqual(embedding_lookup(embeddings, 'int8')(np.array(PADDING_INDEX)).shape, (6,))
+
+        with self.assertRaises(BmCS_Exception):
+            NumpyCnn({'class_name': 'Functional', 'config': {'layers': [], 'input_layers': [], 'output_layers': []}}, {}, precision='int4')
+
+    def test_unsupported_layer(self):
+        model_config = {'class_name': 'Functional', 'config': {
+            'layers': [
+                _layer('InputLayer', 'x', []),
+                _layer('LSTM', 'lstm', [[['x', 0, 0, {}]]]),
+                ],
+            'input_layers': [['x', 0, 0]],
+            'output_layers': [['lstm', 0, 0]]}}
+        with self.assertRaises(BmCS_Exception):
+            NumpyCnn(model_config, {})
+
+    def test_matches_keras(self):
+        """
+        Shared embedding and convolutions, batch normalization, pooling and dense layers, saved and loaded as files
+        """
+
+        keras = _keras()
+        if keras is None:
+            self.skipTest("Keras 2 is not installed")
+        layers = keras.layers
+
+        title_input = layers.Input(shape=(12,), name='title_input')
+        abstract_input = layers.Input(shape=(30,), name='abstract_input')
+        year_input = layers.Input(shape=(4,), name='year_input')
+        embedding = layers.Embedding(50, 8)
+        convolutions = [layers.Conv1D(6, width, use_bias=False) for width in (2, 5)]
+        features = []
+        for text, pool_sizes in [(title_input, (11, 8)), (abstract_input, (7, 6))]:
+            embedded = embedding(text)
+            for convolution, pool_size in zip(convolutions, pool_sizes):
+                x = layers.Activation('relu')(layers.BatchNormalization()(convolution(embedded)))
+                # The second abstract pooling has a stride different from its size
+                strides = 4 if pool_size == 6 else None
+                features.append(layers.Flatten()(layers.MaxPooling1D(pool_size, strides=strides)(x)))
+        x = layers.Concatenate()(features + [layers.Dropout(0.)(year_input)])
+        x = layers.Activation('relu')(layers.BatchNormalization()(layers.Dense(16, use_bias=False)(x)))
+        output = layers.Dense(1, activation='sigmoid')(layers.Dropout(0.5)(x))
+        keras_model = keras.Model(inputs=[title_input, abstract_input, year_input], outputs=output)
+
+        # Moving statistics away from their initial values
+        rng = np.random.default_rng(1)
+        for layer in keras_model.layers:
+            if isinstance(layer, layers.BatchNormalization):
+                layer.set_weights([rng.uniform(0.5, 1.5, size=w.shape).astype(np.float32) for w in layer.get_weights()])
+
+        weights_path = os.path.join(self.tmp_dir, "weights.hdf5")
+        keras_model.save_weights(weights_path)
+
+        dX = {
+            'title_input': _padded_word_indices(rng, 70, 12),
+            'abstract_input': _padded_word_indices(rng, 70, 30),
+            'year_input': rng.integers(0, 2, size=(70, 4)).astype(np.float32),
+            }
+        expected = keras_model.predict(dX, verbose=0)
+        model = NumpyCnn.from_files(keras_model.to_json(), weights_path)
+        for length_buckets in [False, True]:
+            predictions = model.predict(dX, batch_size=32, length_buckets=length_buckets)
+            np.testing.assert_allclose(predictions, expected, rtol=0, atol=TOLERANCE)
+
+        for precision, atol in REDUCED_PRECISION_TOLERANCE.items():
+            model = NumpyCnn.from_files(keras_model.to_json(), weights_path, length_buckets=True, precision=precision)
+            np.testing.assert_allclose(model.predict(dX, batch_size=32), expected, rtol=0, atol=atol)
+
+    def test_validation_set(self):
+        """
+        Packaged CNN on the validation set, with and without length buckets, against the TensorFlow backend
+        """
+
+        weights_path = os.path.join(MODELS_DIR, "model_CNN_weights.hdf5")
+        word_indices_path = os.path.join(MODELS_DIR, "word_indices.txt")
+        for path in [weights_path, word_indices_path, VALIDATION_SET_PATH]:
+            if not os.path.isfile(path):
+                self.skipTest("{} is not available".format(os.path.basename(path)))
+
+        from ..preprocess_CNN_data import get_batch_data
+        with gzip.open(VALIDATION_SET_PATH, "rt", encoding="utf8") as f:
+            citations = json.load(f)
+        dX = get_batch_data(citations, os.path.join(MODELS_DIR, "journal_ids.txt"), word_indices_path)
+
+        model_path = os.path.join(MODELS_DIR, "model_CNN.json")
+        predictions = {}
+        for backend, length_buckets in [("numpy", False), ("numpy", True), ("tensorflow", False)]:
+            model = CnnModel()
+            model.from_file(model_path, weights_path, backend=backend, length_buckets=length_buckets)
+            predictions[(backend, length_buckets)] = model.process(dX)
+
+        for length_buckets in [False, True]:
+            np.testing.assert_allclose(predictions[("numpy", length_buckets)], predictions[("tensorflow", False)], rtol=0, atol=TOLERANCE)
+
+
+if __name__ == '__main__':
+    unittest.main()
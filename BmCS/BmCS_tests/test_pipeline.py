@@ -0,0 +1,106 @@
+"""
+Module to run pytest unittests for the pipelined micro-batch mode
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+
+from ..BmCS import check_args, decide_predictions, get_args
+from ..citation_batch import CitationBatch
+from ..daily_update_file_parser import parse_update_file
+from ..journal_policy import JournalPolicy
+from ..pipeline import micro_batches, threaded
+from .test_daily_update_file_parser import XML_PATH
+
+
+class test_pipeline(unittest.TestCase):
+    """
+    Class to test threaded stages and micro-batch parsing
+    """
+
+    def test_threaded(self):
+        stages = threaded(threaded(range(100), 2, lambda x: x * 2), 3, lambda x: x + 1)
+        self.assertEqual(list(stages), [x * 2 + 1 for x in range(100)])
+
+    def test_error(self):
+        def fail(x):
+            if x == 5:
+                raise ValueError("stage failed")
+            return x
+
+        with self.assertRaisesRegex(ValueError, "stage failed"):
+            list(threaded(threaded(range(10), 1, fail), 1))
+
+    def test_close(self):
+        produced = []
+        done = threading.Event()
+
+        def endless():
+            try:
+                for i in itertools.count():
+                    produced.append(i)
+                    yield i
+            finally:
+                done.set()
+
+        stages = threaded(threaded(endless(), 2), 2)
+        self.assertEqual(next(stages), 0)
+        stages.close()
+        # Closing the last stage stops every thread, back to the source
+        self.assertTrue(done.wait(5))
+        num_produced = len(produced)
+        time.sleep(0.3)
+        self.assertEqual(len(produced), num_produced)
+        # Bounded by the queues, rather than running ahead through the source
+        self.assertLess(num_produced, 10)
+
+    def test_micro_batches(self):
+        journal_policy = JournalPolicy.from_config()
+        cache_dir = tempfile.mkdtemp()
+        try:
+            for journal_drop, cache in itertools.product([False, True], [None, cache_dir]):
+                args = argparse.Namespace(
+                    journal_drop=journal_drop, predict_medline=False, predict_all=False,
+                    stream=False, cache_dir=cache, no_cache=False, cache_max_mb=100, pipeline_batch_size=2)
+                batches = list(micro_batches(XML_PATH, args, journal_policy))
+                self.assertEqual([len(batch) for batch in batches[:-1]], [2] * (len(batches) - 1))
+                expected = parse_update_file(XML_PATH, journal_drop, False, journal_policy.selectively_indexed_ids, False, journal_policy.misindexed_ids)
+                self.assertEqual(CitationBatch.concatenate(batches).to_citations(), expected.to_citations())
+        finally:
+            shutil.rmtree(cache_dir)
+
+    def test_refused_options(self):
+        parser = get_args()
+        check_args(parser, parser.parse_args(["weights", "ensemble", "--path", XML_PATH, "--pipeline"]))
+        # Worker pools would be forked from the stage threads
+        for options in [["--prep-workers", "2"], ["--ensemble-workers", "2"], ["--concurrent"], ["--cascade"]]:
+            args = parser.parse_args(["weights", "ensemble", "--path", XML_PATH, "--pipeline"] + options)
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                check_args(parser, args)
+
+    def test_decide_quietly(self):
+        # run_pipeline prints the progress messages once, rather than for every micro-batch
+        journal_policy = JournalPolicy.from_config()
+        citations = parse_update_file(XML_PATH, False, False, [], True, [])
+        predictions = np.linspace(0, 1, len(citations))
+        args = argparse.Namespace(group_thresh=True, pub_type_filter=True)
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            expected, _, _ = decide_predictions(citations, predictions, predictions, journal_policy, args)
+        self.assertIn("Combining predictions", output.getvalue())
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            labels, _, _ = decide_predictions(citations, predictions, predictions, journal_policy, args, verbose=False)
+        self.assertEqual(output.getvalue(), "")
+        np.testing.assert_array_equal(labels, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
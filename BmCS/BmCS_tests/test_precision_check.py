@@ -0,0 +1,101 @@
+"""
+Module to run pytest unittests for the reduced-precision CNN accuracy check
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ..bmcs_exceptions import BmCS_Exception
+from ..precision_check import RECORD_NAME, compare_metrics, default_record_path, record_check, require_checked_precision
+
+
+REFERENCE_METRICS = {"BmCS recall": 0.83, "BmCS precision": 0.92, "CNN recall": 0.80, "CNN precision": 0.90}
+
+
+class test_precision_check(unittest.TestCase):
+    """
+    Class to test the comparison of metrics, and the record of passed checks
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.args = argparse.Namespace(
+            CNN_path=os.path.join(self.temp_dir, "model_CNN_weights.hdf5"),
+            ensemble_path=os.path.join(self.temp_dir, "ensemble.joblib"),
+            cnn_precision="int8",
+            tolerance=1e-3,
+            group_thresh=False,
+            journal_drop=False,
+            precision_record=os.path.join(self.temp_dir, "checks.json"),
+            destination=os.path.join(self.temp_dir, "dest"))
+        os.makedirs(self.args.destination)
+        for path in [self.args.CNN_path, self.args.ensemble_path]:
+            with open(path, "wb") as f:
+                f.write(b"model")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_compare_metrics(self):
+        metrics = dict(REFERENCE_METRICS, **{"CNN recall": 0.8005})
+        self.assertAlmostEqual(compare_metrics(metrics, REFERENCE_METRICS, "int8", 1e-3), 0.0005)
+        metrics["CNN precision"] = 0.89
+        with self.assertRaises(BmCS_Exception) as context:
+            compare_metrics(metrics, REFERENCE_METRICS, "int8", 1e-3)
+        self.assertIn("CNN precision", str(context.exception))
+        self.assertNotIn("CNN recall", str(context.exception))
+
+    def test_require_checked_precision(self):
+        # float32 needs no check
+        require_checked_precision(argparse.Namespace(**dict(vars(self.args), cnn_precision="float32")))
+
+        with self.assertRaises(BmCS_Exception):
+            require_checked_precision(self.args)
+
+        metrics = dict(REFERENCE_METRICS, **{"BmCS recall": 0.8305})
+        self.assertEqual(record_check(self.args, "validation", metrics, REFERENCE_METRICS), self.args.precision_record)
+        self.assertTrue(os.path.isfile(self.args.precision_record))
+        require_checked_precision(self.args)
+
+        # A tighter tolerance than the recorded change
+        with self.assertRaises(BmCS_Exception):
+            require_checked_precision(argparse.Namespace(**dict(vars(self.args), tolerance=1e-4)))
+
+        # Other options, precision or model files are not covered by the record
+        for name, value in [("group_thresh", True), ("cnn_precision", "float16")]:
+            with self.assertRaises(BmCS_Exception):
+                require_checked_precision(argparse.Namespace(**dict(vars(self.args), **{name: value})))
+        with open(self.args.CNN_path, "wb") as f:
+            f.write(b"retrained model")
+        with self.assertRaises(BmCS_Exception):
+            require_checked_precision(self.args)
+
+    def test_record_location(self):
+        # Not next to the weights, which may be on a read-only share
+        args = argparse.Namespace(**dict(vars(self.args), precision_record=None))
+        cache_home = os.path.join(self.temp_dir, "cache")
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": cache_home}):
+            self.assertEqual(default_record_path(), os.path.join(cache_home, "BmCS", RECORD_NAME))
+            self.assertEqual(record_check(args, "validation", REFERENCE_METRICS, REFERENCE_METRICS), default_record_path())
+            require_checked_precision(args)
+        self.assertFalse(any(name.endswith(".json") for name in os.listdir(self.temp_dir)))
+
+        # A cache directory that can't be created, under a file: recorded in --dest instead
+        not_a_directory = os.path.join(self.temp_dir, "model_CNN_weights.hdf5")
+        with mock.patch.dict(os.environ, {"XDG_CACHE_HOME": not_a_directory}):
+            path = record_check(args, "validation", REFERENCE_METRICS, REFERENCE_METRICS)
+            self.assertEqual(path, os.path.join(args.destination, RECORD_NAME))
+            require_checked_precision(args)
+
+            # Nowhere to write
+            unwritable = argparse.Namespace(**dict(vars(args), destination=not_a_directory))
+            with self.assertRaises(BmCS_Exception):
+                record_check(unwritable, "validation", REFERENCE_METRICS, REFERENCE_METRICS)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,92 @@
+"""
+Module to run pytest unittests for the prediction cache
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from ..daily_update_file_parser import parse_update_file
+from ..prediction_cache import PredictionCache, citation_keys
+from .test_daily_update_file_parser import XML_PATH
+
+
+class test_prediction_cache(unittest.TestCase):
+    """
+    Class to test PredictionCache keys, round trips, statistics and eviction
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "predictions.sqlite")
+        self.citations = parse_update_file(XML_PATH, False, False, [], True, [])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_keys(self):
+        keys = citation_keys(self.citations, "models")
+        self.assertEqual(keys, citation_keys(self.citations.to_citations(), "models"))
+        self.assertEqual(len(set(keys)), len(keys))
+        # Other models, or changed model inputs, give other keys
+        self.assertTrue(set(keys).isdisjoint(citation_keys(self.citations, "other models")))
+        citation = self.citations[0]
+        citation['abstract'] += " "
+        self.assertNotEqual(citation_keys([citation], "models")[0], keys[0])
+
+    def test_lookup_and_store(self):
+        keys = citation_keys(self.citations, "models")
+        voting_predictions = np.linspace(0.1, 0.9, len(keys))
+        cnn_predictions = np.linspace(0.9, 0.1, len(keys)).astype(np.float32)
+
+        cache = PredictionCache(self.path)
+        cache.store(keys[1:], voting_predictions[1:], cnn_predictions[1:])
+        cached_voting, cached_cnn, missing = cache.lookup(keys)
+        np.testing.assert_array_equal(missing, [0])
+        self.assertEqual(cached_cnn.dtype, np.float32)
+        np.testing.assert_array_equal(cached_voting[1:], voting_predictions[1:])
+        np.testing.assert_array_equal(cached_cnn[1:], cnn_predictions[1:])
+        self.assertTrue(np.isnan(cached_voting[0]) and np.isnan(cached_cnn[0]))
+        self.assertEqual((cache.hits, cache.misses), (len(keys) - 1, 1))
+        cache.close()
+
+        # Persisted between runs
+        cache = PredictionCache(self.path)
+        self.assertEqual(len(cache), len(keys) - 1)
+        cache.close()
+
+    def test_eviction(self):
+        keys = citation_keys(self.citations, "models")
+        predictions = np.full(len(keys), 0.5)
+
+        cache = PredictionCache(self.path, max_entries=len(keys))
+        cache.store(keys, predictions, predictions)
+        # Make the first key the least recently used
+        cache._connection.execute("UPDATE predictions SET last_used = ? WHERE key = ?", (int(time.time()) - 60, keys[0]))
+        cache.store([b"new key"], [0.5], [0.5])
+        # Not on every store, as counting the entries scans the table, but when the cache is closed
+        self.assertEqual(len(cache), len(keys) + 1)
+        cache.close()
+        cache = PredictionCache(self.path, max_entries=len(keys))
+        self.assertEqual(len(cache), len(keys))
+        _, _, missing = cache.lookup(keys)
+        np.testing.assert_array_equal(missing, [0])
+
+        # Entries not used within max_age_days are removed
+        cache.max_age_days = 1
+        cache._connection.execute("UPDATE predictions SET last_used = ? WHERE key = ?", (int(time.time()) - 2 * 24 * 60 * 60, keys[1]))
+        cache.evict()
+        _, _, missing = cache.lookup(keys)
+        np.testing.assert_array_equal(missing, [0, 1])
+
+        # And once evict_interval_rows rows have been stored
+        cache.evict_interval_rows = 3
+        cache.store([b"newer key", b"newest key"], [0.5, 0.5], [0.5, 0.5])
+        self.assertEqual(len(cache), len(keys) + 1)
+        cache.store([b"last key"], [0.5], [0.5])
+        self.assertEqual(len(cache), len(keys))
+        cache.close()
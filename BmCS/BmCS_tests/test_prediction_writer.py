@@ -0,0 +1,173 @@
+"""
+Module to run pytest unittests for the prediction writer
+
+The text format must stay byte for byte the same as the line at a time
+str.format it replaces, and every format must hold the same predictions.
+"""
+
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..batch_runner import output_file_name
+from ..BmCS import format_predictions, save_predictions
+from ..bmcs_exceptions import BmCS_Exception
+from ..prediction_writer import (
+        PredictionWriter, format_prediction_text, predictions_file_name, write_predictions,
+        OUTPUT_FORMATS, WRITE_CHUNK_ROWS)
+
+
+def _format_lines(adjusted_predictions, prediction_dict, pmids):
+    """
+    Text format, one line at a time as it was written before
+    """
+
+    return "".join("{0}|{1}|{2}|{3}\n".format(pmids[i], prediction, prediction_dict['predictions'][i], prediction_dict['journal_ids'][i])
+                   for i, prediction in enumerate(adjusted_predictions))
+
+
+def _predictions(num_citations, seed=0):
+    rng = np.random.default_rng(seed)
+    # Probabilities from tiny to 1, with nan as written for citations that skipped the CNN
+    probabilities = rng.random(num_citations) ** rng.integers(1, 40, num_citations)
+    probabilities[::50] = np.nan
+    probabilities[1::50] = 0
+    probabilities[2::50] = 1
+    labels = rng.integers(0, 4, num_citations).astype(np.int8)
+    pmids = rng.integers(1, 40000000, num_citations)
+    journal_ids = ["{0:07d}".format(journal_id) for journal_id in rng.integers(0, 10000000, num_citations)]
+    return labels, {'predictions': probabilities, 'journal_ids': journal_ids}, pmids
+
+
+class test_prediction_writer(unittest.TestCase):
+    """
+    Class to test the output formats and atomic writes
+    """
+
+    def setUp(self):
+        self.destination = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.destination)
+
+    def test_text(self):
+        labels, prediction_dict, pmids = _predictions(1000)
+        expected = _format_lines(labels, prediction_dict, pmids)
+        self.assertEqual(format_prediction_text(labels, prediction_dict, pmids), expected)
+        self.assertEqual("".join(format_predictions(labels, prediction_dict, pmids)), expected)
+        self.assertEqual(format_prediction_text([], {'predictions': [], 'journal_ids': []}, []), "")
+
+        # Labels as lists, and float32 probabilities, which print with their own shortest digits
+        float32_dict = {'predictions': prediction_dict['predictions'].astype(np.float32), 'journal_ids': prediction_dict['journal_ids']}
+        self.assertEqual(format_prediction_text(labels.tolist(), float32_dict, pmids), _format_lines(labels.tolist(), float32_dict, pmids))
+
+    def test_save_predictions(self):
+        # More than one chunk of rows
+        labels, prediction_dict, pmids = _predictions(WRITE_CHUNK_ROWS + 100)
+        save_predictions(labels, prediction_dict, pmids, self.destination + "/", file_name="predictions.txt")
+        save_predictions(labels[:10], prediction_dict, pmids[:10], self.destination + "/", file_name="predictions.txt", mode="a")
+        with open(os.path.join(self.destination, "predictions.txt")) as f:
+            self.assertEqual(f.read(), _format_lines(labels, prediction_dict, pmids) + _format_lines(labels[:10], prediction_dict, pmids[:10]))
+        with self.assertRaises(BmCS_Exception):
+            save_predictions(labels, prediction_dict, pmids, self.destination + "/", file_name="predictions.npz", mode="a", output_format="npz")
+
+    def test_formats(self):
+        labels, prediction_dict, pmids = _predictions(1000)
+        text = _format_lines(labels, prediction_dict, pmids)
+        for output_format in OUTPUT_FORMATS:
+            if output_format == 'parquet':
+                continue
+            path = os.path.join(self.destination, predictions_file_name("pubmed24n0001.xml.gz", output_format))
+            # Written in two batches
+            with PredictionWriter(path, output_format) as writer:
+                writer.write(labels[:300], {key: column[:300] for key, column in prediction_dict.items()}, pmids[:300])
+                writer.write(labels[300:], {key: column[300:] for key, column in prediction_dict.items()}, pmids[300:])
+            self._check_file(path, output_format, labels, prediction_dict, pmids, text)
+
+        self.assertEqual(sorted(os.listdir(self.destination)), sorted(
+                "citation_predictions_pubmed24n0001" + suffix for suffix in [".txt", ".txt.gz", ".jsonl", ".npz"]))
+
+    def test_parquet(self):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            with self.assertRaises(BmCS_Exception):
+                PredictionWriter(os.path.join(self.destination, "predictions.parquet"), "parquet")
+            self.skipTest("pyarrow is not installed")
+
+        labels, prediction_dict, pmids = _predictions(1000)
+        path = os.path.join(self.destination, "predictions.parquet")
+        write_predictions(labels, prediction_dict, pmids, path, "parquet")
+        table = pyarrow.parquet.read_table(path).to_pydict()
+        self.assertEqual(table['pmid'], pmids.tolist())
+        self.assertEqual(table['label'], labels.tolist())
+        np.testing.assert_array_equal(np.array(table['probability'], dtype=np.float64), prediction_dict['predictions'])
+        self.assertEqual(table['journal_id'], prediction_dict['journal_ids'])
+
+    def _check_file(self, path, output_format, labels, prediction_dict, pmids, text):
+        if output_format == 'text':
+            with open(path) as f:
+                self.assertEqual(f.read(), text)
+        elif output_format == 'text.gz':
+            with gzip.open(path, 'rt') as f:
+                self.assertEqual(f.read(), text)
+        elif output_format == 'jsonl':
+            with open(path) as f:
+                rows = [json.loads(line) for line in f]
+            self.assertEqual([row['pmid'] for row in rows], pmids.tolist())
+            self.assertEqual([row['label'] for row in rows], labels.tolist())
+            probabilities = np.array([np.nan if row['probability'] is None else row['probability'] for row in rows])
+            np.testing.assert_array_equal(probabilities, prediction_dict['predictions'])
+            self.assertEqual([row['journal_id'] for row in rows], prediction_dict['journal_ids'])
+        elif output_format == 'npz':
+            with np.load(path) as columns:
+                np.testing.assert_array_equal(columns['pmid'], pmids)
+                np.testing.assert_array_equal(columns['label'], labels)
+                np.testing.assert_array_equal(columns['probability'], prediction_dict['predictions'])
+                self.assertEqual(columns['journal_id'].tolist(), prediction_dict['journal_ids'])
+
+    def test_atomic(self):
+        labels, prediction_dict, pmids = _predictions(100)
+        path = os.path.join(self.destination, "predictions.txt")
+        with open(path, "w") as f:
+            f.write("previous\n")
+
+        # The previous file stays until the writer is closed, and is kept if writing fails
+        with self.assertRaises(ValueError):
+            with PredictionWriter(path) as writer:
+                writer.write(labels, prediction_dict, pmids)
+                with open(path) as f:
+                    self.assertEqual(f.read(), "previous\n")
+                raise ValueError("scoring failed")
+        with open(path) as f:
+            self.assertEqual(f.read(), "previous\n")
+        self.assertEqual(os.listdir(self.destination), ["predictions.txt"])
+
+        write_predictions(labels, prediction_dict, pmids, path)
+        with open(path) as f:
+            self.assertEqual(f.read(), _format_lines(labels, prediction_dict, pmids))
+        self.assertEqual(os.listdir(self.destination), ["predictions.txt"])
+
+    def test_deterministic(self):
+        labels, prediction_dict, pmids = _predictions(100)
+        contents = []
+        for name in ["a.txt.gz", "b.txt.gz"]:
+            write_predictions(labels, prediction_dict, pmids, os.path.join(self.destination, name), "text.gz")
+            with open(os.path.join(self.destination, name), "rb") as f:
+                contents.append(f.read())
+        self.assertEqual(contents[0], contents[1])
+
+    def test_file_names(self):
+        self.assertEqual(predictions_file_name("/data/pubmed24n0001.xml.gz", "jsonl"), "citation_predictions_pubmed24n0001.jsonl")
+        self.assertEqual(predictions_file_name("updates/pubmed24n0002.xml"), "citation_predictions_pubmed24n0002.txt")
+        self.assertEqual(output_file_name("pubmed24n0001.xml.gz"), "citation_predictions_pubmed24n0001.txt")
+        self.assertRegex(predictions_file_name(None, "npz"), r"^citation_predictions_\d{4}-\d{2}-\d{2}\.npz$")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Module to run pytest unittests for the CNN text vectorizer
+
+The preallocated vectorizer, which stops tokenizing at max_words, must give
+the same matrices as tokenizing every text in full, looking up every word
+and padding or truncating the index lists at the end.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..citation_batch import CitationBatch
+from ..daily_update_file_parser import parse_update_file
+from ..preprocess_CNN_data import get_batch_data, _vectorize_batch_text, TITLE_MAX_WORDS, ABSTRACT_MAX_WORDS, UNKNOWN_WORD_INDEX, PADDING_INDEX, PARALLEL_CHUNK_SIZE
+from ..word_tokenizer import get_tokenizer, TOKENIZERS
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+XML_PATH = os.path.join(TEST_DIR, "datasets", "test_citations.xml")
+JOURNAL_IDS_PATH = os.path.join(TEST_DIR, "..", "models", "journal_ids.txt")
+
+
+def _reference_vectorize(word_index_lookup, batch_text, max_words, word_tokenize):
+    """
+    Full tokenization, then post padding and post truncation of the index lists
+    """
+
+    vectorized_text = np.full((len(batch_text), max_words), PADDING_INDEX, dtype=np.int32)
+    for i, text in enumerate(batch_text):
+        word_indices = [word_index_lookup[word] if word in word_index_lookup else UNKNOWN_WORD_INDEX for word in word_tokenize(text)]
+        word_indices = word_indices[:max_words]
+        vectorized_text[i, :len(word_indices)] = word_indices
+    return vectorized_text
+
+
+class test_preprocess_CNN_data(unittest.TestCase):
+    """
+    Class to test _vectorize_batch_text against full tokenization and padding,
+    and parallel get_batch_data against serial
+    """
+
+    def setUp(self):
+        citations = parse_update_file(XML_PATH, False, False, [], True, [])
+        self.citations = citations
+        self.titles = [title.lower() for title in citations.titles] + ["", " . "]
+        self.abstracts = [abstract.lower() for abstract in citations.abstracts] + ["", " . "]
+
+        # Index every other distinct word, so that both known and unknown words occur
+        words = sorted({word for text in self.titles + self.abstracts for word in get_tokenizer('nltk')(text)})
+        self.word_index_lookup = {word: i + 2 for i, word in enumerate(words[::2])}
+
+    def test_vectorize_batch_text(self):
+        for tokenizer in TOKENIZERS:
+            word_tokenize = get_tokenizer(tokenizer)
+            # Short lengths truncate most texts, part way through a sentence
+            for texts, max_words in ((self.titles, TITLE_MAX_WORDS), (self.abstracts, ABSTRACT_MAX_WORDS), (self.abstracts, 1), (self.abstracts, 37)):
+                actual = _vectorize_batch_text(self.word_index_lookup, texts, max_words, word_tokenize)
+                expected = _reference_vectorize(self.word_index_lookup, texts, max_words, word_tokenize)
+                self.assertEqual(actual.dtype, np.int32)
+                np.testing.assert_array_equal(actual, expected)
+
+    def test_empty_batch(self):
+        vectorized_text = _vectorize_batch_text(self.word_index_lookup, [], TITLE_MAX_WORDS, get_tokenizer())
+        self.assertEqual(vectorized_text.shape, (0, TITLE_MAX_WORDS))
+        self.assertEqual(vectorized_text.dtype, np.int32)
+
+    def test_parallel_get_batch_data(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            word_indices_path = os.path.join(temp_dir, "word_indices.txt")
+            with open(word_indices_path, "wt", encoding="utf8") as f:
+                for word, index in self.word_index_lookup.items():
+                    f.write("{}\t{}\n".format(index, word))
+
+            # Enough citations for several chunks, with a partial last chunk
+            num_copies = (3 * PARALLEL_CHUNK_SIZE) // len(self.citations) + 1
+            citations = CitationBatch.concatenate([self.citations] * num_copies)
+
+            serial = get_batch_data(citations, JOURNAL_IDS_PATH, word_indices_path)
+            parallel = get_batch_data(citations, JOURNAL_IDS_PATH, word_indices_path, workers=3)
+            self.assertEqual(sorted(parallel), sorted(serial))
+            for name in serial:
+                self.assertEqual(parallel[name].dtype, serial[name].dtype)
+                np.testing.assert_array_equal(parallel[name], serial[name])
+        finally:
+            shutil.rmtree(temp_dir)
@@ -0,0 +1,111 @@
+"""
+Module to run pytest unittests for the compiled publication type rules
+
+Decisions made with PublicationTypeRules must match the substring scans
+over every title string and publication type that they replace.
+"""
+
+import itertools
+import json
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from ..daily_update_file_parser import parse_update_file
+from ..model_utils import filter_pub_type
+from ..publication_types import PublicationTypeRules, default_rules, pub_strings, pub_types
+from .test_daily_update_file_parser import XML_PATH
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "config", "publication_types.json")
+
+
+def _scan_filter_pub_type(citations, predictions, pub_strings, pub_types):
+    """
+    filter_pub_type as it was before the rules were compiled
+    """
+
+    for i, (title, pub_type_list) in enumerate(zip(citations.titles, citations.pub_types)):
+        title = title.lower()
+        if any(pub_string in title for pub_string in pub_strings):
+            predictions[i] = 3
+        elif any(pub_type in pub_type_list for pub_type in pub_types):
+            predictions[i] = 3
+
+    return predictions
+
+
+class test_publication_types(unittest.TestCase):
+    """
+    Class to test PublicationTypeRules against the substring scans
+    """
+
+    def setUp(self):
+        with open(CONFIG_PATH) as f:
+            config = json.load(f)
+        self.pub_strings = config['title_strings']
+        self.pub_types = config['publication_types']
+        self.rules = PublicationTypeRules.from_config()
+
+    def test_titles(self):
+        # Each string alone, in upper case, inside other words, at either end, and cut short
+        titles = ["", "A study of mice", "Erratum", "Sirs: in REPLY to comment", "Commentary on retractions",
+                  "corrigen", "the retracte", "Department of Errors", "errat", "Publishers' note"]
+        for pub_string in self.pub_strings:
+            titles.extend([pub_string, pub_string.upper(), "x{0}x".format(pub_string), pub_string[:-1], pub_string[1:]])
+        for title in titles:
+            self.assertEqual(self.rules.title_matches(title), any(pub_string in title.lower() for pub_string in self.pub_strings), title)
+        np.testing.assert_array_equal(
+                self.rules.title_mask(titles),
+                [any(pub_string in title.lower() for pub_string in self.pub_strings) for title in titles])
+
+    def test_pub_types(self):
+        pub_type_lists = [[], ["Journal Article"], ["Journal Article", "Comment"], ["Case Reports"], ["comment"]]
+        pub_type_lists.extend([pub_type] for pub_type in self.pub_types)
+        np.testing.assert_array_equal(
+                self.rules.pub_type_mask(pub_type_lists),
+                [any(pub_type in pub_type_list for pub_type in self.pub_types) for pub_type_list in pub_type_lists])
+
+    def test_filter_pub_type(self):
+        citations = parse_update_file(XML_PATH, False, False, {}, True, [])
+        # Give the test citations every combination of a matching title and publication type
+        for i, (title, pub_type) in enumerate(itertools.islice(itertools.product(["", "Retraction note: "], [[], ["Comment"]]), len(citations))):
+            citations.titles[i] = title + citations.titles[i]
+            citations.pub_types[i] = citations.pub_types[i] + pub_type
+
+        predictions = [i % 3 for i in range(len(citations))]
+        expected = _scan_filter_pub_type(citations, list(predictions), self.pub_strings, self.pub_types)
+        self.assertEqual(filter_pub_type(citations, list(predictions)), expected)
+        self.assertEqual(filter_pub_type(citations.to_citations(), list(predictions), self.rules), expected)
+
+    def test_from_file(self):
+        # Rules are extended in the config file, without code changes
+        pub_strings = ["letter to the editor", "Expression of Concern", "letter"]
+        pub_types = ["Letter", "Editorial"]
+        rules_file = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        try:
+            with rules_file:
+                json.dump({'title_strings': pub_strings, 'publication_types': pub_types}, rules_file)
+            rules = PublicationTypeRules.from_file(rules_file.name)
+        finally:
+            os.remove(rules_file.name)
+
+        titles = ["A letter", "Expression of concern: a study", "Editorial", "Letters"]
+        np.testing.assert_array_equal(rules.title_mask(titles), [True, True, False, True])
+        np.testing.assert_array_equal(rules.pub_type_mask([["Letter"], ["Editorial", "Journal Article"], ["Comment"]]), [True, True, False])
+        self.assertFalse(PublicationTypeRules().title_matches("Erratum"))
+        self.assertTrue(PublicationTypeRules([""]).title_matches("A study"))
+
+    def test_default_rules(self):
+        self.assertIs(default_rules(), default_rules())
+        # The lists the module has always exported, from the same config
+        self.assertIn('erratum', pub_strings)
+        self.assertEqual(pub_types, ['Retraction of Publication', 'Case Reports', 'Comment'])
+        self.assertEqual(default_rules().title_strings, tuple(pub_strings))
+        self.assertEqual(default_rules().pub_types, frozenset(pub_types))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+"""
+Module to run pytest unittests for the scoring server endpoints
+"""
+
+import contextlib
+import http.client
+import io
+import os
+import threading
+import time
+import unittest
+
+from ..BmCS import check_args, get_args
+from ..scoring_server import create_server
+
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models")
+
+
+class test_scoring_server(unittest.TestCase):
+    """
+    Class to test the health and readiness endpoints
+    """
+
+    def setUp(self):
+        # Model files that don't exist, so loading fails
+        args = get_args().parse_args(["missing_weights.hdf5", "missing_ensemble.joblib", "--serve", "--port", "0"])
+        self.server = create_server(args)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _get(self, path, body=None):
+        connection = http.client.HTTPConnection(*self.server.server_address[:2], timeout=10)
+        try:
+            connection.request("GET" if body is None else "POST", path, body=body)
+            response = connection.getresponse()
+            return response.status, response.read().decode("utf8")
+        finally:
+            connection.close()
+
+    def test_not_ready(self):
+        self.assertEqual(self._get("/health"), (200, "ok\n"))
+        self.assertEqual(self._get("/ready"), (503, "loading\n"))
+        self.assertEqual(self._get("/predict", body="<PubmedArticleSet/>")[0], 503)
+        self.assertEqual(self._get("/unknown")[0], 404)
+
+    def test_failed_load(self):
+        if os.path.isfile(os.path.join(MODELS_DIR, "ensemble.joblib")) and os.path.isfile(os.path.join(MODELS_DIR, "model_CNN_weights.hdf5")):
+            self.skipTest("Packaged models found, loading would succeed")
+        self.server.service.start()
+        deadline = time.time() + 60
+        while self.server.service.error is None and time.time() < deadline:
+            time.sleep(0.1)
+
+        status, body = self._get("/ready")
+        self.assertEqual(status, 503)
+        self.assertTrue(body.startswith("failed"))
+        self.assertEqual(self._get("/health")[0], 200)
+
+    def test_refused_options(self):
+        parser = get_args()
+        check_args(parser, parser.parse_args(["weights", "ensemble", "--serve"]))
+        # Worker processes would be forked while the request threads run
+        for options in [["--prep-workers", "2"], ["--ensemble-workers", "2"], ["--concurrent"]]:
+            args = parser.parse_args(["weights", "ensemble", "--serve"] + options)
+            with self.assertRaises(SystemExit), contextlib.redirect_stderr(io.StringIO()):
+                check_args(parser, args)
@@ -0,0 +1,72 @@
+"""
+Module to run pytest unittests for the memory-mapped vocabulary index
+
+Lookups in the compiled index must give the same results as the
+dictionary read from the text file, for present and absent keys.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import vocab_index
+from ..vocab_index import VocabIndex, build_index, load_index, read_lookup_file, index_path_for
+
+
+JOURNAL_IDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "journal_ids.txt")
+
+
+class test_vocab_index(unittest.TestCase):
+    """
+    Class to test VocabIndex against the text lookup files
+    """
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _assert_same_lookups(self, lookup_path, index, absent_keys):
+        lookup = read_lookup_file(lookup_path)
+        self.assertEqual(len(index), len(lookup))
+        for key, value in lookup.items():
+            self.assertEqual(index.get(key, -1), value)
+            self.assertEqual(index[key], value)
+        for key in absent_keys:
+            self.assertNotIn(key, lookup)
+            self.assertEqual(index.get(key, -1), -1)
+            self.assertFalse(key in index)
+
+    def test_journal_ids(self):
+        index_path = os.path.join(self.temp_dir, "journal_ids.idx")
+        build_index(JOURNAL_IDS_PATH, index_path)
+        self._assert_same_lookups(JOURNAL_IDS_PATH, VocabIndex(index_path), ["", "0000000", "unknown"])
+
+    def test_words(self):
+        # Repeated keys, non-ASCII keys, and keys that differ only in case or whitespace
+        lookup_path = os.path.join(self.temp_dir, "word_indices.txt")
+        with open(lookup_path, "wt", encoding="utf8") as f:
+            f.write("2\tthe\n3\tof\n4\tthe\n5\tβ-cell\n6\tnaïve\n7\tThe\n8\t  spaced \n9\t,\n")
+        build_index(lookup_path, index_path_for(lookup_path))
+        index = VocabIndex(index_path_for(lookup_path))
+        self.assertEqual(index["the"], 4)
+        self._assert_same_lookups(lookup_path, index, ["THE", "β", "naive", "spaced ", "", ".", "of "])
+
+    def test_load_index(self):
+        lookup_path = os.path.join(self.temp_dir, "word_indices.txt")
+        with open(lookup_path, "wt", encoding="utf8") as f:
+            f.write("2\tcell\n")
+        try:
+            index = load_index(lookup_path)
+            self.assertTrue(os.path.isfile(index_path_for(lookup_path)))
+            self.assertIs(load_index(lookup_path), index)
+
+            # A changed text file is recompiled when loaded in a new process
+            with open(lookup_path, "at", encoding="utf8") as f:
+                f.write("3\tcells\n")
+            del vocab_index._indexes[lookup_path]
+            self.assertEqual(load_index(lookup_path).get("cells"), 3)
+        finally:
+            vocab_index._indexes.pop(lookup_path, None)
@@ -0,0 +1,77 @@
+"""
+Module to run pytest unittests for the regex word tokenizer
+
+The regex tokenizer must give the same CNN index matrices as nltk.tokenize.word_tokenize,
+on the bundled validation and test sets when they are present, on the curated
+test citations, and on random text made of the characters the tokenizer rules act on.
+"""
+
+import gzip
+import json
+import os
+import random
+import unittest
+
+import numpy as np
+
+from ..daily_update_file_parser import parse_update_file
+from ..preprocess_CNN_data import _vectorize_batch_text, TITLE_MAX_WORDS, ABSTRACT_MAX_WORDS
+from ..word_tokenizer import get_tokenizer, regex_word_tokenize, nltk_word_tokenize
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+XML_PATH = os.path.join(TEST_DIR, "datasets", "test_citations.xml")
+DATASET_PATHS = [os.path.join(TEST_DIR, "datasets", name) for name in ("validation_set.json.gz", "test_set.json.gz")]
+WORD_INDICES_PATH = os.path.join(TEST_DIR, "..", "models", "word_indices.txt")
+
+# Pieces of random text. Every character and substring that triggers a tokenizer rule is included.
+RANDOM_TEXT_PIECES = list("ab1 .,:;'\"`()[]{}<>?!*-%&$@#\t\n«“‘„»”’") + [
+        "can", "not", "CAN", "gon", "na", "gim", "me", "wan", "more", "'n", "d", "'ye", "'t", "is", "was",
+        "'s", "'ll", "n't", "''", "``", "..", "--", "e.g.", "et al.", "fig. ", "Dr. ", " The "]
+
+
+def _load_texts(path):
+    with gzip.open(path, "rt", encoding="utf8") as f:
+        citations = json.load(f)
+    titles = [citation['title'].lower() for citation in citations]
+    abstracts = [citation['abstract'].lower() for citation in citations]
+    return titles, abstracts
+
+
+class test_word_tokenizer(unittest.TestCase):
+    """
+    Class to test the regex tokenizer against nltk
+    """
+
+    def _assert_same_matrices(self, titles, abstracts):
+        if os.path.isfile(WORD_INDICES_PATH):
+            with open(WORD_INDICES_PATH, "rt", encoding="utf8") as f:
+                word_index_lookup = {value.strip(): int(id) for id, value in (line.split('\t') for line in f)}
+        else:
+            # Give every nltk token its own index, so that any difference in tokens is a difference in indices
+            word_index_lookup = {}
+            for text in titles + abstracts:
+                for word in nltk_word_tokenize(text):
+                    word_index_lookup.setdefault(word, len(word_index_lookup) + 2)
+
+        for texts, max_words in ((titles, TITLE_MAX_WORDS), (abstracts, ABSTRACT_MAX_WORDS)):
+            expected = _vectorize_batch_text(word_index_lookup, texts, max_words, get_tokenizer('nltk'))
+            actual = _vectorize_batch_text(word_index_lookup, texts, max_words, get_tokenizer('regex'))
+            np.testing.assert_array_equal(actual, expected)
+
+    def test_test_citations(self):
+        citations = parse_update_file(XML_PATH, False, False, [], True, [])
+        self._assert_same_matrices([title.lower() for title in citations.titles], [abstract.lower() for abstract in citations.abstracts])
+
+    def test_datasets(self):
+        paths = [path for path in DATASET_PATHS if os.path.isfile(path)]
+        if len(paths) == 0:
+            self.skipTest("Validation and test sets not found")
+        for path in paths:
+            self._assert_same_matrices(*_load_texts(path))
+
+    def test_random_text(self):
+        rng = random.Random(0)
+        for _ in range(5000):
+            text = ''.join(rng.choice(RANDOM_TEXT_PIECES) for _ in range(rng.randint(0, 16)))
+            self.assertEqual(regex_word_tokenize(text), nltk_word_tokenize(text), repr(text))
@@ -0,0 +1,225 @@
+"""
+Module to run BmCS on many update files in one invocation
+
+Files are shared out to a pool of worker processes. Each worker loads the models
+and config once, and parses the next file in a background thread
+while the current file is being scored.
+"""
+
+import glob
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from .bmcs_exceptions import BmCS_Exception
+from .daily_update_file_parser import NO_CITATIONS_MSG, UPDATE_FILE_SUFFIXES
+from .prediction_writer import PredictionWriter, predictions_file_name
+
+
+def find_update_files(batch):
+    """
+    Return the sorted list of update files in a directory, or matching a glob
+    """
+
+    if os.path.isdir(batch):
+        paths = [os.path.join(batch, name) for name in os.listdir(batch) if name.endswith(UPDATE_FILE_SUFFIXES)]
+    else:
+        paths = glob.glob(batch)
+    paths = sorted(path for path in paths if os.path.isfile(path))
+
+    if len(paths) == 0:
+        msg = "No update files found for \"{}\".".format(batch)
+        raise BmCS_Exception(msg)
+
+    return paths
+
+
+def output_file_name(path, output_format="text"):
+    """
+    Name of the predictions file for one input file,
+    e.g. pubmed24n0001.xml.gz -> citation_predictions_pubmed24n0001.txt
+    """
+
+    return predictions_file_name(path, output_format)
+
+
+def run_batch(args):
+    """
+    Score every update file given by args.batch
+
+    Writes one citation_predictions_<input name>.txt file per input,
+    or a single dated file in input order if args.merge_output is set,
+    with the suffix of args.output_format.
+    """
+
+    paths = find_update_files(args.batch)
+    num_workers = max(1, min(args.workers or 1, len(paths)))
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    print("Scoring {0} files with {1} workers".format(len(paths), num_workers))
+
+    # Spawn rather than fork, so that workers don't inherit TensorFlow state
+    context = multiprocessing.get_context("spawn")
+    task_queue = context.Queue()
+    result_queue = context.Queue()
+    for index, path in enumerate(paths):
+        task_queue.put((index, path))
+    for _ in range(num_workers):
+        task_queue.put(None)
+
+    workers = [context.Process(target=_worker, args=(args, task_queue, result_queue, num_threads)) for _ in range(num_workers)]
+    for worker in workers:
+        worker.start()
+
+    try:
+        _collect_results(args, paths, result_queue, workers)
+    except BaseException:
+        for worker in workers:
+            worker.terminate()
+        raise
+    finally:
+        for worker in workers:
+            worker.join()
+
+
+def _collect_results(args, paths, result_queue, workers):
+    """
+    Wait for all files to be scored, writing merged output in input order
+    """
+
+    # The merged file appears once all files are scored
+    writer = None
+    if args.merge_output:
+        writer = PredictionWriter("{0}{1}".format(args.destination, predictions_file_name(None, args.output_format)), args.output_format)
+    try:
+        num_written = _collect_results_to(args, paths, result_queue, workers, writer)
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+    if writer is not None:
+        # As before, no merged file if no file had citations to score
+        if num_written > 0:
+            writer.close()
+        else:
+            writer.abort()
+
+
+def _collect_results_to(args, paths, result_queue, workers, writer):
+    """
+    Wait for all files to be scored, passing merged results to writer in input order.
+    Returns the number of results written.
+    """
+
+    num_written = 0
+    pending_results = {}
+    next_index = 0
+    num_done = 0
+    while num_done < len(paths):
+        try:
+            index, path, result, error = result_queue.get(timeout=1)
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                msg = "Batch workers exited before all files were scored."
+                raise BmCS_Exception(msg)
+            continue
+
+        if error is not None:
+            msg = "Can't score \"{}\". Reason: \"{}\".".format(path, error) if path is not None else error
+            raise BmCS_Exception(msg)
+
+        num_done += 1
+        if result is None:
+            print("No citations fit the current criteria in {0}".format(path))
+        pending_results[index] = result
+
+        if args.merge_output:
+            while next_index in pending_results:
+                result = pending_results.pop(next_index)
+                if result is not None:
+                    writer.write(*result)
+                    num_written += 1
+                next_index += 1
+        else:
+            del pending_results[index]
+
+    return num_written
+
+
+def _worker(args, task_queue, result_queue, num_threads):
+    """
+    Worker process. Load the models once, then score files until the task queue is empty.
+    """
+
+    try:
+        # For the libraries loaded from here on. load_models limits the threads
+        # after the ensemble workers, if any, are forked.
+        os.environ["OMP_NUM_THREADS"] = str(num_threads)
+        from .BmCS import load_config, load_models, parse_citations, predict_citations, save_predictions
+        journal_policy = load_config()
+        o_sci_model, o_cnn_model = load_models(args, num_threads)
+    except Exception as e:
+        result_queue.put((None, None, None, "Can't initialize batch worker. Reason: \"{}\".".format(str(e))))
+        return
+
+    def _parse(task):
+        try:
+            return parse_citations(task[1], args, journal_policy)
+        except Exception as e:
+            if str(e) == NO_CITATIONS_MSG:
+                return None
+            raise
+
+    with ThreadPoolExecutor(max_workers=1) as reader:
+        task = task_queue.get()
+        pending = reader.submit(_parse, task) if task is not None else None
+        while pending is not None:
+            index, path = task
+            # Read the next file while this one is scored
+            next_task = task_queue.get()
+            next_pending = reader.submit(_parse, next_task) if next_task is not None else None
+
+            try:
+                citations = pending.result()
+                result = None
+                if citations is not None:
+                    result = predict_citations(citations, o_sci_model, o_cnn_model, journal_policy, args)
+                    if not args.merge_output:
+                        save_predictions(*result, args.destination, file_name=output_file_name(path, args.output_format), output_format=args.output_format)
+                        # Written by the worker, nothing to send back
+                        result = ()
+                result_queue.put((index, path, result, None))
+            except Exception as e:
+                result_queue.put((index, path, None, str(e)))
+
+            task, pending = next_task, next_pending
+
+
+def available_cpus():
+    """
+    CPUs this process may use: its share of them in a batch worker, otherwise all of them
+    """
+
+    return int(os.environ.get("OMP_NUM_THREADS") or os.cpu_count() or 1)
+
+
+def limit_threads(num_threads, cnn_backend):
+    """
+    Share the CPUs between workers, rather than each TensorFlow runtime or BLAS library using all of them
+    """
+
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    # NumPy's BLAS is already loaded, so the environment variable is too late for it.
+    # threadpoolctl comes with scikit-learn, but is not required: without it, only
+    # libraries loaded from here on are limited.
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        threadpool_limits = None
+    if threadpool_limits is not None:
+        threadpool_limits(num_threads)
+    if cnn_backend != 'tensorflow':
+        return
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(num_threads)
+    tf.config.threading.set_inter_op_parallelism_threads(1)
@@ -1,3 +1,4 @@
+import hashlib
 import os.path
 
 from .bmcs_exceptions import BmCS_Exception
@@ -6,6 +7,8 @@ class BaseModel(object):
     def __init__(self, *args, **kwargs):
         self._fname = None
         self._model = None
+        self._source_files = []
+        self._fingerprint = None
 
     def fname(self, fname=None, *args, **kwargs):
         if fname is not None:
@@ -21,6 +24,19 @@ class BaseModel(object):
         if (not os.path.exists(fname)) or (not os.path.isfile(fname)):
             msg = "File \"{}\" does not exist or not a file.".format(fname)
             raise BmCS_Exception(msg)
+        self._source_files.append(fname)
+        self._fingerprint = None
+
+    # SHA-256 of the content of the files the model was loaded from
+    def fingerprint(self):
+        if self._fingerprint is None:
+            sha = hashlib.sha256()
+            for fname in self._source_files:
+                with open(fname, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        sha.update(chunk)
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
 
     def process(self, dX):
         if self.model() is None:
@@ -1,19 +1,52 @@
-from tensorflow.keras.models import model_from_json
-from pkg_resources import resource_filename
 import os.path
 
-from .embedding_custom import EmbeddingWithDropout
-
 from .bmcs_basemodel import BaseModel
 from .bmcs_exceptions import BmCS_Exception
+from .resources import resource_filename
+
+
+# tensorflow runs the Keras model. numpy runs the same forward pass in NumPy, see numpy_cnn.
+CNN_BACKENDS = ('tensorflow', 'numpy')
+DEFAULT_CNN_BACKEND = 'tensorflow'
+
+# Precision of the word embedding table, see numpy_cnn. Only the numpy backend supports float16 and int8.
+CNN_PRECISIONS = ('float32', 'float16', 'int8')
+DEFAULT_CNN_PRECISION = 'float32'
+
+
+def init_tensorflow():
+    """
+    Import TensorFlow and switch to graph mode, which the CNN was built for.
+    Called when a CNN is loaded, so that commands which don't run it never import TensorFlow.
+    """
+
+    import tensorflow as tf
+    tf.compat.v1.disable_eager_execution()
 
 
 class CnnModel(BaseModel):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # TensorFlow graph and session of the model. The defaults are per thread, so other threads predict in these.
+        self._graph = None
+        self._session = None
 
     # Init CNN model from file
-    def from_file(self, fname, weights_fname, d_custom_objects=None, loss='binary_crossentropy', optimizer='adam'):
+    def from_file(self, fname, weights_fname, d_custom_objects=None, loss='binary_crossentropy', optimizer='adam', backend=DEFAULT_CNN_BACKEND, length_buckets=False, precision=DEFAULT_CNN_PRECISION):
+        if backend not in CNN_BACKENDS:
+            msg = "Unknown CNN backend \"{}\". Expected one of {}.".format(backend, ", ".join(CNN_BACKENDS))
+            raise BmCS_Exception(msg)
+        # The Keras model has fixed sequence lengths
+        if length_buckets and backend != 'numpy':
+            msg = "Length buckets need the numpy CNN backend."
+            raise BmCS_Exception(msg)
+        if precision not in CNN_PRECISIONS:
+            msg = "Unknown CNN precision \"{}\". Expected one of {}.".format(precision, ", ".join(CNN_PRECISIONS))
+            raise BmCS_Exception(msg)
+        if precision != DEFAULT_CNN_PRECISION and backend != 'numpy':
+            msg = "CNN precision {} needs the numpy CNN backend.".format(precision)
+            raise BmCS_Exception(msg)
+
         if fname is None:
             fname = "None"
 
@@ -40,6 +73,7 @@ class CnnModel(BaseModel):
                 raise BmCS_Exception(msg)
             else:
                 weights_fname = weights_local
+        super().from_file(weights_fname)
 
         model_json, model = None, None
 
@@ -50,6 +84,22 @@ class CnnModel(BaseModel):
             msg = "Can't get content of \"{}\". Reason: \"{}\".".format(fname, str(e))
             raise BmCS_Exception(msg)
 
+        if backend == 'numpy':
+            from .numpy_cnn import NumpyCnn
+            try:
+                model = NumpyCnn.from_files(model_json, weights_fname, length_buckets, precision)
+            except BmCS_Exception:
+                raise
+            except Exception as e:
+                msg = "Can't init NumPy CNN from \"{}\" and \"{}\". Reason: \"{}\".".format(fname, weights_fname, str(e))
+                raise BmCS_Exception(msg)
+            self.model(model)
+            return
+
+        init_tensorflow()
+        from tensorflow.keras.models import model_from_json
+        from .embedding_custom import EmbeddingWithDropout
+
         if d_custom_objects is None:
             d_custom_objects = {EmbeddingWithDropout.__name__: EmbeddingWithDropout}
 
@@ -79,6 +129,9 @@ class CnnModel(BaseModel):
             msg = "Can't compile CNN model! Reason: \"{}\".".format(str(e))
             raise BmCS_Exception(msg)
 
+        import tensorflow as tf
+        self._graph = tf.compat.v1.get_default_graph()
+        self._session = tf.compat.v1.keras.backend.get_session()
         self.model(model)
 
     # Process source data
@@ -87,7 +140,11 @@ class CnnModel(BaseModel):
 
         result = None
         try:
-            result = self.model().predict(dX).flatten()
+            if self._graph is None:
+                result = self.model().predict(dX).flatten()
+            else:
+                with self._graph.as_default(), self._session.as_default():
+                    result = self.model().predict(dX).flatten()
         except ValueError as ve:
             msg = "Can't run prediction on CNN model! Reason: \"{}\".".format(str(ve))
             msg += " Possible mismatch between the provided input data and the model's expectations."
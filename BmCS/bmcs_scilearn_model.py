@@ -1,13 +1,26 @@
+import multiprocessing
 import os
 
-import joblib
+import numpy as np
 
 from .bmcs_basemodel import BaseModel
 from .bmcs_exceptions import BmCS_Exception
+from .resources import resource_filename
+
+
+# Rows per task in parallel scoring
+SCORING_CHUNK_SIZE = 1024
+
+# Fitted model of parallel scoring, set before the worker processes are forked
+_parallel_state = None
+
 
 class SciLearnModel(BaseModel):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, workers=1, chunk_size=SCORING_CHUNK_SIZE, **kwargs):
         super().__init__(*args, **kwargs)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._pool = None
 
     def from_file(self, fname):
         if fname is None:
@@ -24,6 +37,10 @@ class SciLearnModel(BaseModel):
 
         super().from_file(fname)
 
+        import joblib
+        # The pickled ensemble refers to the classes in item_select
+        from . import item_select
+
         model = None
         try:
             model = joblib.load(fname)
@@ -42,9 +59,135 @@ class SciLearnModel(BaseModel):
 
         result = None
         try:
-            result = self.model().predict_proba(dX)[:, 0]
+            result = predict_proba_chunked(self.model(), dX, self.workers, self.chunk_size, self._pool)[:, 0]
+        except Exception as e:
+            msg = "Can't run prediction on SciLearn model! Reason: \"{}\".".format(str(e))
+            raise BmCS_Exception(msg)
+
+        return result
+
+    def start_workers(self, workers=None):
+        """
+        Fork the worker processes for process and process_async now, workers of them or the number set for the model.
+
+        Call this after from_file and before the CNN is loaded: a process forked while
+        TensorFlow or BLAS threads hold locks can deadlock. Without fork, scoring runs in this process.
+        """
+
+        if self._pool is None and _can_fork():
+            self._pool = start_pool(self.model(), workers or self.workers)
+
+    def close(self):
+        """
+        Stop the worker processes, if started
+        """
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def process_async(self, dX, workers=None):
+        """
+        Start process on the worker processes from start_workers, or on newly forked ones,
+        workers of them or the number set for the model, and return a function that waits for the result
+        """
+
+        super().process(dX)
+
+        try:
+            wait = predict_proba_async(self.model(), dX, workers or self.workers, self.chunk_size, self._pool)
         except Exception as e:
             msg = "Can't run prediction on SciLearn model! Reason: \"{}\".".format(str(e))
             raise BmCS_Exception(msg)
 
+        def result():
+            try:
+                return wait()[:, 0]
+            except Exception as e:
+                msg = "Can't run prediction on SciLearn model! Reason: \"{}\".".format(str(e))
+                raise BmCS_Exception(msg)
         return result
+
+
+def predict_proba_chunked(model, dX, workers=1, chunk_size=SCORING_CHUNK_SIZE, pool=None):
+    """
+    predict_proba on a dictionary of columns, in chunks of rows on a pool of forked worker processes.
+
+    pool is a pool from start_pool, or None to fork one for this call. The fitted model is
+    inherited by the workers rather than pickled. Each row is transformed and scored on its own,
+    so the probabilities, concatenated in row order, are the same as from a single predict_proba call.
+    With one worker, or fewer than two chunks of rows, predict_proba runs on the whole input.
+    """
+
+    num_rows = len(next(iter(dX.values())))
+    if pool is None and (workers <= 1 or not _can_fork()):
+        return model.predict_proba(dX)
+    if num_rows < 2 * chunk_size:
+        return model.predict_proba(dX)
+
+    return predict_proba_async(model, dX, workers, chunk_size, pool)()
+
+
+def predict_proba_async(model, dX, workers=1, chunk_size=SCORING_CHUNK_SIZE, pool=None):
+    """
+    Start predict_proba_chunked on pool, or on at least one newly forked worker process,
+    and return a function that waits for the probabilities. The caller is free to run
+    other work in the meantime. Without fork, or without rows, predict_proba runs before returning.
+    """
+
+    num_rows = len(next(iter(dX.values())))
+    if num_rows == 0 or (pool is None and not _can_fork()):
+        probabilities = model.predict_proba(dX)
+        return lambda: probabilities
+
+    chunks = [(start, min(start + chunk_size, num_rows)) for start in range(0, num_rows, chunk_size)]
+    own_pool = pool is None
+    if own_pool:
+        pool = start_pool(model, min(workers, len(chunks)))
+    async_result = pool.map_async(_predict_proba_chunk, [{key: column[start:end] for key, column in dX.items()} for start, end in chunks])
+
+    def wait():
+        try:
+            return np.concatenate(async_result.get())
+        finally:
+            if own_pool:
+                pool.terminate()
+                pool.join()
+    return wait
+
+
+def start_pool(model, workers):
+    """
+    Fork workers processes that score chunks of rows with the fitted model.
+
+    Start the pool before TensorFlow, or another library that runs threads, is loaded.
+    A process forked while such threads hold locks can deadlock.
+    """
+
+    global _parallel_state
+
+    # The workers are forked when the pool is created, and keep their copy of the model
+    _parallel_state = model
+    try:
+        return multiprocessing.get_context("fork").Pool(max(1, workers), initializer=_init_worker)
+    finally:
+        _parallel_state = None
+
+
+def _init_worker():
+    # The workers are the parallelism, so each one uses a single BLAS thread
+    os.environ["OMP_NUM_THREADS"] = "1"
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        return
+    threadpool_limits(1)
+
+
+def _predict_proba_chunk(dX_chunk):
+    return _parallel_state.predict_proba(dX_chunk)
+
+
+def _can_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
@@ -0,0 +1,158 @@
+"""
+Module for the columnar citation batch
+
+A CitationBatch holds the fields of many citations as columns,
+rather than as one dictionary per citation. PMIDs and publication years
+are NumPy arrays, text fields are lists, and journal ids are interned,
+so each distinct journal id is stored once and each citation keeps an index into it.
+The parser, both preprocessors, the publication type filter and save_predictions
+all work on the columns directly.
+
+For compatibility, a batch still behaves like a list of citation dictionaries:
+len(batch), batch[i] and iteration return dictionaries with the usual keys.
+"""
+
+import sys
+
+import numpy as np
+
+
+# Stored in pub_years when the publication year could not be extracted
+UNKNOWN_PUB_YEAR = -1
+
+
+class CitationBatch(object):
+    """
+    Columnar representation of a batch of citations
+    """
+
+    def __init__(self, pmids, titles, abstracts, affiliations, journal_codes, journal_vocab, pub_years, pub_types, statuses=None):
+        self.pmids = np.asarray(pmids, dtype=np.int64)
+        self.titles = titles
+        self.abstracts = abstracts
+        self.affiliations = affiliations
+        # journal_vocab[journal_codes[i]] is the NLM journal id of citation i
+        self.journal_codes = np.asarray(journal_codes, dtype=np.int32)
+        self.journal_vocab = journal_vocab
+        self.pub_years = np.asarray(pub_years, dtype=np.int32)
+        self.pub_types = pub_types
+        # Indexing status of each citation. Only kept for unfiltered batches, e.g. in the parsed citation cache
+        self.statuses = statuses
+        self._journal_ids = None
+
+    @classmethod
+    def from_citations(cls, citations):
+        """
+        Build a batch from an iterable of citation dictionaries, in a single pass
+        """
+
+        pmids, titles, abstracts, affiliations, journal_codes, pub_years, pub_types, statuses = [], [], [], [], [], [], [], []
+        journal_vocab, journal_index = [], {}
+
+        for citation in citations:
+            pmids.append(int(citation['pmid']))
+            titles.append(citation['title'])
+            abstracts.append(citation['abstract'])
+            affiliations.append(citation['affiliations'])
+
+            journal_nlmid = citation['journal_nlmid']
+            journal_code = journal_index.get(journal_nlmid)
+            if journal_code is None:
+                journal_code = journal_index[journal_nlmid] = len(journal_vocab)
+                journal_vocab.append(journal_nlmid)
+            journal_codes.append(journal_code)
+
+            pub_year = citation['pub_year']
+            pub_years.append(UNKNOWN_PUB_YEAR if pub_year is None else pub_year)
+            pub_types.append(citation.get('pub_type', []))
+
+            status = citation.get('status')
+            if status is not None:
+                statuses.append(sys.intern(status))
+
+        if len(statuses) != len(pmids):
+            statuses = None
+
+        return cls(pmids, titles, abstracts, affiliations, journal_codes, journal_vocab, pub_years, pub_types, statuses)
+
+    @classmethod
+    def concatenate(cls, batches):
+        """
+        Join batches into one, re-interning the journal ids
+        """
+
+        return cls.from_citations(citation for batch in batches for citation in batch)
+
+    @property
+    def journal_ids(self):
+        """
+        NLM journal id of each citation, as a list
+        """
+
+        if self._journal_ids is None:
+            journal_vocab = self.journal_vocab
+            self._journal_ids = [journal_vocab[journal_code] for journal_code in self.journal_codes.tolist()]
+        return self._journal_ids
+
+    def take(self, indices):
+        """
+        New batch holding the citations at the given indices, in that order
+        """
+
+        indices = np.asarray(indices, dtype=np.intp)
+        index_list = indices.tolist()
+        return CitationBatch(
+                self.pmids[indices],
+                [self.titles[i] for i in index_list],
+                [self.abstracts[i] for i in index_list],
+                [self.affiliations[i] for i in index_list],
+                self.journal_codes[indices],
+                self.journal_vocab,
+                self.pub_years[indices],
+                [self.pub_types[i] for i in index_list],
+                None if self.statuses is None else [self.statuses[i] for i in index_list])
+
+    def citation(self, i):
+        """
+        Citation i as a dictionary, as returned by the parser
+        """
+
+        pub_year = int(self.pub_years[i])
+        return {
+            'pmid': int(self.pmids[i]),
+            'title': self.titles[i],
+            'abstract': self.abstracts[i],
+            'affiliations': self.affiliations[i],
+            'journal_nlmid': self.journal_vocab[self.journal_codes[i]],
+            'pub_year': None if pub_year == UNKNOWN_PUB_YEAR else pub_year,
+            'pub_type': self.pub_types[i],
+            }
+
+    def to_citations(self):
+        return [self.citation(i) for i in range(len(self))]
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.take(np.arange(len(self))[key])
+        if key < 0:
+            key += len(self)
+        if key < 0 or key >= len(self):
+            raise IndexError("CitationBatch index out of range")
+        return self.citation(key)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.citation(i)
+
+
+def as_citation_batch(citations):
+    """
+    Accept either a CitationBatch or a list of citation dictionaries
+    """
+
+    if isinstance(citations, CitationBatch):
+        return citations
+    return CitationBatch.from_citations(citations)
@@ -0,0 +1,207 @@
+"""
+Module for the parsed citation cache
+
+The same update files are often run more than once, e.g. after config changes,
+for validation reruns and for backfills. The cache stores the unfiltered citations
+of a file as columns in a binary .npz file, keyed by a hash of the file content
+and the parser version. Later runs load the columns and apply the filtering options
+to them, without parsing the XML again.
+
+The cache is opt-in and bounded in size. When it grows past its limit,
+the least recently used entries are removed first.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+
+from .bmcs_exceptions import BmCS_Exception
+from .citation_batch import CitationBatch
+from .daily_update_file_parser import PARSER_VERSION, parse_all_citations
+
+
+DEFAULT_CACHE_MAX_MB = 2048
+CACHE_DIR_ENV = "BMCS_CACHE_DIR"
+
+# Joins the publication types of one citation. Not a valid character in XML 1.0.
+PUB_TYPE_SEPARATOR = '\x1f'
+
+
+def file_fingerprint(path):
+    """
+    SHA-256 of the file content, as a hex string
+    """
+
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class CitationCache(object):
+    """
+    Directory of parsed update files, with least recently used eviction
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+        except OSError as e:
+            msg = "Can't create citation cache directory \"{}\". Reason: \"{}\".".format(cache_dir, str(e))
+            raise BmCS_Exception(msg)
+
+    def entry_path(self, fingerprint):
+        return os.path.join(self.cache_dir, "citations_{0}_v{1}.npz".format(fingerprint, PARSER_VERSION))
+
+    def load_or_parse(self, path):
+        """
+        Unfiltered CitationBatch for an update file, from the cache if possible
+        """
+
+        fingerprint = file_fingerprint(path)
+        citations = self.get(fingerprint)
+        if citations is None:
+            citations = parse_all_citations(path)
+            self.put(fingerprint, citations)
+        return citations
+
+    def get(self, fingerprint):
+        entry_path = self.entry_path(fingerprint)
+        if not os.path.isfile(entry_path):
+            return None
+
+        try:
+            with np.load(entry_path, allow_pickle=False) as columns:
+                citations = _batch_from_columns(columns)
+        except Exception:
+            # Unreadable entry, e.g. from an interrupted write by an older version. Parse again.
+            _remove(entry_path)
+            return None
+
+        # Mark as recently used
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        return citations
+
+    def put(self, fingerprint, citations):
+        # Write to a temporary file and rename, so that concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **_columns_from_batch(citations))
+            os.replace(tmp_path, self.entry_path(fingerprint))
+        except Exception:
+            _remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes
+        """
+
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".npz"):
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
+
+        total_bytes = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            _remove(entry_path)
+            total_bytes -= size
+
+
+def cache_from_args(args):
+    """
+    CitationCache for the command line options, or None if caching is off
+    """
+
+    cache_dir = getattr(args, "cache_dir", None) or os.environ.get(CACHE_DIR_ENV)
+    if cache_dir is None or getattr(args, "no_cache", False):
+        return None
+    max_mb = getattr(args, "cache_max_mb", None)
+    if max_mb is None:
+        max_mb = DEFAULT_CACHE_MAX_MB
+    return CitationCache(cache_dir, int(max_mb * 1024 * 1024))
+
+
+def _columns_from_batch(citations):
+    titles, title_offsets = _encode_text(citations.titles)
+    abstracts, abstract_offsets = _encode_text(citations.abstracts)
+    affiliations, affiliation_offsets = _encode_text(citations.affiliations)
+    journal_vocab, journal_vocab_offsets = _encode_text(citations.journal_vocab)
+    pub_types, pub_type_offsets = _encode_text([PUB_TYPE_SEPARATOR.join(pub_type_list) for pub_type_list in citations.pub_types])
+
+    status_codes = {}
+    status_index = np.array([status_codes.setdefault(status, len(status_codes)) for status in citations.statuses], dtype=np.int32)
+    status_vocab, status_vocab_offsets = _encode_text(list(status_codes))
+
+    return {
+        'pmids': citations.pmids,
+        'pub_years': citations.pub_years,
+        'journal_codes': citations.journal_codes,
+        'status_codes': status_index,
+        'titles': titles, 'title_offsets': title_offsets,
+        'abstracts': abstracts, 'abstract_offsets': abstract_offsets,
+        'affiliations': affiliations, 'affiliation_offsets': affiliation_offsets,
+        'journal_vocab': journal_vocab, 'journal_vocab_offsets': journal_vocab_offsets,
+        'pub_types': pub_types, 'pub_type_offsets': pub_type_offsets,
+        'status_vocab': status_vocab, 'status_vocab_offsets': status_vocab_offsets,
+        }
+
+
+def _batch_from_columns(columns):
+    status_vocab = _decode_text(columns['status_vocab'], columns['status_vocab_offsets'])
+    statuses = [status_vocab[status_code] for status_code in columns['status_codes'].tolist()]
+    pub_types = [pub_type_list.split(PUB_TYPE_SEPARATOR) if len(pub_type_list) > 0 else []
+                 for pub_type_list in _decode_text(columns['pub_types'], columns['pub_type_offsets'])]
+
+    return CitationBatch(
+            columns['pmids'],
+            _decode_text(columns['titles'], columns['title_offsets']),
+            _decode_text(columns['abstracts'], columns['abstract_offsets']),
+            _decode_text(columns['affiliations'], columns['affiliation_offsets']),
+            columns['journal_codes'],
+            _decode_text(columns['journal_vocab'], columns['journal_vocab_offsets']),
+            columns['pub_years'],
+            pub_types,
+            statuses)
+
+
+def _encode_text(texts):
+    """
+    Join a list of strings into one UTF-8 buffer, with the character offset of each string
+    """
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    np.cumsum([len(text) for text in texts], out=offsets[1:])
+    data = np.frombuffer(''.join(texts).encode('utf8'), dtype=np.uint8)
+    return data, offsets
+
+
+def _decode_text(data, offsets):
+    joined = data.tobytes().decode('utf8')
+    offsets = offsets.tolist()
+    return [joined[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -5,12 +5,40 @@ This module parses the XML and filters citations for system predictions, dependi
 
 Occasionally pub year will be None if fail to extract from MedlineDate tag? Or maybe this is not used anymore
 """
-from dateutil.parser import parse
+from functools import lru_cache
+import bz2
+import gzip
 import re
 import xml.etree.ElementTree as ET
 import sys
 import os
 
+import numpy as np
+
+from .bmcs_exceptions import BmCS_Exception
+from .citation_batch import CitationBatch
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Version of the extracted citation fields.
+# Increase when _extract_citation_data changes, so that cached parses are not reused.
+PARSER_VERSION = 1
+
+GZIP_MAGIC = b'\x1f\x8b'
+BZ2_MAGIC = b'BZh'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Names of the update files open_update_file reads. Compressed suffixes come first,
+# so that the longest suffix is stripped from output names
+UPDATE_FILE_SUFFIXES = ('.xml.gz', '.xml.bz2', '.xml.zst', '.xml')
+
+NO_CITATIONS_MSG = "There are no citations that fit the current criteria. Consider using the --predict-medline " \
+                   "or --predict-all options as explained in the documentation. SIS will now exit"
+
 
 def parse_update_string(selectively_indexed_ids, xml_string: str):
     """
@@ -47,12 +75,12 @@ def parse_update_file(path, journal_drop, predict_medline, selectively_indexed_i
     """
     Main parsing function for BmCS
 
-    Will return list of dictionaries, 
-    each dictionary containing data for one citation 
+    Will return a CitationBatch, holding the data 
+    for each citation as columns
     """
     root_node = None
     if path is not None and os.path.exists(path):
-        with open(path, 'rt', encoding='utf8') as _file:
+        with open_update_file(path) as _file:
             root_node = ET.parse(_file)
     elif xml_string is not None and len(xml_string) > 0:
         root_node = ET.fromstring(xml_string)
@@ -60,47 +88,184 @@ def parse_update_file(path, journal_drop, predict_medline, selectively_indexed_i
         msg = "Neither XML file nor XML string provided."
         raise Exception(msg)
 
-    citations = []
-    for medline_citation_node in root_node.findall('PubmedArticle/MedlineCitation'):
-        citation_data = _extract_citation_data(medline_citation_node)
-        # Run on everything in a file:
-        if predict_all:
-            citation_dict = _construct_citation_dict(citation_data)
-            citations.append(citation_dict)
-        # Make predictions for only selectively indexed journals
-        # that do not have a MEDLINE and PubMed-not-MEDLINE status yet.
-        # Citations that do not meet this criteria will not be processed,
-        # nor will citations from misindexed journals if
-        # --no-journal-drop is included
-        elif not predict_medline and (citation_data[6] != "MEDLINE" and citation_data[6] != "PubMed-not-MEDLINE"):
-            if citation_data[4] in selectively_indexed_ids:
-                if journal_drop:
-                    if citation_data[4] not in misindexed_ids:
-                        citation_dict = _construct_citation_dict(citation_data)
-                        citations.append(citation_dict)
-                elif not journal_drop:
-                    citation_dict = _construct_citation_dict(citation_data)
-                    citations.append(citation_dict)
-        # Otherwise, make predictions for citations not
-        # from selectively indexed journals
-        # that HAVE a MEDLINE status
-        # Citations that do not meet this criteria not be processed
-        # This option is exclusively for running on everything not selectively indexed,
-        # therefore the option --no-journal-drop has no effect
-        elif predict_medline and citation_data[6] == "MEDLINE":
-            if citation_data[4] not in selectively_indexed_ids:
-                citation_dict = _construct_citation_dict(citation_data)
-                citations.append(citation_dict)
+    citations = CitationBatch.from_citations(_filter_citations(
+            root_node.findall('PubmedArticle/MedlineCitation'),
+            journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids))
 
     # Just in case no citations meet the criteria:
     if len(citations) == 0:
-        msg = "There are no citations that fit the current criteria. Consider using the --predict-medline " \
-              "or --predict-all options as explained in the documentation. SIS will now exit"
-        raise Exception(msg)
+        raise Exception(NO_CITATIONS_MSG)
         
     return citations    
 
 
+def parse_all_citations(path):
+    """
+    Parse every citation in an update file, without filtering
+
+    Returns a CitationBatch that also holds the status of each citation,
+    so that it can be cached and filtered later with filter_citations.
+    The file is read incrementally, as in iterparse_update_file.
+    """
+    def _all_citations():
+        for medline_citation_node in _iter_medline_citation_nodes(path):
+            citation_data = _extract_citation_data(medline_citation_node)
+            citation_dict = _construct_citation_dict(citation_data)
+            citation_dict['status'] = citation_data[6]
+            yield citation_dict
+
+    return CitationBatch.from_citations(_all_citations())
+
+
+def filter_citations(citations, journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids):
+    """
+    Apply the filtering options to an unfiltered CitationBatch from parse_all_citations
+
+    Keeps the same citations as parse_update_file. Each distinct status and journal pair is checked once.
+    """
+    if predict_all:
+        kept_citations = citations
+    else:
+        journal_vocab = citations.journal_vocab
+        keep_by_pair = {}
+        keep = np.empty(len(citations), dtype=bool)
+        for i, status_journal in enumerate(zip(citations.statuses, citations.journal_codes.tolist())):
+            kept = keep_by_pair.get(status_journal)
+            if kept is None:
+                status, journal_code = status_journal
+                kept = keep_by_pair[status_journal] = _keep_citation(status, journal_vocab[journal_code], journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids)
+            keep[i] = kept
+        kept_citations = citations.take(np.flatnonzero(keep))
+
+    # Just in case no citations meet the criteria:
+    if len(kept_citations) == 0:
+        raise Exception(NO_CITATIONS_MSG)
+
+    return kept_citations
+
+
+def _filter_citations(medline_citation_nodes, journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids):
+    """
+    Yield the citation dictionary of each node that fits the filtering options
+    """
+    for medline_citation_node in medline_citation_nodes:
+        # Filter on status and journal first, so that dropped citations are never fully extracted
+        if predict_all or _keep_citation(*_extract_filter_data(medline_citation_node), journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids):
+            citation_data = _extract_citation_data(medline_citation_node)
+            yield _construct_citation_dict(citation_data)
+
+
+def iterparse_update_file(path, journal_drop, predict_medline, selectively_indexed_ids, predict_all,
+                          misindexed_ids):
+    """
+    Streaming parsing function for BmCS
+
+    Same filtering as parse_update_file, but the XML is read incrementally
+    and citation dictionaries are yielded one PubmedArticle at a time.
+    Processed elements are cleared from the tree as soon as they are read,
+    so memory use does not grow with the size of the file.
+    """
+    if path is None or not os.path.exists(path):
+        msg = "XML file not provided."
+        raise Exception(msg)
+
+    num_citations = 0
+    for medline_citation_node in _iter_medline_citation_nodes(path):
+        for citation_dict in _filter_citations([medline_citation_node], journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids):
+            num_citations += 1
+            yield citation_dict
+
+    # Just in case no citations meet the criteria:
+    if num_citations == 0:
+        raise Exception(NO_CITATIONS_MSG)
+
+
+def _iter_medline_citation_nodes(path):
+    """
+    Yield the MedlineCitation node of each PubmedArticle in an update file, reading it incrementally
+
+    Each record is cleared from the tree once the next one is requested.
+    """
+    with open_update_file(path) as _file:
+        root_node = None
+        depth = 0
+        for event, node in ET.iterparse(_file, events=('start', 'end')):
+            if event == 'start':
+                if root_node is None:
+                    root_node = node
+                depth += 1
+                continue
+
+            depth -= 1
+            # Only direct children of PubmedArticleSet are complete records
+            if depth != 1:
+                continue
+            if node.tag == 'PubmedArticle':
+                for medline_citation_node in node.findall('MedlineCitation'):
+                    yield medline_citation_node
+            # Drop everything read so far, including DeleteCitation and book records
+            root_node.clear()
+
+
+def open_update_file(path):
+    """
+    Open an update file for parsing
+
+    Plain XML, gzip (.xml.gz), bzip2 (.xml.bz2) and zstandard (.xml.zst) files
+    are accepted. Compression is detected from the magic bytes of the file,
+    and the file is decompressed on the fly, so no temporary file is written.
+    Compressed streams are returned in binary mode and decoded by the XML parser,
+    which is faster than decoding them to text first.
+    """
+    with open(path, 'rb') as _file:
+        magic = _file.read(4)
+
+    if magic[:2] == GZIP_MAGIC:
+        return gzip.open(path, 'rb')
+    elif magic[:3] == BZ2_MAGIC:
+        return bz2.open(path, 'rb')
+    elif magic == ZSTD_MAGIC:
+        if zstandard is None:
+            msg = "\"{}\" is zstandard compressed, but the zstandard package is not installed.".format(path)
+            raise BmCS_Exception(msg)
+        raw = open(path, 'rb')
+        try:
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)
+        except Exception as e:
+            raw.close()
+            msg = "Can't decompress \"{}\". Reason: \"{}\".".format(path, str(e))
+            raise BmCS_Exception(msg)
+    return open(path, 'rt', encoding='utf8')
+
+
+def _keep_citation(citation_status, journal_nlmid, journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids):
+    """
+    Decide if a citation should be processed, depending on the filtering flags
+    """
+    # Run on everything in a file:
+    if predict_all:
+        return True
+    # Make predictions for only selectively indexed journals
+    # that do not have a MEDLINE and PubMed-not-MEDLINE status yet.
+    # Citations that do not meet this criteria will not be processed,
+    # nor will citations from misindexed journals if
+    # --no-journal-drop is included
+    elif not predict_medline and (citation_status != "MEDLINE" and citation_status != "PubMed-not-MEDLINE"):
+        if journal_nlmid in selectively_indexed_ids:
+            if journal_drop:
+                return journal_nlmid not in misindexed_ids
+            return True
+    # Otherwise, make predictions for citations not
+    # from selectively indexed journals
+    # that HAVE a MEDLINE status
+    # Citations that do not meet this criteria not be processed
+    # This option is exclusively for running on everything not selectively indexed,
+    # therefore the option --no-journal-drop has no effect
+    elif predict_medline and citation_status == "MEDLINE":
+        return journal_nlmid not in selectively_indexed_ids
+    return False
+
+
 def _construct_citation_dict(citation_data):
     pmid, title, abstract, affiliations, journal_nlmid, pub_year, _, pub_type_list = citation_data
     _dict = { 
@@ -115,6 +280,17 @@ def _construct_citation_dict(citation_data):
     return _dict
        
       
+def _extract_filter_data(medline_citation_node):
+    """
+    Extract only the fields needed for filtering: indexing status and journal id
+    """
+
+    citation_status = medline_citation_node.attrib['Status'].strip()
+    journal_nlmid_node = medline_citation_node.find('MedlineJournalInfo/NlmUniqueID')
+    journal_nlmid = journal_nlmid_node.text.strip() if journal_nlmid_node is not None else ''
+    return citation_status, journal_nlmid
+
+
 def _extract_citation_data(medline_citation_node):
     """
     Function to read XML and extract citation information
@@ -174,9 +350,13 @@ def _extract_citation_data(medline_citation_node):
     return pmid, title, abstract, affiliations, journal_nlmid, pub_year, citation_status, pub_type_list
 
 
+@lru_cache(maxsize=4096)
 def _extract_year_from_medlinedate(medlinedate_text):
     """
     Parse year from Medline date field
+
+    The same MedlineDate strings repeat heavily within a file,
+    so results are memoized.
     """
 
     pub_year = medlinedate_text[:4]
@@ -189,6 +369,7 @@ def _extract_year_from_medlinedate(medlinedate_text):
             pub_year = int(pub_year)
         else:
             try:
+                from dateutil.parser import parse
                 pub_year = parse(medlinedate_text, fuzzy=True).date().year
             except ValueError:
                 pub_year = None
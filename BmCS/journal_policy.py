@@ -0,0 +1,133 @@
+"""
+Module for journal policy
+
+The selectively indexed, misindexed and group journal lists in the config files
+are compiled once into hashed sets, and each NLM journal id is given a group and
+group thresholds. Per-citation journal decisions are then O(1),
+and can be evaluated for a whole batch of journal ids as arrays.
+"""
+
+import json
+
+import numpy as np
+
+from .resources import resource_filename
+from .thresholds import *
+
+
+# Group indices. Journals in no group use the default thresholds.
+GROUP_DEFAULT = 0
+GROUP_SCIENCE = 1
+GROUP_JURISPRUDENCE = 2
+GROUP_NAMES = ['default', 'science', 'jurisprudence']
+
+# Thresholds for each group, indexed by group index
+COMBINED_GROUP_THRESHOLDS = np.array([COMBINED_THRESH, SCIENCE_THRESH, JURISPRUDENCE_THRESH])
+VOTING_GROUP_THRESHOLDS = np.array([VOTING_THRESH, VOTING_SCIENCE_THRESH, VOTING_JURISPRUDENCE_THRESH])
+CNN_GROUP_THRESHOLDS = np.array([CNN_THRESH, CNN_SCIENCE_THRESH, CNN_JURISPRUDENCE_THRESH])
+
+
+class JournalPolicy(object):
+    """
+    Compiled journal lists, shared by the parser, threshold adjustment and tests
+    """
+
+    def __init__(self, selectively_indexed_ids=(), misindexed_ids=(), group_ids=None):
+        if group_ids is None:
+            group_ids = {}
+
+        self.selectively_indexed_ids = frozenset(selectively_indexed_ids)
+        self.misindexed_ids = frozenset(misindexed_ids)
+        self.group_ids = {group: frozenset(ids) for group, ids in group_ids.items()}
+
+        # Science is checked before jurisprudence when thresholds are adjusted,
+        # so it takes precedence for a journal in both groups
+        self._group_index = {}
+        for journal_id in self.group_ids.get('jurisprudence', ()):
+            self._group_index[journal_id] = GROUP_JURISPRUDENCE
+        for journal_id in self.group_ids.get('science', ()):
+            self._group_index[journal_id] = GROUP_SCIENCE
+
+    @classmethod
+    def from_files(cls, selectively_indexed_id_path, misindexed_id_path, group_id_path):
+        """
+        Build the policy from the three json config files
+        """
+
+        with open(selectively_indexed_id_path, "r") as f:
+            selectively_indexed_ids = json.load(f)
+
+        with open(misindexed_id_path, "r") as f:
+            misindexed_ids = json.load(f)['misindexed_ids']
+
+        with open(group_id_path, "r") as f:
+            group_ids = json.load(f)
+
+        return cls(selectively_indexed_ids, misindexed_ids, group_ids)
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build the policy from the config files included with the package
+        """
+
+        return cls.from_files(
+                resource_filename(__name__, "config/selectively_indexed_id_mapping.json"),
+                resource_filename(__name__, "config/misindexed_journal_ids.json"),
+                resource_filename(__name__, "config/group_ids.json"))
+
+    def is_selectively_indexed(self, journal_id):
+        return journal_id in self.selectively_indexed_ids
+
+    def is_misindexed(self, journal_id):
+        return journal_id in self.misindexed_ids
+
+    def group_index(self, journal_id):
+        return self._group_index.get(journal_id, GROUP_DEFAULT)
+
+    def group_indices(self, journal_ids):
+        """
+        Group index of each journal id, as an int8 array
+        """
+
+        group_index = self._group_index
+        return np.fromiter((group_index.get(journal_id, GROUP_DEFAULT) for journal_id in journal_ids), dtype=np.int8, count=len(journal_ids))
+
+    def coded_group_indices(self, journal_codes, journal_vocab):
+        """
+        Group index of each journal of a CitationBatch, given as codes into its journal vocabulary,
+        looked up once per distinct journal
+        """
+
+        return self.group_indices(journal_vocab)[journal_codes]
+
+    def selectively_indexed_mask(self, journal_ids):
+        selectively_indexed_ids = self.selectively_indexed_ids
+        return np.fromiter((journal_id in selectively_indexed_ids for journal_id in journal_ids), dtype=bool, count=len(journal_ids))
+
+    def misindexed_mask(self, journal_ids):
+        misindexed_ids = self.misindexed_ids
+        return np.fromiter((journal_id in misindexed_ids for journal_id in journal_ids), dtype=bool, count=len(journal_ids))
+
+    def combined_thresholds(self, journal_ids):
+        """
+        Group threshold on the combined prediction for each journal id
+        """
+
+        return COMBINED_GROUP_THRESHOLDS[self.group_indices(journal_ids)]
+
+    def voting_thresholds(self, journal_ids):
+        return VOTING_GROUP_THRESHOLDS[self.group_indices(journal_ids)]
+
+    def cnn_thresholds(self, journal_ids):
+        return CNN_GROUP_THRESHOLDS[self.group_indices(journal_ids)]
+
+
+def as_journal_policy(group_ids):
+    """
+    Accept either a JournalPolicy or the raw group_ids dictionary from config/group_ids.json
+    """
+
+    if isinstance(group_ids, JournalPolicy):
+        return group_ids
+    return JournalPolicy(group_ids=group_ids)
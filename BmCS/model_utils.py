@@ -7,29 +7,21 @@ adjusting in-scope predictions, and adjusting predictions for publication type.
 
 import os
 import json
+import re
 
 import numpy as np
-from pathlib import Path
-import time
-from pkg_resources import resource_string, resource_filename
 
-import tensorflow.keras.backend as K
-from tensorflow.keras.models import model_from_json
-
-import joblib
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.pipeline import Pipeline, FeatureUnion
-from sklearn.metrics import classification_report
-
-from .embedding_custom import EmbeddingWithDropout
+from .resources import resource_filename
 from .thresholds import *
-from . import item_select
-from .publication_types import pub_strings, pub_types
+from .publication_types import default_rules
+from .journal_policy import as_journal_policy, COMBINED_GROUP_THRESHOLDS
+from .citation_batch import as_citation_batch
+from .bmcs_scilearn_model import predict_proba_chunked, SCORING_CHUNK_SIZE
 
 from .bmcs_exceptions import BmCS_Exception
 
 
-def run_CNN(CNN_path, X):
+def run_CNN(CNN_path, X, backend="tensorflow", length_buckets=False, precision="float32"):
     """
     load the CNN and return predictions
     """
@@ -40,6 +32,16 @@ def run_CNN(CNN_path, X):
     with open(model_path, 'rt') as model_json_file:
         model_json = model_json_file.read()
 
+    if backend == "numpy":
+        from .numpy_cnn import NumpyCnn
+        return NumpyCnn.from_files(model_json, CNN_path, length_buckets, precision).predict(X).flatten()
+
+    # TensorFlow is only imported when the CNN runs on it
+    from tensorflow.keras.models import model_from_json
+    from .bmcs_cnn_model import init_tensorflow
+    from .embedding_custom import EmbeddingWithDropout
+    init_tensorflow()
+
     model = model_from_json(model_json, custom_objects={EmbeddingWithDropout.__name__: EmbeddingWithDropout})
     model.load_weights(CNN_path)
     model.compile(loss='binary_crossentropy', optimizer='adam')
@@ -48,14 +50,19 @@ def run_CNN(CNN_path, X):
     return result
 
 
-def run_voting(ensemble_path, X):
+def run_voting(ensemble_path, X, workers=1, chunk_size=SCORING_CHUNK_SIZE):
     """
     Run the voting model
+    With workers > 1, chunks of chunk_size citations are scored in parallel
     """
 
+    import joblib
+    # The pickled ensemble refers to the classes in item_select
+    from . import item_select
+
     print("Making ensemble predictions")
     model = joblib.load(ensemble_path)
-    y_probs = model.predict_proba(X)[:, 0]
+    y_probs = predict_proba_chunked(model, X, workers, chunk_size)[:, 0]
 
     return y_probs
 
@@ -74,15 +81,10 @@ def adjust_thresholds(predictions_dict, group_ids, group_thresh):
         return [2 if y > COMBINED_THRESH else 0 for y in predictions_dict['predictions']]
 
     else:
-        predictions = []
-        for y, journal_id in zip(predictions_dict['predictions'], predictions_dict['journal_ids']):
-            if journal_id in group_ids['science']:
-                predictions.append(2 if y>= SCIENCE_THRESH else 0)
-            elif journal_id in group_ids['jurisprudence']:
-                predictions.append(2 if y>= JURISPRUDENCE_THRESH else 0)
-            else:
-                predictions.append(2 if y>= COMBINED_THRESH else 0)
-        return predictions
+        # group_ids may be the raw config dictionary or a compiled JournalPolicy
+        journal_policy = as_journal_policy(group_ids)
+        thresholds = journal_policy.combined_thresholds(predictions_dict['journal_ids'])
+        return [2 if y >= thresh else 0 for y, thresh in zip(predictions_dict['predictions'], thresholds)]
 
 
 def adjust_in_scope_predictions(predictions, predictions_dict):
@@ -100,6 +102,29 @@ def adjust_in_scope_predictions(predictions, predictions_dict):
     return predictions
 
 
+def decide_labels(predictions, group_indices=None, review_mask=None):
+    """
+    Label combined predictions as adjust_thresholds, filter_pub_type and
+    adjust_in_scope_predictions do in turn, as an int8 array, without a loop per citation.
+    group_indices are the JournalPolicy group indices of the journals, for group thresholds,
+    or None for the default threshold. review_mask marks the publication types to label 3.
+    """
+
+    predictions = np.asarray(predictions)
+    if group_indices is None:
+        in_scope = predictions > COMBINED_THRESH
+    else:
+        in_scope = predictions >= COMBINED_GROUP_THRESHOLDS[group_indices]
+
+    labels = np.where(in_scope, np.int8(2), np.int8(0))
+    if review_mask is not None:
+        np.copyto(labels, np.int8(3), where=review_mask)
+    # Automatic selection takes precedence over the publication types
+    np.copyto(labels, np.int8(1), where=predictions > PRECISION_THRESH)
+
+    return labels
+
+
 def combine_predictions(voting_predictions, cnn_predictions):
     """
     Combine the predictions of the two models
@@ -107,7 +132,26 @@ def combine_predictions(voting_predictions, cnn_predictions):
     return voting_predictions*cnn_predictions
 
 
-def filter_pub_type(citations, predictions):
+def cnn_needed(voting_predictions, journal_ids, group_ids, group_thresh):
+    """
+    Mark the citations whose label can depend on the CNN, for --cascade.
+    The CNN probability is at most 1, so the combined probability is at most the
+    voting probability. Citations whose voting probability does not pass the
+    combined and precision thresholds are labeled 0 (or 3 for publication types)
+    whatever the CNN predicts.
+    """
+
+    voting_predictions = np.asarray(voting_predictions)
+    if not group_thresh:
+        in_scope = voting_predictions > COMBINED_THRESH
+    else:
+        thresholds = as_journal_policy(group_ids).combined_thresholds(journal_ids)
+        in_scope = voting_predictions >= thresholds
+
+    return in_scope | (voting_predictions > PRECISION_THRESH)
+
+
+def filter_pub_type(citations, predictions, rules=None):
     """
     Filter citations based on the pubtype
 
@@ -115,15 +159,16 @@ def filter_pub_type(citations, predictions):
     Either in the title, where there will be
     string, usually at the beginning of the title,
     or at PubType status that in the xml itself.
+
+    rules is a PublicationTypeRules, by default the rules in config/publication_types.json
     """
 
-    for i, citation in enumerate(citations):
-        # Check the title for the strings that indicate the citation should sent to indexers for review
-        if any(pub_string in citation['title'].lower() for pub_string in pub_strings):
-            predictions[i] = 3
-        # Check the list of pub types as well
-        elif any(pub_type in citation['pub_type'] for pub_type in pub_types):
-            predictions[i] = 3
+    if rules is None:
+        rules = default_rules()
+
+    # Mark the citations with a title string or PubType that should be sent to indexers for review
+    for i in np.flatnonzero(rules.review_mask(citations)).tolist():
+        predictions[i] = 3
 
     return predictions
 # -----------------------------------------------------------------------------------------------------------------------
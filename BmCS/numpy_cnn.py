@@ -0,0 +1,512 @@
+"""
+Module for the NumPy CNN backend
+
+Runs the CNN forward pass in NumPy, from the same architecture JSON and HDF5
+weights file as the TensorFlow backend, without importing TensorFlow. Only
+inference is supported: dropout layers pass their input through, and batch
+normalization uses the moving mean and variance.
+
+The architecture is read as a Keras functional model. Each call of a layer in
+the model graph is compiled once, at load time, into a step of a plan, which is
+then run on each chunk of input rows. Layers may be shared, as the embedding and
+the convolutions are shared by the title and the abstract. Intermediate results
+are released after their last use.
+
+Supported layers: InputLayer, Embedding and EmbeddingWithDropout, Conv1D,
+BatchNormalization, Activation, MaxPooling1D, GlobalMaxPooling1D, Flatten,
+Concatenate, Dropout and Dense.
+
+Weights stored contiguously and uncompressed in the HDF5 file, which includes
+the 400000 x 300 word embedding matrix, are memory-mapped rather than read,
+so the pages are loaded on demand and shared by forked workers.
+
+With length_buckets, rows are sorted by their number of words and each chunk
+only computes as many positions as its longest title and abstract. Every later
+position holds the padding index, so its embedding, and the output of each
+convolution window that only covers padding, is the same for every row and
+position. These constant tails are computed once per chunk and stand in for the
+padded positions in the pooling layers, which gives the same result as running
+the full 64 and 448 positions, to within float32 rounding. The rows are
+returned in their original order.
+
+The word embedding table holds almost all of the weights. With precision
+float16 it is stored in half precision, and with int8 it is quantized with one
+scale per word: each row is divided by its largest absolute value over 127 and
+rounded. Looked up rows are converted back to float32, and all the arithmetic
+is in float32. The reduced tables are built when the model is loaded and are
+private to the process, unlike the memory-mapped float32 table.
+"""
+
+import collections
+import json
+
+import numpy as np
+
+from .bmcs_exceptions import BmCS_Exception
+from .preprocess_CNN_data import PADDING_INDEX
+
+
+# Rows per forward pass. Bounds the memory used by the embedded abstracts.
+PREDICT_BATCH_SIZE = 128
+
+PRECISIONS = ('float32', 'float16', 'int8')
+
+# Embedding rows converted per step when building a reduced precision table
+_QUANTIZE_CHUNK_ROWS = 65536
+
+# A batch of sequences of num_steps positions, of which only the first prefix.shape[1]
+# are stored. Every later position of every row holds tail.
+_Padded = collections.namedtuple('_Padded', ['prefix', 'num_steps', 'tail'])
+
+
+class NumpyCnn(object):
+    """
+    Compiled forward pass of a Keras functional model.
+    predict takes the same input dictionary as the Keras model.
+    """
+
+    def __init__(self, model_config, weights, length_buckets=False, precision='float32'):
+        if model_config.get('class_name') not in ('Functional', 'Model'):
+            msg = "NumPy CNN backend expects a functional model, not \"{}\".".format(model_config.get('class_name'))
+            raise BmCS_Exception(msg)
+
+        if precision not in PRECISIONS:
+            msg = "Unknown CNN precision \"{}\". Expected one of {}.".format(precision, ", ".join(PRECISIONS))
+            raise BmCS_Exception(msg)
+
+        config = model_config['config']
+        layers = {layer['config']['name']: layer for layer in config['layers']}
+        self.input_names = [name for name, _, _ in config['input_layers']]
+        # Inputs are cast to the dtype of their input layer, as in Keras
+        self._input_dtypes = {name: np.dtype(layers[name]['config'].get('dtype') or 'float32') for name in self.input_names}
+        self.length_buckets = length_buckets
+        self.precision = precision
+        layer_functions = {}
+        self._steps = []
+        planned = set()
+        consumer_classes = collections.defaultdict(set)
+
+        def plan(name, node_index):
+            key = (name, node_index)
+            if key in planned:
+                return key
+            layer = layers[name]
+            if layer['class_name'] == 'InputLayer':
+                planned.add(key)
+                return key
+
+            input_keys = []
+            for inbound in _inbound_nodes(layer)[node_index]:
+                inbound_name, inbound_node_index, tensor_index = inbound[:3]
+                if tensor_index != 0:
+                    msg = "NumPy CNN backend does not support layers with several outputs (\"{}\").".format(inbound_name)
+                    raise BmCS_Exception(msg)
+                input_keys.append(plan(inbound_name, inbound_node_index))
+                consumer_classes[(inbound_name, inbound_node_index)].add(layer['class_name'])
+
+            if name not in layer_functions:
+                layer_functions[name] = _compile_layer(layer, weights.get(name, {}), precision)
+            self._steps.append((layer_functions[name], input_keys, key))
+            planned.add(key)
+            return key
+
+        self._output_keys = [plan(name, node_index) for name, node_index, _ in config['output_layers']]
+        # plan refers to itself. Breaking the cycle frees the weights not used by the steps,
+        # e.g. the float32 table of a reduced precision embedding, without waiting for the garbage collector.
+        del plan
+
+        # Word index inputs, which can be cut short after their last word
+        self._sequence_inputs = [name for name in self.input_names
+                                 if consumer_classes[(name, 0)] and consumer_classes[(name, 0)] <= _EMBEDDING_LAYERS]
+
+        # Release each intermediate result after the last step that uses it
+        last_use = {}
+        for step_index, (_, input_keys, _) in enumerate(self._steps):
+            for input_key in input_keys:
+                last_use[input_key] = step_index
+        self._release = [[key for key, last in last_use.items() if last == step_index and key not in self._output_keys]
+                         for step_index in range(len(self._steps))]
+
+    @classmethod
+    def from_files(cls, model_json, weights_fname, length_buckets=False, precision='float32'):
+        """
+        Load from the architecture JSON, as a string, and an HDF5 weights file
+        """
+
+        return cls(json.loads(model_json), read_hdf5_weights(weights_fname), length_buckets, precision)
+
+    def predict(self, dX, batch_size=PREDICT_BATCH_SIZE, length_buckets=None):
+        """
+        Output of the model for the input dictionary, computed batch_size rows at a time.
+        Returns an array for a model with one output, otherwise a list.
+        length_buckets defaults to the value given when the model was created.
+        """
+
+        if length_buckets is None:
+            length_buckets = self.length_buckets
+        inputs = {name: np.asarray(dX[name]) for name in self.input_names}
+        num_rows = len(inputs[self.input_names[0]])
+
+        order, lengths = None, {}
+        if length_buckets and self._sequence_inputs:
+            lengths = {name: sequence_lengths(inputs[name]) for name in self._sequence_inputs}
+            order = np.argsort(sum(lengths.values()), kind='stable')
+
+        outputs = None
+        for start in range(0, max(num_rows, 1), batch_size):
+            rows = slice(start, min(start + batch_size, num_rows)) if order is None else order[start:start + batch_size]
+            chunk_inputs = {}
+            for name in self.input_names:
+                values = inputs[name][rows].astype(self._input_dtypes[name], copy=False)
+                if name in lengths:
+                    num_words = int(lengths[name][rows].max(initial=0))
+                    values = _padded(values[:, :num_words], values.shape[1], np.array(PADDING_INDEX, dtype=values.dtype))
+                chunk_inputs[name] = values
+
+            chunk_outputs = self._run(chunk_inputs)
+            if outputs is None:
+                outputs = [np.empty((num_rows,) + chunk_output.shape[1:], dtype=chunk_output.dtype) for chunk_output in chunk_outputs]
+            for output, chunk_output in zip(outputs, chunk_outputs):
+                output[rows] = chunk_output
+        return outputs[0] if len(outputs) == 1 else outputs
+
+    def _run(self, inputs):
+        values = {(name, 0): value for name, value in inputs.items()}
+        for (function, input_keys, key), release in zip(self._steps, self._release):
+            values[key] = function([values[input_key] for input_key in input_keys])
+            for released_key in release:
+                del values[released_key]
+        return [_full(values[key]) for key in self._output_keys]
+
+
+def sequence_lengths(word_indices):
+    """
+    Number of positions of each row up to and including the last one that is not padding
+    """
+
+    is_word = word_indices != PADDING_INDEX
+    return np.where(is_word.any(axis=1), word_indices.shape[1] - np.argmax(is_word[:, ::-1], axis=1), 0)
+
+
+def read_hdf5_weights(weights_fname):
+    """
+    Weights of each layer in a Keras HDF5 file, saved by save_weights or save,
+    as {layer name: {weight name: array}}, with weight names like "kernel" and "gamma"
+    """
+
+    import h5py
+
+    weights = {}
+    with h5py.File(weights_fname, 'r') as h5_file:
+        group = h5_file['model_weights'] if 'model_weights' in h5_file else h5_file
+        if 'layer_names' not in group.attrs:
+            msg = "\"{}\" is not a Keras HDF5 weights file.".format(weights_fname)
+            raise BmCS_Exception(msg)
+
+        for layer_name in _decode_names(group.attrs['layer_names']):
+            layer_group = group[layer_name]
+            layer_weights = weights[layer_name] = {}
+            for weight_name in _decode_names(layer_group.attrs['weight_names']):
+                # e.g. "conv1d/kernel:0"
+                short_name = weight_name.rsplit('/', 1)[-1].split(':', 1)[0]
+                layer_weights[short_name] = _read_dataset(weights_fname, layer_group[weight_name])
+    return weights
+
+
+def _read_dataset(weights_fname, dataset):
+    offset = dataset.id.get_offset()
+    if offset is not None and dataset.chunks is None and dataset.compression is None and dataset.dtype.isnative and dataset.size > 0:
+        return np.asarray(np.memmap(weights_fname, dtype=dataset.dtype, mode='r', offset=offset, shape=dataset.shape))
+    return dataset[()]
+
+
+def _decode_names(names):
+    return [name.decode('utf8') if isinstance(name, bytes) else str(name) for name in names]
+
+
+def _inbound_nodes(layer):
+    nodes = layer.get('inbound_nodes', [])
+    for node in nodes:
+        if not isinstance(node, list):
+            msg = "NumPy CNN backend can't read the inbound nodes of layer \"{}\".".format(layer['config']['name'])
+            raise BmCS_Exception(msg)
+    return nodes
+
+
+_EMBEDDING_LAYERS = {'Embedding', 'EmbeddingWithDropout'}
+
+
+def _compile_layer(layer, weights, precision='float32'):
+    """
+    Function from the list of input arrays of a layer call to its output array.
+    Inputs may be _Padded. Layers that are applied position by position, and the
+    pooling layers, keep them _Padded; other layers receive them as full arrays.
+    """
+
+    class_name, config = layer['class_name'], layer['config']
+    try:
+        if class_name in _EMBEDDING_LAYERS:
+            # Dropout of the embedding is only applied in training
+            embed = embedding_lookup(weights['embeddings'], precision)
+            return lambda inputs: _map_padded(embed, inputs[0])
+
+        elif class_name == 'Conv1D':
+            _check_config(layer, padding='valid', strides=[1], dilation_rate=[1], data_format='channels_last')
+            kernel = weights['kernel']
+            width, _, filters = kernel.shape
+            # All the kernel offsets in one matrix product, summed after shifting
+            stacked_kernel = np.ascontiguousarray(np.concatenate(list(kernel), axis=1))
+            bias = weights.get('bias') if config.get('use_bias', True) else None
+            activation = _activation(layer)
+            convolve = lambda x: activation(_conv1d(x, stacked_kernel, width, filters, bias))
+            return lambda inputs: _conv1d_padded(convolve, width, inputs[0])
+
+        elif class_name == 'BatchNormalization':
+            axis = config['axis']
+            axis = axis[0] if isinstance(axis, list) else axis
+            inverse = 1. / np.sqrt(weights['moving_variance'] + np.float32(config['epsilon']))
+            if config.get('scale', True):
+                inverse = inverse * weights['gamma']
+            shift = -weights['moving_mean'] * inverse
+            if config.get('center', True):
+                shift = shift + weights['beta']
+            inverse, shift = inverse.astype(np.float32), shift.astype(np.float32)
+
+            def batch_normalization(inputs):
+                x = inputs[0]
+                # Position by position if normalizing over the last axis
+                if isinstance(x, _Padded) and axis in (-1, x.prefix.ndim - 1):
+                    return _map_padded(lambda y: _batch_normalization(y, -1, inverse, shift), x)
+                return _batch_normalization(_full(x), axis, inverse, shift)
+            return batch_normalization
+
+        elif class_name == 'Activation':
+            activation = _activation(layer)
+            return lambda inputs: _map_padded(lambda x: activation(x.copy()), inputs[0])
+
+        elif class_name == 'MaxPooling1D':
+            _check_config(layer, padding='valid', data_format='channels_last')
+            pool_size, strides = config['pool_size'][0], (config['strides'] or config['pool_size'])[0]
+            return lambda inputs: _max_pooling1d_padded(inputs[0], pool_size, strides)
+
+        elif class_name == 'GlobalMaxPooling1D':
+            _check_config(layer, data_format='channels_last')
+            keepdims = config.get('keepdims', False)
+            return lambda inputs: _global_max_pooling1d_padded(inputs[0], keepdims)
+
+        elif class_name == 'Flatten':
+            def flatten(inputs):
+                x = _full(inputs[0])
+                return x.reshape(len(x), int(np.prod(x.shape[1:])))
+            return flatten
+
+        elif class_name == 'Concatenate':
+            axis = config.get('axis', -1)
+            return lambda inputs: np.concatenate([_full(x) for x in inputs], axis=axis)
+
+        elif class_name in ('Dropout', 'SpatialDropout1D'):
+            return lambda inputs: inputs[0]
+
+        elif class_name == 'Dense':
+            kernel = weights['kernel']
+            bias = weights.get('bias') if config.get('use_bias', True) else None
+            activation = _activation(layer)
+            return lambda inputs: activation(_dense(_full(inputs[0]), kernel, bias))
+
+    except KeyError as e:
+        msg = "Missing weight or option {} for layer \"{}\".".format(str(e), config['name'])
+        raise BmCS_Exception(msg)
+
+    msg = "NumPy CNN backend does not support {} layers (\"{}\").".format(class_name, config['name'])
+    raise BmCS_Exception(msg)
+
+
+def embedding_lookup(embeddings, precision='float32'):
+    """
+    Function from word indices to float32 embeddings, from a table stored in the given precision
+    """
+
+    if precision == 'float32':
+        return lambda x: np.take(embeddings, x.astype(np.int32, copy=False), axis=0)
+
+    elif precision == 'float16':
+        table = np.empty(embeddings.shape, dtype=np.float16)
+        for start in range(0, len(embeddings), _QUANTIZE_CHUNK_ROWS):
+            table[start:start + _QUANTIZE_CHUNK_ROWS] = embeddings[start:start + _QUANTIZE_CHUNK_ROWS]
+        return lambda x: np.take(table, x.astype(np.int32, copy=False), axis=0).astype(np.float32)
+
+    table, scales = quantize_int8(embeddings)
+
+    def lookup(x):
+        x = x.astype(np.int32, copy=False)
+        out = np.take(table, x, axis=0).astype(np.float32)
+        out *= np.take(scales, x)[..., np.newaxis]
+        return out
+    return lookup
+
+
+def quantize_int8(embeddings):
+    """
+    int8 table and float32 scale of each row, such that row = table row * scale, to within half a step
+    """
+
+    table = np.empty(embeddings.shape, dtype=np.int8)
+    scales = np.empty(len(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), _QUANTIZE_CHUNK_ROWS):
+        rows = np.asarray(embeddings[start:start + _QUANTIZE_CHUNK_ROWS], dtype=np.float32)
+        row_scales = np.abs(rows).max(axis=1) / np.float32(127)
+        # All-zero rows
+        row_scales[row_scales == 0] = 1
+        table[start:start + len(rows)] = np.rint(rows / row_scales[:, np.newaxis])
+        scales[start:start + len(rows)] = row_scales
+    return table, scales
+
+
+def _padded(prefix, num_steps, tail):
+    """
+    _Padded, or the prefix itself if it has every position
+    """
+
+    if prefix.shape[1] >= num_steps:
+        return prefix[:, :num_steps]
+    return _Padded(prefix, num_steps, tail)
+
+
+def _full(x):
+    """
+    Every position of x, as an array
+    """
+
+    if not isinstance(x, _Padded):
+        return x
+    return _extend(x, x.num_steps - x.prefix.shape[1])
+
+
+def _extend(x, num_tail_steps):
+    """
+    The prefix of x followed by num_tail_steps copies of the tail
+    """
+
+    tail = np.broadcast_to(x.tail, (len(x.prefix), num_tail_steps) + x.tail.shape)
+    return np.concatenate([x.prefix, tail.astype(x.prefix.dtype, copy=False)], axis=1)
+
+
+def _map_padded(function, x):
+    """
+    Apply a position by position function to an array or to the prefix and tail of a _Padded
+    """
+
+    if not isinstance(x, _Padded):
+        return function(x)
+    # The tail as a batch of one row of one position
+    tail = function(x.tail[np.newaxis, np.newaxis])[0, 0]
+    return _Padded(function(x.prefix), x.num_steps, tail)
+
+
+def _conv1d_padded(convolve, width, x):
+    if not isinstance(x, _Padded):
+        return convolve(x)
+
+    num_steps = x.num_steps - width + 1
+    # Windows that start in the prefix and end in the tail
+    prefix = convolve(_extend(x, min(width - 1, x.num_steps - x.prefix.shape[1])))
+    # Windows that only cover the tail
+    tail = convolve(np.broadcast_to(x.tail, (1, width) + x.tail.shape))[0, 0]
+    return _padded(prefix, num_steps, tail)
+
+
+def _max_pooling1d_padded(x, pool_size, strides):
+    if not isinstance(x, _Padded):
+        return _max_pooling1d(x, pool_size, strides)
+
+    num_windows = (x.num_steps - pool_size) // strides + 1
+    # Windows that start in the prefix. The others only cover the tail, and their maximum is the tail.
+    num_prefix_windows = min(num_windows, -(-x.prefix.shape[1] // strides))
+    if num_prefix_windows == 0:
+        return _Padded(x.prefix[:, :0, :], num_windows, x.tail)
+    window_end = (num_prefix_windows - 1) * strides + pool_size
+    prefix = _max_pooling1d(_extend(x, max(window_end - x.prefix.shape[1], 0)), pool_size, strides)
+    return _padded(prefix, num_windows, x.tail)
+
+
+def _global_max_pooling1d_padded(x, keepdims):
+    if isinstance(x, _Padded):
+        out = np.maximum(x.prefix.max(axis=1, initial=-np.inf), x.tail).astype(x.prefix.dtype, copy=False)
+    else:
+        out = x.max(axis=1)
+    return out[:, np.newaxis] if keepdims else out
+
+
+def _check_config(layer, **expected):
+    for option, value in expected.items():
+        if option in layer['config'] and layer['config'][option] != value:
+            msg = "NumPy CNN backend only supports {}={} for {} layers (\"{}\").".format(
+                    option, value, layer['class_name'], layer['config']['name'])
+            raise BmCS_Exception(msg)
+
+
+def _activation(layer):
+    """
+    Activation of a layer, applied in place to a new array
+    """
+
+    name = layer['config'].get('activation', 'linear')
+    if name == 'linear':
+        return lambda x: x
+    elif name == 'relu':
+        return lambda x: np.maximum(x, 0, out=x)
+    elif name == 'sigmoid':
+        return _sigmoid
+    elif name == 'tanh':
+        return lambda x: np.tanh(x, out=x)
+
+    msg = "NumPy CNN backend does not support the {} activation (\"{}\").".format(name, layer['config']['name'])
+    raise BmCS_Exception(msg)
+
+
+def _sigmoid(x):
+    with np.errstate(over='ignore'):
+        np.negative(x, out=x)
+        np.exp(x, out=x)
+    x += 1
+    return np.reciprocal(x, out=x)
+
+
+def _conv1d(x, stacked_kernel, width, filters, bias):
+    """
+    Valid 1D convolution with stride 1. x is (rows, steps, channels),
+    stacked_kernel is (channels, width * filters), the kernel offsets side by side.
+    """
+
+    num_rows, num_steps, num_channels = x.shape
+    out_steps = max(num_steps - width + 1, 0)
+    products = np.matmul(x.reshape(-1, num_channels), stacked_kernel).reshape(num_rows, num_steps, width * filters)
+    out = products[:, 0:out_steps, 0:filters].copy()
+    for offset in range(1, width):
+        out += products[:, offset:offset + out_steps, offset * filters:(offset + 1) * filters]
+    if bias is not None:
+        out += bias
+    return out
+
+
+def _batch_normalization(x, axis, inverse, shift):
+    shape = [1] * x.ndim
+    shape[axis] = -1
+    out = x * inverse.reshape(shape)
+    out += shift.reshape(shape)
+    return out
+
+
+def _max_pooling1d(x, pool_size, strides):
+    out_steps = (x.shape[1] - pool_size) // strides + 1
+    if strides == pool_size:
+        return x[:, :out_steps * pool_size].reshape(x.shape[0], out_steps, pool_size, x.shape[2]).max(axis=2)
+    windows = np.lib.stride_tricks.sliding_window_view(x, pool_size, axis=1)[:, :out_steps * strides:strides]
+    return windows.max(axis=-1)
+
+
+def _dense(x, kernel, bias):
+    out = np.matmul(x, kernel)
+    if bias is not None:
+        out += bias
+    return out
@@ -0,0 +1,195 @@
+"""
+Module for the pipelined micro-batch mode
+
+Parsing, preprocessing, model scoring, threshold decisions and output writing
+run as stages, each on its own thread, connected by bounded queues of
+micro-batches of citations. The XML is read incrementally, so memory use is set
+by the micro-batch size and the queue depth rather than the size of the file,
+and the stages overlap in time: the next micro-batch is parsed and tokenized
+while the CNN runs on the current one. With the parsed citation cache on, the
+whole file is parsed, or loaded from the cache, before it is split into
+micro-batches, so the parsed citations of the whole file are held in memory.
+
+Every step works on each citation independently, and the micro-batches are
+made of whole CNN batches, so the output file is the same as from scoring the
+whole file at once. With --length-buckets, the CNN batches are sorted within each
+micro-batch, so the probabilities are the same to within float32 rounding. If a stage fails, the other stages are
+stopped and the error is raised in the calling thread.
+"""
+
+import queue
+import threading
+
+import numpy as np
+
+from .citation_batch import CitationBatch
+from .daily_update_file_parser import iterparse_update_file
+from .preprocess_voting_data import preprocess_data
+from .prediction_cache import citation_keys, prediction_cache_from_args
+from .prediction_writer import PredictionWriter, predictions_file_name
+
+
+DEFAULT_PIPELINE_BATCH_SIZE = 1024
+DEFAULT_PIPELINE_DEPTH = 2
+
+# Micro-batch sizes are a multiple of the CNN batch sizes, 32 rows for Keras predict and
+# numpy_cnn.PREDICT_BATCH_SIZE, so that the CNN runs on the same batches as for the whole file
+PIPELINE_BATCH_MULTIPLE = 128
+
+# Seconds between checks for a stopped pipeline, while waiting on a full queue
+_STOP_POLL_SECONDS = 0.1
+
+# Marks the end of a queue
+_END = object()
+
+
+def run_pipeline(XML_path, o_sci_model, o_cnn_model, journal_policy, args, file_name=None):
+    """
+    Score an update file in micro-batches of args.pipeline_batch_size citations,
+    and write the predictions as save_predictions does, to one file that appears when all are written
+    """
+
+    # Imported here, as BmCS imports this module
+    from .BmCS import cnn_input, decide_predictions, model_fingerprint
+
+    if file_name is None:
+        file_name = predictions_file_name(None, args.output_format)
+
+    fingerprint = model_fingerprint(o_sci_model, o_cnn_model, args)
+    # Each stage that uses the prediction cache has its own connection, only used by that stage's thread
+    lookup_cache = prediction_cache_from_args(args, check_same_thread=False)
+    store_cache = prediction_cache_from_args(args, check_same_thread=False)
+
+    def prepare(citations):
+        # Only citations that are not in the prediction cache are preprocessed and scored
+        voting_predictions = np.empty(len(citations), dtype=np.float64)
+        cnn_predictions = np.empty(len(citations), dtype=np.float32)
+        missing = np.arange(len(citations))
+        keys = None
+        if lookup_cache is not None:
+            keys = citation_keys(citations, fingerprint)
+            voting_predictions, cnn_predictions, missing = lookup_cache.lookup(keys)
+        missing_citations = citations.take(missing)
+        voting_citations, _, _ = preprocess_data(missing_citations)
+        CNN_citations = cnn_input(missing_citations, args) if len(missing) > 0 else None
+        return citations, keys, voting_predictions, cnn_predictions, missing, voting_citations, CNN_citations
+
+    def score(prepared):
+        citations, keys, voting_predictions, cnn_predictions, missing, voting_citations, CNN_citations = prepared
+        if len(missing) > 0:
+            missing_voting_predictions = o_sci_model.process(voting_citations)
+            missing_cnn_predictions = o_cnn_model.process(CNN_citations)
+            voting_predictions[missing] = missing_voting_predictions
+            cnn_predictions[missing] = missing_cnn_predictions
+            if store_cache is not None:
+                store_cache.store([keys[i] for i in missing.tolist()], missing_voting_predictions, missing_cnn_predictions)
+        return citations, voting_predictions, cnn_predictions
+
+    def decide(scored):
+        return decide_predictions(*scored, journal_policy, args, verbose=False)
+
+    # Once for the run, rather than for every micro-batch
+    print("Combining predictions")
+    if args.pub_type_filter:
+        print("Marking specified Publication Types")
+    try:
+        stages = threaded(micro_batches(XML_path, args, journal_policy), args.pipeline_depth)
+        for function in [prepare, score, decide]:
+            stages = threaded(stages, args.pipeline_depth, function)
+        try:
+            with PredictionWriter("{0}{1}".format(args.destination, file_name), args.output_format) as writer:
+                for adjusted_predictions, prediction_dict, pmids in stages:
+                    writer.write(adjusted_predictions, prediction_dict, pmids)
+        finally:
+            stages.close()
+        if lookup_cache is not None:
+            print(lookup_cache.summary())
+    finally:
+        for cache in [lookup_cache, store_cache]:
+            if cache is not None:
+                cache.close()
+
+
+def micro_batches(XML_path, args, journal_policy):
+    """
+    Parse and filter an update file, as parse_citations does, into CitationBatches of args.pipeline_batch_size citations.
+    The file is read incrementally, unless the parsed citation cache is on.
+    """
+
+    from .BmCS import parse_citations
+    from .citation_cache import cache_from_args
+
+    batch_size = args.pipeline_batch_size
+    # Cached files are loaded whole, and only split up
+    if cache_from_args(args) is not None:
+        citations = parse_citations(XML_path, args, journal_policy)
+        for start in range(0, len(citations), batch_size):
+            yield citations.take(np.arange(start, min(start + batch_size, len(citations))))
+        return
+
+    batch = []
+    for citation in iterparse_update_file(
+            XML_path, args.journal_drop, args.predict_medline,
+            journal_policy.selectively_indexed_ids, args.predict_all, journal_policy.misindexed_ids):
+        batch.append(citation)
+        if len(batch) == batch_size:
+            yield CitationBatch.from_citations(batch)
+            batch = []
+    if len(batch) > 0:
+        yield CitationBatch.from_citations(batch)
+
+
+def threaded(iterable, depth, function=None):
+    """
+    Iterate over iterable, applying function to each item if given, on a background thread
+    which runs ahead by at most depth items.
+
+    An exception in the thread is raised to the caller. Closing the returned
+    generator stops the thread, and closes iterable, so a chain of threaded
+    stages is stopped from its end.
+    """
+
+    items = queue.Queue(maxsize=depth)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                items.put(item, timeout=_STOP_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if function is not None:
+                    item = function(item)
+                if not put((item, None)):
+                    return
+            put((_END, None))
+        except BaseException as e:
+            put((_END, e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+
+    def consume():
+        try:
+            while True:
+                item, error = items.get()
+                if item is _END:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            stopped.set()
+            thread.join()
+
+    return consume()
@@ -0,0 +1,150 @@
+"""
+Module for the accuracy check of reduced-precision CNN scoring
+
+The float16 and int8 embedding tables change the CNN probabilities slightly,
+so a citation close to a threshold can change decision. A reduced precision is
+only used for scoring after a --validation or --test run with it has passed:
+every recall and precision of that run within --tolerance of the same run
+with float32. Passed checks are recorded in a JSON file, keyed by the content of
+the model files and the options that change the metrics. The file is
+--precision-record, or precision_checks.json in the user's cache directory, or
+in --dest if that directory is not writable: the model files may be on a
+read-only share.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+from .bmcs_exceptions import BmCS_Exception
+from .citation_cache import file_fingerprint
+
+
+FULL_PRECISION = 'float32'
+
+RECORD_NAME = "precision_checks.json"
+
+
+def default_record_path():
+    """
+    Path of the record of passed checks in the user's cache directory, $XDG_CACHE_HOME/BmCS or ~/.cache/BmCS
+    """
+
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "BmCS", RECORD_NAME)
+
+
+def record_paths(args):
+    """
+    Paths the record of passed checks is written to, the first writable one, and read from, in order
+    """
+
+    if getattr(args, "precision_record", None) is not None:
+        return [args.precision_record]
+    return [default_record_path(), os.path.join(args.destination, RECORD_NAME)]
+
+
+def check_key(args):
+    """
+    Identifies the model files, the precision and the options that change the validation metrics
+    """
+
+    sha = hashlib.sha256()
+    for part in [file_fingerprint(args.ensemble_path), file_fingerprint(args.CNN_path), args.cnn_precision,
+                 int(args.group_thresh), int(args.journal_drop)]:
+        sha.update(str(part).encode("utf8"))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
+def metric_changes(metrics, reference_metrics):
+    """
+    Absolute change of each metric from the float32 run
+    """
+
+    return {name: abs(metrics[name] - reference_metrics[name]) for name in reference_metrics}
+
+
+def compare_metrics(metrics, reference_metrics, precision, tolerance):
+    """
+    Raise BmCS_Exception if any metric moved more than tolerance from the float32 run
+    """
+
+    changes = metric_changes(metrics, reference_metrics)
+    moved = ["{0}: {1} with {2}, {3} with {4}".format(name, metrics[name], precision, reference_metrics[name], FULL_PRECISION)
+             for name in reference_metrics if changes[name] > tolerance]
+    if len(moved) > 0:
+        msg = "CNN precision {0} refused, metrics moved more than the tolerance {1}:\n{2}".format(precision, tolerance, "\n".join(moved))
+        raise BmCS_Exception(msg)
+    return max(changes.values())
+
+
+def _read_records(path):
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _write_records(path, records):
+    directory = os.path.dirname(path)
+    if directory != "":
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(records, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def record_check(args, dataset, metrics, reference_metrics):
+    """
+    Record a passed check, so the precision can be used for scoring with the same model files.
+    Returns the path of the record.
+    """
+
+    record = {
+        'precision': args.cnn_precision,
+        'dataset': dataset,
+        'max_change': max(metric_changes(metrics, reference_metrics).values()),
+        'metrics': metrics,
+        'reference_metrics': reference_metrics,
+        'date': datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+    errors = []
+    for path in record_paths(args):
+        try:
+            records = _read_records(path)
+            records[check_key(args)] = record
+            _write_records(path, records)
+            return path
+        except (OSError, ValueError) as e:
+            errors.append("\"{0}\": {1}".format(path, e))
+    msg = "Could not record the CNN precision check in {0}. Set --precision-record to a writable file.".format(", ".join(errors))
+    raise BmCS_Exception(msg)
+
+
+def require_checked_precision(args):
+    """
+    Raise BmCS_Exception unless the CNN precision is float32, or passed a check within --tolerance with these model files
+    """
+
+    if args.cnn_precision == FULL_PRECISION:
+        return
+
+    record = None
+    for path in record_paths(args):
+        try:
+            record = _read_records(path).get(check_key(args))
+        except (OSError, ValueError):
+            continue
+        if record is not None:
+            break
+    if record is None:
+        msg = ("CNN precision {0} has not been checked with these models and options. "
+               "Run with --validation --cnn-backend numpy --cnn-precision {0} first.").format(args.cnn_precision)
+        raise BmCS_Exception(msg)
+    if record['max_change'] > args.tolerance:
+        msg = "CNN precision {0} refused, metrics moved by up to {1} in the last check, more than the tolerance {2}.".format(
+            args.cnn_precision, record['max_change'], args.tolerance)
+        raise BmCS_Exception(msg)
@@ -0,0 +1,176 @@
+"""
+Module for the persistent prediction cache
+
+A PMID appears in many daily update files as its status changes, usually with
+the same title, abstract, affiliations, journal and year. The cache stores the
+voting and CNN probabilities of each citation in an SQLite database, keyed by
+a hash of those model inputs and a fingerprint of the loaded model files, so
+only citations that have not been scored by the same models are run through them.
+
+Entries unused for max_age_days are removed, and beyond max_entries the least
+recently used entries are removed first. Counting the entries scans the whole
+table, so eviction runs when the cache is closed, and during long runs once
+EVICT_INTERVAL_ROWS rows have been stored since the last eviction, rather than
+on every store.
+"""
+
+import hashlib
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from .bmcs_exceptions import BmCS_Exception
+from .citation_batch import as_citation_batch
+
+
+# Changes to the key format must change this
+KEY_VERSION = 1
+
+DEFAULT_MAX_ENTRIES = 10000000
+DEFAULT_MAX_AGE_DAYS = 365
+
+# Rows stored between evictions. The cache may go over max_entries by up to this many rows until the next eviction.
+EVICT_INTERVAL_ROWS = 100000
+
+# Keys per query, below the SQLite host parameter limit
+_QUERY_CHUNK_SIZE = 900
+
+_SECONDS_PER_DAY = 24 * 60 * 60
+
+
+def citation_keys(citations, model_fingerprint):
+    """
+    Cache key of each citation: a hash of the model fingerprint and every field the models use
+    """
+
+    citations = as_citation_batch(citations)
+    prefix = "{0}\x1e{1}".format(KEY_VERSION, model_fingerprint)
+    journal_ids = citations.journal_ids
+    keys = []
+    for i, pub_year in enumerate(citations.pub_years.tolist()):
+        fields = (prefix, citations.titles[i], citations.abstracts[i], citations.affiliations[i], journal_ids[i], str(pub_year))
+        keys.append(hashlib.sha256("\x1f".join(fields).encode('utf8')).digest()[:16])
+    return keys
+
+
+class PredictionCache(object):
+    """
+    SQLite store of voting and CNN probabilities, with hit rate statistics
+    """
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, max_age_days=DEFAULT_MAX_AGE_DAYS, check_same_thread=True):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.evict_interval_rows = EVICT_INTERVAL_ROWS
+        self.hits = 0
+        self._rows_since_evict = 0
+        self.misses = 0
+
+        try:
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+            # Batch workers may share the database, so wait for locks rather than failing.
+            # Without check_same_thread, the caller makes sure that one thread at a time uses the cache.
+            self._connection = sqlite3.connect(path, timeout=60, check_same_thread=check_same_thread)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                    "CREATE TABLE IF NOT EXISTS predictions "
+                    "(key BLOB PRIMARY KEY, voting REAL NOT NULL, cnn REAL NOT NULL, last_used INTEGER NOT NULL)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS predictions_last_used ON predictions (last_used)")
+            self._connection.commit()
+        except (OSError, sqlite3.Error) as e:
+            msg = "Can't open prediction cache \"{}\". Reason: \"{}\".".format(path, str(e))
+            raise BmCS_Exception(msg)
+
+    def lookup(self, keys):
+        """
+        Return the cached voting and CNN predictions, NaN where missing,
+        and the indices of the keys that were not found
+        """
+
+        found = {}
+        for start in range(0, len(keys), _QUERY_CHUNK_SIZE):
+            chunk = keys[start:start + _QUERY_CHUNK_SIZE]
+            query = "SELECT key, voting, cnn FROM predictions WHERE key IN ({0})".format(",".join("?" * len(chunk)))
+            for key, voting, cnn in self._connection.execute(query, chunk):
+                found[key] = (voting, cnn)
+
+        voting_predictions = np.full(len(keys), np.nan, dtype=np.float64)
+        cnn_predictions = np.full(len(keys), np.nan, dtype=np.float32)
+        missing = []
+        for i, key in enumerate(keys):
+            predictions = found.get(key)
+            if predictions is None:
+                missing.append(i)
+            else:
+                voting_predictions[i], cnn_predictions[i] = predictions
+
+        # Mark the hits as recently used
+        now = int(time.time())
+        with self._connection:
+            self._connection.executemany("UPDATE predictions SET last_used = ? WHERE key = ?", ((now, key) for key in found))
+
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        return voting_predictions, cnn_predictions, np.array(missing, dtype=np.intp)
+
+    def store(self, keys, voting_predictions, cnn_predictions):
+        now = int(time.time())
+        rows = ((key, float(voting), float(cnn), now) for key, voting, cnn in zip(keys, voting_predictions, cnn_predictions))
+        with self._connection:
+            cursor = self._connection.executemany("INSERT OR REPLACE INTO predictions (key, voting, cnn, last_used) VALUES (?, ?, ?, ?)", rows)
+        self._rows_since_evict += max(cursor.rowcount, 0)
+        if self._rows_since_evict >= self.evict_interval_rows:
+            self.evict()
+
+    def evict(self):
+        """
+        Remove entries older than max_age_days, then the least recently used beyond max_entries
+        """
+
+        with self._connection:
+            if self.max_age_days is not None:
+                oldest = int(time.time() - self.max_age_days * _SECONDS_PER_DAY)
+                self._connection.execute("DELETE FROM predictions WHERE last_used < ?", (oldest,))
+            if self.max_entries is not None:
+                num_entries = self._connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+                if num_entries > self.max_entries:
+                    self._connection.execute(
+                            "DELETE FROM predictions WHERE key IN (SELECT key FROM predictions ORDER BY last_used LIMIT ?)",
+                            (num_entries - self.max_entries,))
+        self._rows_since_evict = 0
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def hit_rate(self):
+        num_lookups = self.hits + self.misses
+        return self.hits / num_lookups if num_lookups > 0 else 0.
+
+    def summary(self):
+        return "Prediction cache: {0} hits, {1} misses, {2:.1%} hit rate".format(self.hits, self.misses, self.hit_rate())
+
+    def close(self):
+        """
+        Evict if anything was stored, and close the database
+        """
+
+        try:
+            if self._rows_since_evict > 0:
+                self.evict()
+        finally:
+            self._connection.close()
+
+
+def prediction_cache_from_args(args, check_same_thread=True):
+    """
+    PredictionCache for the command line options, or None if it is off
+    """
+
+    path = getattr(args, "prediction_cache", None)
+    if path is None:
+        return None
+    return PredictionCache(path, args.prediction_cache_max_entries, args.prediction_cache_max_age_days, check_same_thread)
@@ -0,0 +1,212 @@
+"""
+Module for writing prediction files
+
+Predictions are formatted a chunk of rows at a time, from whole columns,
+rather than one line at a time, and written to a temporary file next to the
+destination that is renamed over it once complete, so readers never see a
+partial file. Besides the pipe-delimited text format, byte for byte the same as
+before, large runs can be written as gzipped text, JSON Lines, or columns in a
+NumPy .npz or (with pyarrow installed) a Parquet file.
+"""
+
+import datetime
+import gzip
+import json
+import os
+import secrets
+
+import numpy as np
+
+from .bmcs_exceptions import BmCS_Exception
+from .daily_update_file_parser import UPDATE_FILE_SUFFIXES
+
+
+OUTPUT_FORMATS = ['text', 'text.gz', 'jsonl', 'npz', 'parquet']
+DEFAULT_OUTPUT_FORMAT = 'text'
+OUTPUT_SUFFIXES = {'text': '.txt', 'text.gz': '.txt.gz', 'jsonl': '.jsonl', 'npz': '.npz', 'parquet': '.parquet'}
+
+# Output files are named by date, or after the input file
+OUTPUT_NAMES = ['date', 'input']
+DEFAULT_OUTPUT_NAME = 'date'
+
+# Rows formatted into one string before it is written
+WRITE_CHUNK_ROWS = 65536
+
+# Compressing prediction lines at level 1 takes a sixth of the time of level 6,
+# for files less than a tenth larger
+GZIP_LEVEL = 1
+
+
+def predictions_file_name(input_path=None, output_format=DEFAULT_OUTPUT_FORMAT):
+    """
+    Name of the predictions file for input_path, e.g. pubmed24n0001.xml.gz -> citation_predictions_pubmed24n0001.txt,
+    or for today's date if input_path is None
+    """
+
+    if input_path is None:
+        name = datetime.datetime.today().strftime('%Y-%m-%d')
+    else:
+        name = os.path.basename(input_path)
+        for suffix in UPDATE_FILE_SUFFIXES:
+            if name.endswith(suffix):
+                name = name[:-len(suffix)]
+                break
+    return "citation_predictions_{0}{1}".format(name, OUTPUT_SUFFIXES[output_format])
+
+
+def format_prediction_text(adjusted_predictions, prediction_dict, pmids):
+    """
+    Lines of the text format, pmid|binary prediction|probability|journal, as one string
+    """
+
+    columns = _text_columns(adjusted_predictions, prediction_dict, pmids)
+    if len(columns[0]) == 0:
+        return ""
+    return "\n".join(map("|".join, zip(*columns))) + "\n"
+
+
+def format_prediction_jsonl(adjusted_predictions, prediction_dict, pmids):
+    """
+    JSON Lines, one object per citation. Probabilities that are nan, e.g. for citations that skipped the CNN, are null.
+    """
+
+    pmid_column, label_column, probability_column, journal_column = _text_columns(adjusted_predictions, prediction_dict, pmids)
+    probability_column = ["null" if probability == "nan" else probability for probability in probability_column]
+    journal_column = map(json.dumps, journal_column)
+    return "".join(map('{{"pmid": {0}, "label": {1}, "probability": {2}, "journal_id": {3}}}\n'.format,
+                       pmid_column, label_column, probability_column, journal_column))
+
+
+class PredictionWriter(object):
+    """
+    Write batches of predictions to one file in output_format.
+
+    The file only appears at path, complete, when the writer is closed. If the
+    writer is used as a context manager and an exception is raised, nothing is written.
+    """
+
+    def __init__(self, path, output_format=DEFAULT_OUTPUT_FORMAT):
+        if output_format not in OUTPUT_FORMATS:
+            msg = "Unknown output format \"{}\". Choose one of {}.".format(output_format, ", ".join(OUTPUT_FORMATS))
+            raise BmCS_Exception(msg)
+        if output_format == 'parquet':
+            _import_pyarrow()
+
+        self.path = path
+        self.output_format = output_format
+        # Columns for the binary formats, written when the file is closed
+        self._chunks = []
+
+        # In the destination directory, so that the rename is atomic. Created with the
+        # usual permissions for new files, rather than the owner only permissions of tempfile.
+        directory, name = os.path.split(path)
+        self._tmp_path = os.path.join(directory, ".{0}.{1}.tmp".format(name, secrets.token_hex(4)))
+        fd = os.open(self._tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        self._file = os.fdopen(fd, 'wb')
+        self._stream = self._file
+        if output_format == 'text.gz':
+            # No name or time in the header, so the same predictions give the same file
+            self._stream = gzip.GzipFile(filename="", mode='wb', fileobj=self._file, compresslevel=GZIP_LEVEL, mtime=0)
+
+    def write(self, adjusted_predictions, prediction_dict, pmids):
+        if self.output_format in ('npz', 'parquet'):
+            self._chunks.append(_binary_columns(adjusted_predictions, prediction_dict, pmids))
+            return
+
+        format_chunk = format_prediction_jsonl if self.output_format == 'jsonl' else format_prediction_text
+        journal_ids = prediction_dict['journal_ids']
+        for start in range(0, len(pmids), WRITE_CHUNK_ROWS):
+            end = start + WRITE_CHUNK_ROWS
+            chunk_dict = {'predictions': prediction_dict['predictions'][start:end], 'journal_ids': journal_ids[start:end]}
+            self._stream.write(format_chunk(adjusted_predictions[start:end], chunk_dict, pmids[start:end]).encode('utf-8'))
+
+    def close(self):
+        """
+        Finish the file and move it to path
+        """
+
+        try:
+            if self.output_format in ('npz', 'parquet'):
+                self._write_columns()
+            if self._stream is not self._file:
+                self._stream.close()
+            self._file.close()
+            os.replace(self._tmp_path, self.path)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """
+        Discard the file
+        """
+
+        self._file.close()
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _write_columns(self):
+        names = ['pmid', 'label', 'probability', 'journal_id']
+        if len(self._chunks) > 0:
+            columns = [np.concatenate([chunk[i] for chunk in self._chunks]) for i in range(len(names))]
+        else:
+            columns = [np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), np.empty(0, dtype=np.float64), np.empty(0, dtype=str)]
+
+        if self.output_format == 'npz':
+            np.savez(self._file, **dict(zip(names, columns)))
+        else:
+            _import_pyarrow()
+            import pyarrow
+            import pyarrow.parquet
+            table = pyarrow.table({name: pyarrow.array(column) for name, column in zip(names, columns)})
+            pyarrow.parquet.write_table(table, self._file)
+
+
+def write_predictions(adjusted_predictions, prediction_dict, pmids, path, output_format=DEFAULT_OUTPUT_FORMAT):
+    """
+    Write one batch of predictions to path, atomically
+    """
+
+    with PredictionWriter(path, output_format) as writer:
+        writer.write(adjusted_predictions, prediction_dict, pmids)
+
+
+def _text_columns(adjusted_predictions, prediction_dict, pmids):
+    """
+    The pmid, label, probability and journal columns as lists of strings,
+    each the same as str.format gives for the value
+    """
+
+    return [_str_column(pmids), _str_column(adjusted_predictions), _str_column(prediction_dict['predictions']), _str_column(prediction_dict['journal_ids'])]
+
+
+def _str_column(values):
+    # Python ints and floats convert faster than NumPy scalars, and give the same strings
+    if isinstance(values, np.ndarray) and values.dtype.kind in 'iubf':
+        values = values.tolist()
+    # format, as str.format does, rather than str, which differs for NumPy float32 values
+    return list(map(format, values))
+
+
+def _binary_columns(adjusted_predictions, prediction_dict, pmids):
+    return (np.asarray(pmids, dtype=np.int64),
+            np.asarray(adjusted_predictions, dtype=np.int8),
+            np.asarray(prediction_dict['predictions'], dtype=np.float64),
+            np.asarray(prediction_dict['journal_ids'], dtype=str))
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        msg = "The parquet output format requires pyarrow. Install it, or choose another output format."
+        raise BmCS_Exception(msg)
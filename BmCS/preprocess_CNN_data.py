@@ -1,7 +1,11 @@
-from tensorflow.keras.preprocessing.sequence import pad_sequences
 import math
+import mmap
+import multiprocessing
 import numpy as np
-from nltk.tokenize import word_tokenize
+
+from .citation_batch import as_citation_batch, UNKNOWN_PUB_YEAR
+from .vocab_index import load_index
+from .word_tokenizer import get_tokenizer, DEFAULT_TOKENIZER
 
 
 TITLE_MAX_WORDS = 64
@@ -14,16 +18,32 @@ UNKNOWN_JOURNAL_INDEX = 0
 UNKNOWN_WORD_INDEX = 1
 PADDING_INDEX = 0
 
+# Citations per task in parallel vectorization
+PARALLEL_CHUNK_SIZE = 256
+
+# Inputs and outputs of parallel vectorization, set before the worker processes are forked
+_parallel_state = None
+
 
-def get_batch_data(citations, journal_ids_path, word_indices_path):
+def get_batch_data(citations, journal_ids_path, word_indices_path, tokenizer=DEFAULT_TOKENIZER, workers=1):
+    """
+    Vectorize a CitationBatch, or a list of citation dictionaries, for the CNN.
+    tokenizer is one of word_tokenizer.TOKENIZERS.
+    With workers > 1, titles and abstracts are tokenized and vectorized in parallel.
+    """
 
-    journal_index_lookup = _create_lookup(journal_ids_path)
-    word_indices_lookup = _create_lookup(word_indices_path)
+    word_tokenize = get_tokenizer(tokenizer)
+    # Memory-mapped, and loaded once per process
+    journal_index_lookup = load_index(journal_ids_path)
+    word_indices_lookup = load_index(word_indices_path)
 
     pmids, titles, abstracts, pub_years, year_completed, journal_indices = _extract_data(citations, journal_index_lookup)
 
-    title_input = _vectorize_batch_text(word_indices_lookup, titles, TITLE_MAX_WORDS)
-    abstract_input = _vectorize_batch_text(word_indices_lookup, abstracts, ABSTRACT_MAX_WORDS)
+    if workers > 1 and len(titles) >= 2 * PARALLEL_CHUNK_SIZE and _can_fork():
+        title_input, abstract_input = _vectorize_parallel(word_indices_lookup, titles, abstracts, word_tokenize, workers)
+    else:
+        title_input = _vectorize_batch_text(word_indices_lookup, titles, TITLE_MAX_WORDS, word_tokenize)
+        abstract_input = _vectorize_batch_text(word_indices_lookup, abstracts, ABSTRACT_MAX_WORDS, word_tokenize)
 
     num_pub_year_time_periods = _num_time_periods(MIN_PUB_YEAR)
     num_year_completed_time_periods = _num_time_periods(MIN_YEAR_COMPLETED)
@@ -36,15 +56,6 @@ def get_batch_data(citations, journal_ids_path, word_indices_path):
     return batch_x
 
 
-def _create_lookup(path):
-    lookup = {}
-    with open(path, 'rt', encoding='utf8') as file:
-        for line in file:
-            id, value = line.split('\t')
-            lookup[value.strip()] = int(id)
-    return lookup
-
-
 def _create_year_input(year_data, min_year, num_time_periods):
     year_data = np.array(year_data, dtype=np.int32).reshape(-1, 1)
     year_data = np.clip(year_data, a_min=min_year, a_max=MODEL_MAX_YEAR)
@@ -56,25 +67,16 @@ def _create_year_input(year_data, min_year, num_time_periods):
 
 
 def _extract_data(citations, journal_index_lookup):
-    pmids, titles, abstracts, pub_years, year_completed, journal_indices = [], [], [], [], [], []
-    for citation in citations:
-        pmids.append(citation['pmid'])
-        titles.append(citation['title'].lower())
-        abstracts.append(citation['abstract'].lower())
-        pub_year = citation['pub_year']
-        if pub_year is None:
-            pub_year = MODEL_MAX_YEAR
-        if pub_year > MODEL_MAX_YEAR:
-            pub_year = MODEL_MAX_YEAR
-        if pub_year < MIN_PUB_YEAR:
-            pub_year = MIN_PUB_YEAR
-        pub_years.append(pub_year)
-        year_completed.append(MODEL_MAX_YEAR)
-        journal_index = UNKNOWN_JOURNAL_INDEX
-        journal_nlmid = citation['journal_nlmid']
-        if journal_nlmid in journal_index_lookup:
-           journal_index = journal_index_lookup[journal_nlmid]
-        journal_indices.append(journal_index)
+    citations = as_citation_batch(citations)
+    pmids = citations.pmids
+    titles = [title.lower() for title in citations.titles]
+    abstracts = [abstract.lower() for abstract in citations.abstracts]
+    pub_years = np.clip(citations.pub_years, MIN_PUB_YEAR, MODEL_MAX_YEAR)
+    pub_years[citations.pub_years == UNKNOWN_PUB_YEAR] = MODEL_MAX_YEAR
+    year_completed = np.full(len(citations), MODEL_MAX_YEAR, dtype=np.int32)
+    # Look up each distinct journal once, then index by journal code
+    vocab_indices = np.array([journal_index_lookup.get(journal_nlmid, UNKNOWN_JOURNAL_INDEX) for journal_nlmid in citations.journal_vocab], dtype=np.int32)
+    journal_indices = vocab_indices[citations.journal_codes] if len(vocab_indices) > 0 else np.zeros(len(citations), dtype=np.int32)
     return pmids, titles, abstracts, pub_years, year_completed, journal_indices
 
 
@@ -95,8 +97,69 @@ def _to_time_period_input(year_indices, num_time_periods):
     return time_period_input
 
 
-def _vectorize_batch_text(word_index_lookup, batch_text, max_words):
-    batch_words = [word_tokenize(text) for text in batch_text]
-    batch_word_indices = [[word_index_lookup[word] if word in word_index_lookup else UNKNOWN_WORD_INDEX for word in words] for words in batch_words]
-    vectorized_text = pad_sequences(batch_word_indices, maxlen=max_words, dtype='int32', padding='post', truncating='post', value=PADDING_INDEX)
-    return vectorized_text
+def _vectorize_batch_text(word_index_lookup, batch_text, max_words, word_tokenize, out=None):
+    """
+    Word indices of each text, written into a preallocated (len(batch_text), max_words) int32 array.
+    Texts are truncated and padded at the end. Tokenization stops once max_words is reached.
+    If given, out is the array to fill. It must already hold PADDING_INDEX.
+    """
+
+    if out is None:
+        out = np.full((len(batch_text), max_words), PADDING_INDEX, dtype=np.int32)
+    for row, text in zip(out, batch_text):
+        words = word_tokenize(text, max_words)
+        num_words = min(len(words), max_words)
+        row[:num_words] = [word_index_lookup.get(word, UNKNOWN_WORD_INDEX) for word in words[:num_words]]
+    return out
+
+
+def _vectorize_parallel(word_index_lookup, titles, abstracts, word_tokenize, workers):
+    """
+    Vectorize titles and abstracts in chunks, on a pool of forked worker processes.
+
+    The output arrays are in anonymous shared memory, created before the fork.
+    Workers write their rows in place, so the arrays are assembled without copies.
+    The texts, lookup and tokenizer are inherited by the workers rather than pickled.
+    """
+
+    global _parallel_state
+
+    num_citations = len(titles)
+    title_input = _shared_array((num_citations, TITLE_MAX_WORDS))
+    abstract_input = _shared_array((num_citations, ABSTRACT_MAX_WORDS))
+
+    # Load the tokenizer model once, before the fork, rather than in every worker
+    word_tokenize(".")
+
+    chunks = [(start, min(start + PARALLEL_CHUNK_SIZE, num_citations)) for start in range(0, num_citations, PARALLEL_CHUNK_SIZE)]
+    _parallel_state = (word_index_lookup, titles, abstracts, word_tokenize, title_input, abstract_input)
+    try:
+        context = multiprocessing.get_context("fork")
+        with context.Pool(min(workers, len(chunks))) as pool:
+            pool.map(_vectorize_chunk, chunks)
+    finally:
+        _parallel_state = None
+
+    return title_input, abstract_input
+
+
+def _vectorize_chunk(chunk):
+    start, end = chunk
+    word_index_lookup, titles, abstracts, word_tokenize, title_input, abstract_input = _parallel_state
+    _vectorize_batch_text(word_index_lookup, titles[start:end], TITLE_MAX_WORDS, word_tokenize, out=title_input[start:end])
+    _vectorize_batch_text(word_index_lookup, abstracts[start:end], ABSTRACT_MAX_WORDS, word_tokenize, out=abstract_input[start:end])
+
+
+def _shared_array(shape):
+    """
+    int32 array filled with PADDING_INDEX, in memory shared with forked processes
+    """
+
+    buffer = mmap.mmap(-1, int(np.prod(shape)) * np.dtype(np.int32).itemsize)
+    array = np.frombuffer(buffer, dtype=np.int32).reshape(shape)
+    array.fill(PADDING_INDEX)
+    return array
+
+
+def _can_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
@@ -2,24 +2,20 @@
 Module for ensemble data processing
 """
 
+from .citation_batch import as_citation_batch
+
+
 def preprocess_data(citations):
     """
     Preprocess data for voting model.
 
-    Return dictionary of lists of each feature
+    Accepts a CitationBatch or a list of citation dictionaries.
+    Return dictionary of lists of each feature, and lists of the journal ids and pmids.
+    The feature lists are the columns of the batch, not copies.
     """
 
-    pmids, titles, abstracts, affiliations, journal_nlmid = [], [], [], [], []
-
-    for citation in citations:
-        pmids.append(citation['pmid'])
-        
-        titles.append(citation['title'])
-        abstracts.append(citation['abstract'])
-        affiliations.append(citation['affiliations'])
-
-        journal_nlmid.append(citation['journal_nlmid'])
+    citations = as_citation_batch(citations)
 
-    citations = {'abstract': abstracts, 'titles': titles, 'author_list': affiliations}
+    voting_citations = {'abstract': citations.abstracts, 'titles': citations.titles, 'author_list': citations.affiliations}
 
-    return citations, journal_nlmid, pmids
\ No newline at end of file
+    return voting_citations, citations.journal_ids, citations.pmids.tolist()
@@ -1,29 +1,125 @@
 """
 Publication types to mark for review
+
+The rules are read from config/publication_types.json: strings that mark a
+citation for review when they appear anywhere in its lowercased title, and
+PublicationType values that mark it for review when the citation has them.
+They are compiled once into a single regular expression for titles, built as
+a prefix tree of the strings, and a hashed set of publication types, and are
+evaluated for a whole batch of citations as a boolean mask. The lists of the
+package config are also kept as pub_strings and pub_types.
 """
 
-pub_strings = [
-    'author correction',
-    'comment',
-    'corrigend',
-    'corrigendum',
-    'correction',
-    'correction to',
-    'department of error',
-    'errata',
-    'errata corrige',
-    'erratum',
-    'publisher correction',
-    'publisher',
-    'reply',
-    'retracted',
-    'retraction',
-    'retraction note',
-    'retraction notice',
-    ]
-
-pub_types = [
-    'Retraction of Publication',
-    'Case Reports',
-    'Comment',
-    ]
+import functools
+import json
+import re
+
+import numpy as np
+
+from .citation_batch import as_citation_batch
+from .resources import resource_filename
+
+
+CONFIG_PATH = resource_filename(__name__, "config/publication_types.json")
+
+
+def _load_config_lists():
+    with open(CONFIG_PATH, "r") as f:
+        rules = json.load(f)
+    return list(rules.get('title_strings', [])), list(rules.get('publication_types', []))
+
+
+# Title strings and publication types of the package config, in order
+pub_strings, pub_types = _load_config_lists()
+
+
+class PublicationTypeRules(object):
+    """
+    Compiled publication type rules, shared by filter_pub_type and tests
+    """
+
+    def __init__(self, title_strings=(), pub_types=()):
+        # Titles are lowercased before matching
+        self.title_strings = tuple(title_string.lower() for title_string in title_strings)
+        self.pub_types = frozenset(pub_types)
+        self._title_search = _compile_title_strings(self.title_strings)
+
+    @classmethod
+    def from_file(cls, rules_path):
+        with open(rules_path, "r") as f:
+            rules = json.load(f)
+
+        return cls(rules.get('title_strings', []), rules.get('publication_types', []))
+
+    @classmethod
+    def from_config(cls):
+        """
+        Build the rules from the config file included with the package
+        """
+
+        return cls.from_file(CONFIG_PATH)
+
+    def title_matches(self, title):
+        return self._title_search(title.lower()) is not None
+
+    def has_pub_type(self, pub_type_list):
+        return not self.pub_types.isdisjoint(pub_type_list)
+
+    def title_mask(self, titles):
+        search = self._title_search
+        return np.fromiter((search(title.lower()) is not None for title in titles), dtype=bool, count=len(titles))
+
+    def pub_type_mask(self, pub_type_lists):
+        pub_types = self.pub_types
+        return np.fromiter((not pub_types.isdisjoint(pub_type_list) for pub_type_list in pub_type_lists), dtype=bool, count=len(pub_type_lists))
+
+    def review_mask(self, citations):
+        """
+        Mask of the citations in a CitationBatch, or list of citation dictionaries, to mark for review
+        """
+
+        citations = as_citation_batch(citations)
+        return self.title_mask(citations.titles) | self.pub_type_mask(citations.pub_types)
+
+
+@functools.lru_cache(maxsize=None)
+def default_rules():
+    """
+    PublicationTypeRules from the package config, compiled on first use
+    """
+
+    return PublicationTypeRules.from_config()
+
+
+def _compile_title_strings(title_strings):
+    """
+    Search function for any of title_strings in a string, or one that never matches if there are none
+    """
+
+    if "" in title_strings:
+        # The empty string is in every title
+        return re.compile("").search
+
+    # A string that contains another is matched whenever the shorter one is,
+    # so only the shortest strings are needed to decide whether any matches.
+    # None of these is then a prefix of another.
+    strings = sorted({string for string in title_strings if not any(other != string and other in string for other in title_strings)})
+    if len(strings) == 0:
+        return lambda title: None
+
+    # One alternation per shared prefix, so each position of the title is tried
+    # against the branches of a prefix tree rather than against every string
+    tree = {}
+    for string in strings:
+        node = tree
+        for char in string:
+            node = node.setdefault(char, {})
+
+    return re.compile(_tree_pattern(tree)).search
+
+
+def _tree_pattern(node):
+    branches = [re.escape(char) + _tree_pattern(child) for char, child in sorted(node.items())]
+    if len(branches) <= 1:
+        return "".join(branches)
+    return "(?:{0})".format("|".join(branches))
@@ -0,0 +1,24 @@
+"""
+Module for locating the files shipped with the package
+
+Same paths as pkg_resources.resource_filename for a package installed as
+a directory, without importing pkg_resources, which scans every installed
+distribution and takes longer than the rest of the command line startup.
+"""
+
+import importlib
+import os
+import sys
+
+
+def resource_filename(package_or_module, resource_name):
+    """
+    Path of resource_name, a "/" separated path relative to the directory of the named package or module.
+    The package or module is imported if it is not already.
+    """
+
+    module = sys.modules.get(package_or_module)
+    if module is None:
+        module = importlib.import_module(package_or_module)
+    base = os.path.dirname(os.path.abspath(module.__file__))
+    return os.path.normpath(os.path.join(base, *resource_name.split("/")))
@@ -0,0 +1,206 @@
+"""
+Module for the BmCS scoring server
+
+Loads the models, lookups and config once, and scores PubMed XML sent over
+local HTTP, on a TCP port or a Unix socket. Endpoints:
+
+    POST /predict   PubMed XML in the body. Returns one pmid|label|probability|journal
+                    line per citation, exactly as written by save_predictions.
+    GET /health     200 while the server is running.
+    GET /ready      200 once the models are loaded and warmed up, 503 before.
+
+The server starts listening straight away. The models are loaded in the
+background, then run once on the bundled test citations, so that the first
+request doesn't pay for building the prediction graph.
+"""
+
+import argparse
+import os
+import socketserver
+import sys
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .bmcs_exceptions import BmCS_Exception
+from .daily_update_file_parser import NO_CITATIONS_MSG
+
+
+WARM_UP_XML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "BmCS_tests", "datasets", "test_citations.xml")
+
+# Largest accepted request body
+MAX_BODY_BYTES = 512 * 1024 * 1024
+
+
+class ScoringService(object):
+    """
+    Models and config, loaded once and shared by all requests
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.ready = False
+        self.error = None
+        self._journal_policy = None
+        self._o_sci_model = None
+        self._o_cnn_model = None
+        # The models are loaded and run on one thread. TensorFlow graph state is
+        # per thread, and the models are not safe to run from several threads at once.
+        self._model_thread = ThreadPoolExecutor(max_workers=1)
+
+    def start(self):
+        self._model_thread.submit(self.load)
+
+    def load(self):
+        """
+        Load the config and models, then warm up. Sets ready, or error on failure.
+        """
+
+        try:
+            from .BmCS import load_config, load_models
+            self._journal_policy = load_config()
+            self._o_sci_model, self._o_cnn_model = load_models(self.args)
+            self.warm_up()
+            self.ready = True
+            print("Scoring server ready")
+        except Exception as e:
+            self.error = str(e)
+            traceback.print_exc()
+
+    def warm_up(self):
+        """
+        Score the bundled test citations once. Bypasses the prediction cache, so the models always run.
+        """
+
+        from .BmCS import parse_citations, predict_citations
+        args = argparse.Namespace(**vars(self.args))
+        args.predict_all = True
+        args.prediction_cache = None
+        args.cache_dir = None
+        args.no_cache = True
+        citations = parse_citations(WARM_UP_XML_PATH, args, self._journal_policy)
+        predict_citations(citations, self._o_sci_model, self._o_cnn_model, self._journal_policy, args)
+
+    def predict(self, xml):
+        """
+        Score the citations in a PubMed XML document. Returns the save_predictions lines.
+        """
+
+        from .BmCS import format_predictions, predict_citations
+        from .daily_update_file_parser import parse_update_file
+
+        args = self.args
+        try:
+            citations = parse_update_file(
+                    None, args.journal_drop, args.predict_medline,
+                    self._journal_policy.selectively_indexed_ids, args.predict_all, self._journal_policy.misindexed_ids,
+                    xml_string=xml)
+        except Exception as e:
+            if str(e) == NO_CITATIONS_MSG:
+                return ""
+            raise
+
+        adjusted_predictions, prediction_dict, pmids = self._model_thread.submit(
+                predict_citations, citations, self._o_sci_model, self._o_cnn_model, self._journal_policy, args).result()
+        return "".join(format_predictions(adjusted_predictions, prediction_dict, pmids))
+
+
+class ScoringRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP handler for the scoring endpoints
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/health":
+            self._send(200, "ok\n")
+        elif self.path == "/ready":
+            if service.ready:
+                self._send(200, "ready\n")
+            elif service.error is not None:
+                self._send(503, "failed: {}\n".format(service.error))
+            else:
+                self._send(503, "loading\n")
+        else:
+            self._send(404, "Not found\n")
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path != "/predict":
+            self._send(404, "Not found\n")
+            return
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY_BYTES:
+            self._send(400, "A PubMed XML body of at most {} bytes is required\n".format(MAX_BODY_BYTES))
+            return
+        xml = self.rfile.read(length)
+
+        if not service.ready:
+            self._send(503, "Not ready\n")
+            return
+
+        try:
+            self._send(200, service.predict(xml))
+        except BmCS_Exception as be:
+            self._send(500, "BmCS exception: {}\n".format(str(be)))
+        except Exception as e:
+            # Malformed or unparseable XML
+            self._send(400, "Can't score request. Reason: \"{}\".\n".format(str(e)))
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return self.server.server_address
+
+    def _send(self, status, body):
+        body = body.encode("utf8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(args):
+    """
+    HTTP server for the command line options, listening on args.socket if set, otherwise args.host:args.port
+    """
+
+    service = ScoringService(args)
+    if args.socket is not None:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = ThreadingUnixHTTPServer(args.socket, ScoringRequestHandler)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), ScoringRequestHandler)
+    server.service = service
+    return server
+
+
+def serve(args):
+    """
+    Run the scoring server until interrupted
+    """
+
+    server = create_server(args)
+    address = args.socket if args.socket is not None else "http://{0}:{1}".format(*server.server_address[:2])
+    print("Scoring server listening on {0}".format(address))
+    sys.stdout.flush()
+
+    server.service.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket is not None and os.path.exists(args.socket):
+            os.remove(args.socket)
@@ -0,0 +1,227 @@
+"""
+Module for the memory-mapped vocabulary and journal index
+
+models/word_indices.txt and models/journal_ids.txt map strings to integer ids,
+one tab separated "id<TAB>string" pair per line. Rather than reading them into
+a dictionary of Python strings in every process, each text file is compiled once
+into a binary index file next to it (or in the temp directory, if the models
+directory is read-only). The index is memory-mapped, so the pages are shared
+read-only by every process, including forked workers, and loaded once per process.
+
+Index file layout, all little-endian:
+
+    header      magic, format version, entry count, source file size and mtime,
+                key blob size
+    hashes      uint64[n], the CRC-32 and Adler-32 of each UTF-8 key as one 64-bit hash, sorted
+    values      int64[n], the id of each key, in hash order
+    offsets     uint64[n + 1], the byte range of each key in the key blob, in hash order
+    key blob    the UTF-8 keys, concatenated
+
+A lookup hashes the string, binary searches the hashes, and compares the stored
+key bytes, so hash collisions can't change the result. Results of lookups are
+memoized per process, as the same words recur throughout a batch.
+"""
+
+import bisect
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+import numpy as np
+
+from .bmcs_exceptions import BmCS_Exception
+
+
+INDEX_MAGIC = b"BMCSIDX\0"
+INDEX_VERSION = 1
+INDEX_SUFFIX = ".idx"
+
+# magic, version, count, source size, source mtime (ns), key blob size, padded to 64 bytes
+_HEADER = struct.Struct("<8sIIQQQ24x")
+
+# Memoized lookups per index. Cleared when full, to bound memory in long running processes.
+MEMO_MAX_ENTRIES = 1000000
+
+# Indexes are loaded once per process, keyed by source path
+_indexes = {}
+
+
+def load_index(path):
+    """
+    VocabIndex for a lookup text file, cached for the life of the process
+    """
+
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = _open_or_build_index(path)
+    return index
+
+
+def read_lookup_file(path):
+    """
+    Read a lookup text file into a dictionary. Later lines win for repeated keys.
+    """
+
+    lookup = {}
+    with open(path, 'rt', encoding='utf8') as file:
+        for line in file:
+            id, value = line.split('\t')
+            lookup[value.strip()] = int(id)
+    return lookup
+
+
+def build_index(lookup_path, index_path):
+    """
+    Compile a lookup text file into an index file. The file is written
+    to a temporary file and renamed, so readers never see a partial index.
+    """
+
+    stat = os.stat(lookup_path)
+    lookup = read_lookup_file(lookup_path)
+
+    encoded_keys = [key.encode('utf8') for key in lookup]
+    hashes = np.array([_hash_key(key) for key in encoded_keys], dtype=np.uint64)
+    order = np.argsort(hashes, kind='stable')
+    values = np.fromiter(lookup.values(), dtype=np.int64, count=len(lookup))[order]
+
+    sorted_keys = [encoded_keys[i] for i in order.tolist()]
+    offsets = np.zeros(len(sorted_keys) + 1, dtype=np.uint64)
+    np.cumsum([len(key) for key in sorted_keys], out=offsets[1:])
+    key_blob = b''.join(sorted_keys)
+
+    header = _HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(lookup), stat.st_size, stat.st_mtime_ns, len(key_blob))
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(index_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(header)
+            f.write(hashes[order].tobytes())
+            f.write(values.tobytes())
+            f.write(offsets.tobytes())
+            f.write(key_blob)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        _remove(tmp_path)
+        raise
+
+
+class VocabIndex(object):
+    """
+    Read-only string to id mapping backed by a memory-mapped index file.
+    Supports the dictionary operations used by the preprocessors: get, [], in and len.
+    """
+
+    def __init__(self, index_path):
+        with open(index_path, 'rb') as f:
+            self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, self.source_size, self.source_mtime_ns, blob_size = _HEADER.unpack_from(self._buffer, 0)
+        if magic != INDEX_MAGIC or version != INDEX_VERSION:
+            raise ValueError("\"{}\" is not a version {} index file".format(index_path, INDEX_VERSION))
+
+        # Typed views of the mapped file. Indexing a memoryview gives Python ints
+        # without a NumPy scalar per access, and bisect can search it directly.
+        view = memoryview(self._buffer)
+        offset = _HEADER.size
+        self._hashes = view[offset:offset + 8 * count].cast('Q')
+        offset += 8 * count
+        self._values = view[offset:offset + 8 * count].cast('q')
+        offset += 8 * count
+        self._offsets = view[offset:offset + 8 * (count + 1)].cast('Q')
+        self._blob_start = offset + 8 * (count + 1)
+        if self._blob_start + blob_size != len(self._buffer):
+            raise ValueError("\"{}\" is truncated".format(index_path))
+
+        self._memo = {}
+
+    def is_current(self, lookup_path):
+        stat = os.stat(lookup_path)
+        return stat.st_size == self.source_size and stat.st_mtime_ns == self.source_mtime_ns
+
+    def get(self, key, default=None):
+        try:
+            value = self._memo[key]
+        except KeyError:
+            if len(self._memo) >= MEMO_MAX_ENTRIES:
+                self._memo.clear()
+            value = self._memo[key] = self._find(key)
+        return default if value is None else value
+
+    def _find(self, key):
+        encoded_key = key.encode('utf8')
+        key_hash = _hash_key(encoded_key)
+        hashes, offsets, blob_start = self._hashes, self._offsets, self._blob_start
+        position = bisect.bisect_left(hashes, key_hash)
+        while position < len(hashes) and hashes[position] == key_hash:
+            if self._buffer[blob_start + offsets[position]:blob_start + offsets[position + 1]] == encoded_key:
+                return self._values[position]
+            position += 1
+        return None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self._hashes)
+
+
+def index_path_for(lookup_path):
+    return lookup_path + INDEX_SUFFIX
+
+
+def _open_or_build_index(lookup_path):
+    candidate_paths = [index_path_for(lookup_path), _temp_index_path(lookup_path)]
+
+    # Use an existing, current index
+    for index_path in candidate_paths:
+        index = _try_open(index_path, lookup_path)
+        if index is not None:
+            return index
+
+    # Otherwise build one, next to the text file if possible
+    for index_path in candidate_paths:
+        try:
+            build_index(lookup_path, index_path)
+        except OSError:
+            continue
+        index = _try_open(index_path, lookup_path)
+        if index is not None:
+            return index
+
+    msg = "Can't build an index for \"{}\".".format(lookup_path)
+    raise BmCS_Exception(msg)
+
+
+def _try_open(index_path, lookup_path):
+    if not os.path.isfile(index_path):
+        return None
+    try:
+        index = VocabIndex(index_path)
+    except (OSError, ValueError, struct.error):
+        return None
+    return index if index.is_current(lookup_path) else None
+
+
+def _temp_index_path(lookup_path):
+    path_hash = hashlib.sha256(os.path.abspath(lookup_path).encode('utf8')).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), "bmcs_{0}_{1}{2}".format(os.path.basename(lookup_path), path_hash, INDEX_SUFFIX))
+
+
+def _hash_key(encoded_key):
+    return (zlib.crc32(encoded_key) << 32) | zlib.adler32(encoded_key)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
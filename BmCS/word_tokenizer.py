@@ -0,0 +1,190 @@
+"""
+Module for word tokenization of CNN input text
+
+The CNN was trained on text tokenized by nltk.tokenize.word_tokenize (nltk 3.6.1).
+That function runs Punkt sentence splitting, then around 30 regex substitutions over
+every sentence, most of which can't match typical abstract text.
+
+The regex engine produces the same tokens faster. The treebank substitutions are
+kept in the same order, with the same patterns, in a table where each entry has
+a trigger: the characters or substring that the text must contain for the pattern
+to match. Entries whose trigger is absent are skipped, so a sentence only pays for
+the rules that can change it. The characters of a sentence are collected once. The final period rules, which are anchored at the end
+of the sentence, only search the tail of the sentence. Sentences are split with
+the same Punkt model, which is loaded once, and texts with no possible sentence
+ending skip Punkt entirely.
+
+Only the word tokenization is replaced: the regex tokenizer still requires NLTK
+and its punkt data (python -m nltk.downloader punkt) to split sentences, as the
+nltk tokenizer does. With tokenizer="nltk", word_tokenize runs itself, as the
+reference implementation. NLTK is imported on first use, as importing it takes
+longer than the rest of the command line startup.
+"""
+
+import re
+
+
+TOKENIZERS = ('regex', 'nltk')
+DEFAULT_TOKENIZER = 'regex'
+
+PUNKT_PATH = "tokenizers/punkt/english.pickle"
+
+# Trigger kinds. The rule is only applied if:
+_ANY_CHAR = 0     # the text contains any of the trigger characters
+_SUBSTRING = 1    # the text contains the trigger substring
+_STARTS_WITH = 2  # the text starts with the trigger
+_FINAL_PERIOD = 3 # the text ends with a period, optionally followed by closing characters
+
+# Characters that may follow the final period, as in the final period patterns
+_FINAL_PERIOD_CLOSERS = "])}>\"'\u00bb\u201d\u2019 "
+
+# The NLTKWordTokenizer rules from nltk 3.6.1, in order, before the text is padded with spaces
+_TREEBANK_RULES = [
+    # Starting quotes
+    (_ANY_CHAR, frozenset("\u00ab\u201c\u2018\u201e`"), re.compile("([\u00ab\u201c\u2018\u201e]|[`]+)"), r" \1 "),
+    (_STARTS_WITH, '"', re.compile(r'^"'), r"``"),
+    (_SUBSTRING, "``", re.compile(r"(``)"), r" \1 "),
+    (_ANY_CHAR, frozenset("\"'"), re.compile(r"([ \(\[{<])(\"|\'{2})"), r"\1 `` "),
+    (_ANY_CHAR, frozenset("'"), re.compile(r"(?i)(\')(?!re|ve|ll|m|t|s|d|n)(\w)\b"), r"\1 \2"),
+    # Punctuation
+    (_FINAL_PERIOD, None, re.compile("([^\\.])(\\.)([\\]\\)}>\"\\'\u00bb\u201d\u2019 ]*)\\s*$"), r"\1 \2 \3 "),
+    (_ANY_CHAR, frozenset(":,"), re.compile(r"([:,])([^\d])"), r" \1 \2"),
+    (_ANY_CHAR, frozenset(":,"), re.compile(r"([:,])$"), r" \1 "),
+    (_SUBSTRING, "..", re.compile(r"\.{2,}"), r" \g<0> "),
+    (_ANY_CHAR, frozenset(";@#$%&"), re.compile(r"[;@#$%&]"), r" \g<0> "),
+    (_FINAL_PERIOD, None, re.compile(r"([^\.])(\.)([\]\)}>\"\']*)\s*$"), r"\1 \2\3 "),
+    (_ANY_CHAR, frozenset("?!"), re.compile(r"[?!]"), r" \g<0> "),
+    (_ANY_CHAR, frozenset("'"), re.compile(r"([^'])' "), r"\1 ' "),
+    (_ANY_CHAR, frozenset("*"), re.compile(r"[*]"), r" \g<0> "),
+    # Parentheses and brackets
+    (_ANY_CHAR, frozenset("[](){}<>"), re.compile(r"[\]\[\(\)\{\}\<\>]"), r" \g<0> "),
+    # Double dashes
+    (_SUBSTRING, "--", re.compile(r"--"), r" -- "),
+    ]
+
+# After the text is padded with spaces
+_ENDING_QUOTE_RULES = [
+    (_ANY_CHAR, frozenset("\u00bb\u201d\u2019"), re.compile("([\u00bb\u201d\u2019])"), r" \1 "),
+    (_ANY_CHAR, frozenset('"'), re.compile(r'"'), " '' "),
+    (_SUBSTRING, "''", re.compile(r"(\S)(\'\')"), r"\1 \2 "),
+    (_ANY_CHAR, frozenset("'"), re.compile(r"([^' ])('[sS]|'[mM]|'[dD]|') "), r"\1 \2 "),
+    (_ANY_CHAR, frozenset("'"), re.compile(r"([^' ])('ll|'LL|'re|'RE|'ve|'VE|n't|N'T) "), r"\1 \2 "),
+    ]
+
+# Contractions, triggered by a case insensitive substring
+_CONTRACTION_RULES = [
+    ("cannot", re.compile(r"(?i)\b(can)(?#X)(not)\b")),
+    ("d'ye", re.compile(r"(?i)\b(d)(?#X)('ye)\b")),
+    ("gimme", re.compile(r"(?i)\b(gim)(?#X)(me)\b")),
+    ("gonna", re.compile(r"(?i)\b(gon)(?#X)(na)\b")),
+    ("gotta", re.compile(r"(?i)\b(got)(?#X)(ta)\b")),
+    ("lemme", re.compile(r"(?i)\b(lem)(?#X)(me)\b")),
+    ("more'n", re.compile(r"(?i)\b(more)(?#X)('n)\b")),
+    ("wanna", re.compile(r"(?i)\b(wan)(?#X)(na)\s")),
+    ("'tis", re.compile(r"(?i) ('t)(?#X)(is)\b")),
+    ("'twas", re.compile(r"(?i) ('t)(?#X)(was)\b")),
+    ]
+
+_sentence_tokenizer = None
+_sentence_end_chars = None
+
+
+def get_tokenizer(name=DEFAULT_TOKENIZER):
+    """
+    Word tokenization function for a tokenizer name in TOKENIZERS.
+    The function takes the text and an optional max_words, see regex_word_tokenize.
+    """
+
+    if name == 'regex':
+        return regex_word_tokenize
+    elif name == 'nltk':
+        return _nltk_word_tokenize
+    else:
+        raise ValueError("Unknown tokenizer \"{}\". Expected one of {}.".format(name, ", ".join(TOKENIZERS)))
+
+
+def regex_word_tokenize(text, max_words=None):
+    """
+    Same tokens as nltk.tokenize.word_tokenize(text).
+
+    If max_words is given, stop after the sentence in which it is reached.
+    The first max_words tokens are the same, and there may be more.
+    """
+
+    tokens = []
+    for sentence in _iter_sentences(text):
+        tokens.extend(_tokenize_sentence(sentence))
+        if max_words is not None and len(tokens) >= max_words:
+            break
+    return tokens
+
+
+def nltk_word_tokenize(text):
+    from nltk.tokenize import word_tokenize
+    return word_tokenize(text)
+
+
+def _nltk_word_tokenize(text, max_words=None):
+    return nltk_word_tokenize(text)
+
+
+def _iter_sentences(text):
+    global _sentence_tokenizer, _sentence_end_chars
+    if _sentence_tokenizer is None:
+        import nltk.data
+        _sentence_tokenizer = nltk.data.load(PUNKT_PATH)
+        _sentence_end_chars = frozenset(_sentence_tokenizer._lang_vars.sent_end_chars)
+
+    # Without a sentence ending character, Punkt returns the text without trailing whitespace
+    if _sentence_end_chars.isdisjoint(text):
+        text = text.rstrip()
+        return [text] if text else []
+    # Sentences are found lazily, so that later sentences are not split if max_words is reached
+    return (text[start:end] for start, end in _sentence_tokenizer.span_tokenize(text))
+
+
+def _tokenize_sentence(text):
+    # Characters in the text. Substitutions only add characters from their replacement,
+    # which are added to the set, so it is always a superset of the current text.
+    chars = set(text)
+    text = _apply_rules(_TREEBANK_RULES, text, chars)
+    text = _apply_rules(_ENDING_QUOTE_RULES, " " + text + " ", chars)
+
+    lowered = text.lower()
+    for trigger, regexp in _CONTRACTION_RULES:
+        if trigger in lowered:
+            text = regexp.sub(r" \1 \2 ", text)
+
+    return text.split()
+
+
+def _apply_rules(rules, text, chars):
+    for trigger_kind, trigger, regexp, substitution in rules:
+        if trigger_kind == _ANY_CHAR:
+            if trigger.isdisjoint(chars):
+                continue
+        elif trigger_kind == _SUBSTRING:
+            if trigger not in text:
+                continue
+        elif trigger_kind == _STARTS_WITH:
+            if not text.startswith(trigger):
+                continue
+        else:
+            text = _sub_final_period(regexp, substitution, text)
+            continue
+        text = regexp.sub(substitution, text)
+        chars.update(substitution)
+    return text
+
+
+def _sub_final_period(regexp, substitution, text):
+    """
+    Apply a final period rule to the end of the text only.
+    A match can only start at the character before the last period.
+    """
+
+    head = text.rstrip().rstrip(_FINAL_PERIOD_CLOSERS)
+    if not head.endswith('.') or len(head) < 2:
+        return text
+    start = len(head) - 2
+    return text[:start] + regexp.sub(substitution, text[start:])
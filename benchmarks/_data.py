@@ -0,0 +1,55 @@
+"""
+Helpers to build benchmark inputs
+
+Large update files are made by repeating the curated test citations.
+"""
+
+import os
+
+
+TEST_XML_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BmCS", "BmCS_tests", "datasets", "test_citations.xml")
+
+
+def write_replicated_update_file(path, copies):
+    """
+    Write an update file made of the test citations repeated copies times
+    """
+
+    with open(TEST_XML_PATH, "rt", encoding="utf8") as f:
+        xml = f.read()
+    start, end = xml.index("<PubmedArticle>"), xml.rindex("</PubmedArticleSet>")
+    with open(path, "wt", encoding="utf8") as f:
+        f.write(xml[:start])
+        articles = xml[start:end]
+        for _ in range(copies):
+            f.write(articles)
+        f.write(xml[end:])
+    return path
+
+
+# Token lengths of a typical daily update file. About a fifth of the citations
+# (letters, comments, errata, editorials) have no abstract. Abstracts average
+# around 260 tokens, and longer ones are truncated to the CNN input length.
+EMPTY_ABSTRACT_FRACTION = 0.2
+ABSTRACT_TOKENS_MEAN, ABSTRACT_TOKENS_SD = 260, 100
+TITLE_TOKENS_MEAN, TITLE_TOKENS_SD = 17, 6
+
+
+def daily_file_word_indices(num_citations, title_max_words, abstract_max_words, vocab_size, seed=0):
+    """
+    Padded title and abstract word indices, with the token lengths of a daily update file
+    """
+
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    title_lengths = np.clip(rng.normal(TITLE_TOKENS_MEAN, TITLE_TOKENS_SD, num_citations).round(), 1, title_max_words).astype(int)
+    abstract_lengths = np.clip(rng.normal(ABSTRACT_TOKENS_MEAN, ABSTRACT_TOKENS_SD, num_citations).round(), 20, abstract_max_words).astype(int)
+    abstract_lengths[rng.random(num_citations) < EMPTY_ABSTRACT_FRACTION] = 0
+
+    def word_indices(lengths, max_words):
+        indices = rng.integers(1, vocab_size, size=(num_citations, max_words)).astype(np.int32)
+        indices[np.arange(max_words) >= lengths[:, np.newaxis]] = 0
+        return indices
+
+    return word_indices(title_lengths, title_max_words), word_indices(abstract_lengths, abstract_max_words)
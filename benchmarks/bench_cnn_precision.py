@@ -0,0 +1,106 @@
+"""
+Benchmark reduced-precision CNN embedding tables
+
+Loads the NumPy CNN backend with each --cnn-precision in a fresh process, and
+scores the same synthetic daily file with length buckets. Reports the load time,
+citations per second, resident memory after scoring and at its peak, and private
+(anonymous) memory of each process, the largest difference of the probabilities from float32, and the
+fraction of citations on the other side of the CNN threshold.
+
+python benchmarks/bench_cnn_precision.py --citations 2000
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS.bmcs_cnn_model import CNN_PRECISIONS
+from BmCS.thresholds import CNN_THRESH
+from bench_length_buckets import _batch_x, _load, _vocab_size, MODELS_DIR
+
+
+def _memory_mb(field):
+    # Rss: resident memory, including pages of the memory-mapped weights file.
+    # Anonymous: private memory of the process, which is not shared with other workers.
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def _child(args):
+    batch_x = _batch_x(args, _vocab_size())
+    start = time.perf_counter()
+    model = _load("numpy", args.weights, length_buckets=True, precision=args.child)
+    load_seconds = time.perf_counter() - start
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        predictions = model.process(batch_x)
+        best = min(best, time.perf_counter() - start)
+    np.save(args.output, predictions)
+
+    print(json.dumps({
+        'load_seconds': load_seconds,
+        'predict_seconds': best,
+        'citations': len(predictions),
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'rss_mb': _memory_mb("Rss"),
+        'anonymous_mb': _memory_mb("Anonymous"),
+        }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reduced-precision CNN embedding tables")
+    parser.add_argument("--weights", default=os.path.join(MODELS_DIR, "model_CNN_weights.hdf5"), help="CNN weights file")
+    parser.add_argument("--path", default=None, help="Update file to take the citations from, instead of synthetic token lengths")
+    parser.add_argument("--citations", type=int, default=2000, help="Number of synthetic citations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", choices=CNN_PRECISIONS, default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--output", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        _child(args)
+        return
+
+    temp_dir = tempfile.mkdtemp()
+    results = {}
+    predictions = {}
+    for precision in CNN_PRECISIONS:
+        output = os.path.join(temp_dir, "{}.npy".format(precision))
+        command = [sys.executable, os.path.abspath(__file__), "--child", precision, "--output", output,
+                   "--weights", args.weights, "--citations", str(args.citations), "--repeat", str(args.repeat)]
+        if args.path is not None:
+            command += ["--path", args.path]
+        completed = subprocess.run(command, stdout=subprocess.PIPE, check=True)
+        results[precision] = json.loads(completed.stdout.decode().strip().splitlines()[-1])
+        predictions[precision] = np.load(output)
+        os.remove(output)
+    os.rmdir(temp_dir)
+
+    reference = predictions[CNN_PRECISIONS[0]]
+    for precision in CNN_PRECISIONS:
+        result = results[precision]
+        flipped = np.mean((predictions[precision] >= CNN_THRESH) != (reference >= CNN_THRESH))
+        print("{0:>8}: load {1:.2f}s, {2:.0f} citations/s, RSS {3:.0f} MB (peak {4:.0f} MB), anonymous {5:.0f} MB, "
+              "max difference {6:.2g}, {7:.3%} decisions changed".format(
+                  precision, result['load_seconds'], result['citations'] / result['predict_seconds'],
+                  result['rss_mb'], result['peak_rss_mb'], result['anonymous_mb'],
+                  np.abs(predictions[precision] - reference).max(), flipped))
+
+
+if __name__ == "__main__":
+    main()
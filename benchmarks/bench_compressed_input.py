@@ -0,0 +1,71 @@
+"""
+Benchmark parsing of compressed update files
+
+Compares the total wall time of gunzip to scratch disk followed by parsing
+against parsing the .xml.gz directly, for both the tree and streaming parsers.
+
+python benchmarks/bench_compressed_input.py --copies 2000
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS.daily_update_file_parser import parse_update_file, iterparse_update_file
+from _data import write_replicated_update_file
+
+
+def _parse(path, streaming):
+    if streaming:
+        return sum(1 for _ in iterparse_update_file(path, False, False, {}, True, []))
+    return len(parse_update_file(path, False, False, {}, True, []))
+
+
+def _gunzip_then_parse(gz_path, tmp_dir, streaming):
+    xml_path = os.path.join(tmp_dir, "gunzipped.xml")
+    with gzip.open(gz_path, "rb") as src, open(xml_path, "wb") as dest:
+        shutil.copyfileobj(src, dest)
+    num_citations = _parse(xml_path, streaming)
+    os.remove(xml_path)
+    return num_citations
+
+
+def _time(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compressed update file input")
+    parser.add_argument("--copies", type=int, default=2000, help="Number of copies of the test citations in the file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_path = write_replicated_update_file(os.path.join(tmp_dir, "update.xml"), args.copies)
+        gz_path = xml_path + ".gz"
+        with open(xml_path, "rb") as src, gzip.open(gz_path, "wb") as dest:
+            shutil.copyfileobj(src, dest)
+        os.remove(xml_path)
+
+        print("File: {0} copies, {1:.1f} MB gzipped".format(args.copies, os.path.getsize(gz_path) / 1e6))
+        for streaming in (False, True):
+            mode = "streaming" if streaming else "tree"
+            baseline = _time(_gunzip_then_parse, gz_path, tmp_dir, streaming, repeat=args.repeat)
+            direct = _time(_parse, gz_path, streaming, repeat=args.repeat)
+            print("{0:>9}: gunzip then parse {1:.2f}s, direct .xml.gz {2:.2f}s ({3:.2f}x)".format(
+                mode, baseline, direct, baseline / direct))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Benchmark running the ensemble and the CNN concurrently
+
+Times each branch on its own (ensemble; CNN vectorization and CNN), then
+run_models one after the other and with --concurrent, on an update file made of
+repeated test citations or given with --path. Concurrent time should approach
+the slower branch rather than the sum of both, given more than one CPU.
+
+python benchmarks/bench_concurrent.py WEIGHTS ENSEMBLE --copies 300 --cnn-backend numpy
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS.BmCS import get_args, load_models, run_models
+from BmCS.daily_update_file_parser import parse_update_file
+from BmCS.preprocess_CNN_data import get_batch_data
+from BmCS.preprocess_voting_data import preprocess_data
+from BmCS.resources import resource_filename
+from _data import write_replicated_update_file
+
+
+def _time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark running the ensemble and the CNN concurrently")
+    parser.add_argument("weights", help="CNN weights file")
+    parser.add_argument("ensemble", help="Ensemble file")
+    parser.add_argument("--path", default=None, help="Update file to score, instead of repeated test citations")
+    parser.add_argument("--copies", type=int, default=300, help="Copies of the test citations")
+    parser.add_argument("--cnn-backend", default="numpy")
+    parser.add_argument("--ensemble-workers", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    options = parser.parse_args()
+
+    bmcs_args = [options.weights, options.ensemble, "--cnn-backend", options.cnn_backend,
+                 "--ensemble-workers", str(options.ensemble_workers)]
+    if options.cnn_backend == "numpy":
+        bmcs_args.append("--length-buckets")
+    args = get_args().parse_args(bmcs_args)
+    concurrent_args = get_args().parse_args(bmcs_args + ["--concurrent"])
+
+    path = options.path
+    if path is None:
+        path = write_replicated_update_file(os.path.join(tempfile.mkdtemp(), "replicated.xml"), options.copies)
+    citations = parse_update_file(path, False, False, {}, True, [])
+    print("{0} citations, {1} CPUs".format(len(citations), os.cpu_count()))
+
+    # Thread limits for --concurrent are set when the models are loaded
+    o_sci_model, o_cnn_model = load_models(concurrent_args)
+    journal_ids_path = resource_filename("BmCS.BmCS", "models/journal_ids.txt")
+    word_indices_path = resource_filename("BmCS.BmCS", "models/word_indices.txt")
+
+    ensemble_seconds, _ = _time(lambda: o_sci_model.process(preprocess_data(citations)[0]), options.repeat)
+    cnn_seconds, _ = _time(lambda: o_cnn_model.process(get_batch_data(citations, journal_ids_path, word_indices_path)), options.repeat)
+    sequential_seconds, sequential = _time(lambda: run_models(citations, o_sci_model, o_cnn_model, args), options.repeat)
+    concurrent_seconds, concurrent = _time(lambda: run_models(citations, o_sci_model, o_cnn_model, concurrent_args), options.repeat)
+
+    same = all(np.array_equal(a, b) for a, b in zip(sequential, concurrent))
+    print("{0:>12}: {1:.2f}s".format("ensemble", ensemble_seconds))
+    print("{0:>12}: {1:.2f}s".format("CNN", cnn_seconds))
+    print("{0:>12}: {1:.2f}s (sum of branches {2:.2f}s)".format("sequential", sequential_seconds, ensemble_seconds + cnn_seconds))
+    print("{0:>12}: {1:.2f}s (slower branch {2:.2f}s), same predictions: {3}".format(
+        "concurrent", concurrent_seconds, max(ensemble_seconds, cnn_seconds), same))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark the vectorized decision kernel
+
+Labels random combined predictions for journals drawn from the group lists and
+outside them, with and without group thresholds and publication type marks,
+with adjust_thresholds, marking pub types and adjust_in_scope_predictions in turn,
+then with decide_labels, and checks that the labels are the same.
+
+python benchmarks/bench_decision_kernel.py --citations 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS.journal_policy import JournalPolicy
+from BmCS.model_utils import adjust_thresholds, adjust_in_scope_predictions, decide_labels
+
+
+def _time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _per_citation(prediction_dict, journal_policy, group_thresh, review_mask):
+    labels = adjust_thresholds(prediction_dict, journal_policy, group_thresh)
+    if review_mask is not None:
+        # As filter_pub_type marks them
+        for i in np.flatnonzero(review_mask).tolist():
+            labels[i] = 3
+    return adjust_in_scope_predictions(labels, prediction_dict)
+
+
+def _kernel(predictions, journal_codes, journal_vocab, journal_policy, group_thresh, review_mask):
+    # As decide_predictions looks up the journals of a CitationBatch
+    group_indices = journal_policy.coded_group_indices(journal_codes, journal_vocab) if group_thresh else None
+    return decide_labels(predictions, group_indices, review_mask)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized decision kernel")
+    parser.add_argument("--citations", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    journal_policy = JournalPolicy.from_config()
+    group_journal_ids = sorted(set().union(*journal_policy.group_ids.values()))
+    # About a tenth of citations from journals in a group
+    journal_ids = np.where(rng.random(args.citations) < 0.1,
+                           rng.choice(group_journal_ids, args.citations), "0000000").tolist()
+    journal_vocab, journal_codes = np.unique(journal_ids, return_inverse=True)
+    journal_vocab = journal_vocab.tolist()
+    predictions = rng.random(args.citations) ** 4
+    prediction_dict = {'predictions': predictions, 'journal_ids': journal_ids}
+    pub_type_mask = rng.random(args.citations) < 0.02
+
+    print("{0} citations".format(args.citations))
+    for group_thresh in [False, True]:
+        for review_mask in [None, pub_type_mask]:
+            per_citation_seconds, expected = _time(lambda: _per_citation(prediction_dict, journal_policy, group_thresh, review_mask), args.repeat)
+            kernel_seconds, labels = _time(lambda: _kernel(predictions, journal_codes, journal_vocab, journal_policy, group_thresh, review_mask), args.repeat)
+            group_indices = journal_policy.coded_group_indices(journal_codes, journal_vocab) if group_thresh else None
+            labels_only_seconds, _ = _time(lambda: decide_labels(predictions, group_indices, review_mask), args.repeat)
+            print("group thresholds {0:>5}, pub types {1:>5}: per citation {2:.3f}s, decide_labels {3:.3f}s ({4:.4f}s given group indices), {5:.0f}x, same labels: {6}".format(
+                str(group_thresh), str(review_mask is not None), per_citation_seconds, kernel_seconds, labels_only_seconds,
+                per_citation_seconds / kernel_seconds, labels.tolist() == expected))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark filter-first extraction in the update file parser
+
+Times the citation loop of parse_update_file with --filter options,
+extracting every citation before filtering (the previous behaviour)
+against checking status and journal first and extracting only kept citations.
+
+python benchmarks/bench_filtered_parse.py --copies 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS import daily_update_file_parser as parser_module
+from _data import write_replicated_update_file
+
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BmCS", "config")
+
+
+def _extract_then_filter(nodes, filter_args):
+    citations = []
+    for node in nodes:
+        citation_data = parser_module._extract_citation_data(node)
+        if parser_module._keep_citation(citation_data[6], citation_data[4], *filter_args):
+            citations.append(parser_module._construct_citation_dict(citation_data))
+    return citations
+
+
+def _filter_then_extract(nodes, filter_args):
+    citations = []
+    predict_all = filter_args[3]
+    for node in nodes:
+        if predict_all or parser_module._keep_citation(*parser_module._extract_filter_data(node), *filter_args):
+            citations.append(parser_module._construct_citation_dict(parser_module._extract_citation_data(node)))
+    return citations
+
+
+def _time(func, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        parser_module._extract_year_from_medlinedate.cache_clear()
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark filter-first citation extraction")
+    parser.add_argument("--copies", type=int, default=2000, help="Number of copies of the test citations in the file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with open(os.path.join(CONFIG_DIR, "selectively_indexed_id_mapping.json")) as f:
+        selectively_indexed_ids = json.load(f)
+    with open(os.path.join(CONFIG_DIR, "misindexed_journal_ids.json")) as f:
+        misindexed_ids = json.load(f)['misindexed_ids']
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        xml_path = write_replicated_update_file(os.path.join(tmp_dir, "update.xml"), args.copies)
+        nodes = ET.parse(xml_path).getroot().findall('PubmedArticle/MedlineCitation')
+
+    print("{0} citations".format(len(nodes)))
+    # journal_drop, predict_medline, selectively_indexed_ids, predict_all, misindexed_ids
+    for name, filter_args in [
+            ("--filter", (False, False, selectively_indexed_ids, False, misindexed_ids)),
+            ("--filter --journal-drop", (True, False, selectively_indexed_ids, False, misindexed_ids)),
+            ("--filter --predict-medline", (False, True, selectively_indexed_ids, False, misindexed_ids)),
+            ("no filter", (False, False, selectively_indexed_ids, True, misindexed_ids))]:
+        before, before_citations = _time(_extract_then_filter, nodes, filter_args, repeat=args.repeat)
+        after, after_citations = _time(_filter_then_extract, nodes, filter_args, repeat=args.repeat)
+        assert before_citations == after_citations
+        print("{0:>28}: kept {1:>6}, extract then filter {2:.3f}s, filter first {3:.3f}s ({4:.1f}x)".format(
+            name, len(after_citations), before, after, before / after))
+
+
+if __name__ == "__main__":
+    main()
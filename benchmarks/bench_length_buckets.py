@@ -0,0 +1,97 @@
+"""
+Benchmark length-bucketed CNN inference
+
+Runs the NumPy CNN backend over every padded position, and with length buckets,
+on the token lengths of a daily update file: synthetic by default, or those of
+an update file given with --path. Reports citations per second for each, and the
+largest difference between their probabilities. With --tensorflow, also times
+the TensorFlow backend.
+
+python benchmarks/bench_length_buckets.py --citations 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS.bmcs_cnn_model import CnnModel
+from BmCS.numpy_cnn import sequence_lengths
+from BmCS.preprocess_CNN_data import get_batch_data, TITLE_MAX_WORDS, ABSTRACT_MAX_WORDS
+from BmCS.daily_update_file_parser import parse_update_file
+from _data import daily_file_word_indices
+
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BmCS", "models")
+
+
+def _batch_x(args, vocab_size):
+    if args.path is not None:
+        citations = parse_update_file(args.path, False, False, {}, True, [])
+        return get_batch_data(citations, os.path.join(MODELS_DIR, "journal_ids.txt"), os.path.join(MODELS_DIR, "word_indices.txt"))
+
+    title_input, abstract_input = daily_file_word_indices(args.citations, TITLE_MAX_WORDS, ABSTRACT_MAX_WORDS, vocab_size)
+    rng = np.random.default_rng(1)
+    # One hot publication year and year completed periods
+    pub_year_input = np.eye(43, dtype=np.float32)[rng.integers(0, 43, args.citations)]
+    year_completed_input = np.eye(12, dtype=np.float32)[rng.integers(0, 12, args.citations)]
+    return {'title_input': title_input, 'abstract_input': abstract_input,
+            'pub_year_input': pub_year_input, 'year_completed_input': year_completed_input}
+
+
+def _vocab_size():
+    with open(os.path.join(MODELS_DIR, "model_CNN.json")) as f:
+        layers = json.load(f)['config']['layers']
+    return next(layer['config']['input_dim'] for layer in layers if 'input_dim' in layer['config'])
+
+
+def _time(model, batch_x, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        predictions = model.process(batch_x)
+        best = min(best, time.perf_counter() - start)
+    return best, predictions
+
+
+def _load(backend, weights, length_buckets=False, precision="float32"):
+    model = CnnModel()
+    model.from_file(os.path.join(MODELS_DIR, "model_CNN.json"), weights, backend=backend, length_buckets=length_buckets, precision=precision)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark length-bucketed CNN inference")
+    parser.add_argument("--weights", default=os.path.join(MODELS_DIR, "model_CNN_weights.hdf5"), help="CNN weights file")
+    parser.add_argument("--path", default=None, help="Update file to take the citations from, instead of synthetic token lengths")
+    parser.add_argument("--citations", type=int, default=2000, help="Number of synthetic citations")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tensorflow", action="store_true", help="Also time the TensorFlow backend")
+    args = parser.parse_args()
+
+    full = _load("numpy", args.weights)
+    bucketed = _load("numpy", args.weights, length_buckets=True)
+    batch_x = _batch_x(args, _vocab_size())
+
+    num_citations = len(batch_x['title_input'])
+    abstract_lengths = sequence_lengths(batch_x['abstract_input'])
+    print("{0} citations, mean title length {1:.1f}, mean abstract length {2:.1f}, {3:.1%} without abstract".format(
+        num_citations, sequence_lengths(batch_x['title_input']).mean(), abstract_lengths.mean(), np.mean(abstract_lengths == 0)))
+
+    results = [("numpy", ) + _time(full, batch_x, args.repeat), ("numpy, length buckets", ) + _time(bucketed, batch_x, args.repeat)]
+    if args.tensorflow:
+        results.append(("tensorflow", ) + _time(_load("tensorflow", args.weights), batch_x, args.repeat))
+
+    reference = results[0][2]
+    for name, seconds, predictions in results:
+        print("{0:>24}: {1:.3f}s, {2:.0f} citations/s, max difference {3:.2g}".format(
+            name, seconds, num_citations / seconds, np.abs(predictions - reference).max()))
+
+
+if __name__ == "__main__":
+    main()
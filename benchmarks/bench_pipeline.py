@@ -0,0 +1,78 @@
+"""
+Benchmark the pipelined micro-batch mode
+
+Scores an update file made of repeated test citations, or given with --path,
+with the command line as usual and with --pipeline, each in a fresh process.
+Reports the wall time and peak resident memory of each run, and checks that
+the prediction files are the same.
+
+python benchmarks/bench_pipeline.py WEIGHTS ENSEMBLE --copies 3000 --cnn-backend numpy
+"""
+
+import argparse
+import filecmp
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from _data import write_replicated_update_file
+
+
+def _child(bmcs_args):
+    from BmCS.BmCS import main
+    sys.argv = ["BmCS"] + bmcs_args
+    start = time.perf_counter()
+    main()
+    print(json.dumps({
+        'seconds': time.perf_counter() - start,
+        # ru_maxrss is in KB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        _child(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipelined micro-batch mode")
+    parser.add_argument("weights", help="CNN weights file")
+    parser.add_argument("ensemble", help="Ensemble file")
+    parser.add_argument("--path", default=None, help="Update file to score, instead of repeated test citations")
+    parser.add_argument("--copies", type=int, default=3000, help="Copies of the test citations")
+    parser.add_argument("--cnn-backend", default="numpy")
+    parser.add_argument("--pipeline-batch-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = args.path
+        if path is None:
+            path = write_replicated_update_file(os.path.join(temp_dir, "replicated.xml"), args.copies)
+
+        runs = [("whole file", []), ("--pipeline", ["--pipeline", "--pipeline-batch-size", str(args.pipeline_batch_size)])]
+        outputs = []
+        for name, extra_args in runs:
+            destination = os.path.join(temp_dir, name.strip("-").replace(" ", "_"), "")
+            os.makedirs(destination)
+            bmcs_args = [args.weights, args.ensemble, "--path", path, "--cnn-backend", args.cnn_backend, "--dest", destination] + extra_args
+            completed = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"] + bmcs_args, stdout=subprocess.PIPE, check=True)
+            result = json.loads(completed.stdout.decode().strip().splitlines()[-1])
+            outputs.append([os.path.join(destination, name) for name in sorted(os.listdir(destination))])
+            print("{0:>12}: {1:.1f}s, peak RSS {2:.0f} MB".format(name, result['seconds'], result['peak_rss_mb']))
+
+        same = len(outputs[0]) == len(outputs[1]) and all(filecmp.cmp(a, b, shallow=False) for a, b in zip(*outputs))
+        print("Same predictions file: {0}".format(same))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Benchmark writing prediction files
+
+Writes random predictions line at a time with str.format, as save_predictions
+did, then in each output format with the prediction writer, and reports the
+time and file size of each. Checks that the text file is the same.
+
+python benchmarks/bench_prediction_writer.py --citations 1000000
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from BmCS.prediction_writer import write_predictions, OUTPUT_FORMATS, OUTPUT_SUFFIXES
+
+
+def _write_lines(adjusted_predictions, prediction_dict, pmids, path):
+    with open(path, "w") as f:
+        for i, prediction in enumerate(adjusted_predictions):
+            f.write("{0}|{1}|{2}|{3}\n".format(pmids[i], prediction, prediction_dict['predictions'][i], prediction_dict['journal_ids'][i]))
+
+
+def _time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark writing prediction files")
+    parser.add_argument("--citations", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    # Combined probabilities, mostly small as for a daily update file
+    prediction_dict = {'predictions': rng.random(args.citations) ** 4,
+                       'journal_ids': ["{0:07d}".format(journal_id) for journal_id in rng.integers(0, 10000000, args.citations)]}
+    adjusted_predictions = rng.integers(0, 4, args.citations).astype(np.int8)
+    pmids = rng.integers(1, 40000000, args.citations)
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        legacy_path = os.path.join(temp_dir, "legacy.txt")
+        seconds = _time(lambda: _write_lines(adjusted_predictions, prediction_dict, pmids, legacy_path), args.repeat)
+        print("{0} citations".format(args.citations))
+        print("{0:>12}: {1:.2f}s, {2:.1f} MB".format("line by line", seconds, os.path.getsize(legacy_path) / 1e6))
+
+        for output_format in OUTPUT_FORMATS:
+            path = os.path.join(temp_dir, "predictions" + OUTPUT_SUFFIXES[output_format])
+            try:
+                seconds = _time(lambda: write_predictions(adjusted_predictions, prediction_dict, pmids, path, output_format), args.repeat)
+            except Exception as e:
+                print("{0:>12}: {1}".format(output_format, e))
+                continue
+            same = ""
+            if output_format == 'text':
+                with open(legacy_path, "rb") as legacy, open(path, "rb") as written:
+                    same = ", same as line by line: {0}".format(legacy.read() == written.read())
+            print("{0:>12}: {1:.2f}s, {2:.1f} MB{3}".format(output_format, seconds, os.path.getsize(path) / 1e6, same))
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+if __name__ == "__main__":
+    main()
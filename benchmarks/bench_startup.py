@@ -0,0 +1,75 @@
+"""
+Benchmark command line startup
+
+Times `python -m BmCS --help` and `import BmCS.BmCS` in fresh interpreters,
+and lists the heavy frameworks each one loaded. Exits with status 1 if the
+best time is over its limit, or if any of the frameworks was imported, so that
+it can be run as a check after changes to the imports.
+
+python benchmarks/bench_startup.py --repeat 5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# Modules that only the stages that run the models should import
+HEAVY_MODULES = ("tensorflow", "keras", "sklearn", "joblib", "nltk", "pkg_resources", "dateutil")
+
+# Prints the heavy modules that were imported, to stderr, as --help prints to stdout
+_REPORT_MODULES = "import sys; print(' '.join(m for m in {0!r} if m in sys.modules), file=sys.stderr)".format(HEAVY_MODULES)
+
+
+def _time(command, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _loaded_modules(code):
+    output = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+    return output.stderr.decode().split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark command line startup")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--help-limit", type=float, default=2.0, help="Seconds allowed for python -m BmCS --help")
+    parser.add_argument("--import-limit", type=float, default=2.0, help="Seconds allowed for import BmCS.BmCS")
+    args = parser.parse_args()
+
+    checks = [
+        ("python -m BmCS --help", [sys.executable, "-m", "BmCS", "--help"],
+            "import runpy, sys; sys.argv = ['BmCS', '--help']\ntry:\n    runpy.run_module('BmCS', run_name='__main__')\nexcept SystemExit:\n    pass\n" + _REPORT_MODULES,
+            args.help_limit),
+        ("import BmCS.BmCS", [sys.executable, "-c", "import BmCS.BmCS"],
+            "import BmCS.BmCS\n" + _REPORT_MODULES,
+            args.import_limit),
+        ]
+
+    # Interpreter startup, for reference
+    baseline = _time([sys.executable, "-c", "pass"], args.repeat)
+    print("{0:>24}: {1:.3f}s".format("python -c pass", baseline))
+
+    failed = False
+    for name, command, report_code, limit in checks:
+        best = _time(command, args.repeat)
+        loaded = _loaded_modules(report_code)
+        ok = best <= limit and not loaded
+        failed = failed or not ok
+        print("{0:>24}: {1:.3f}s (limit {2:.1f}s), heavy modules loaded: {3} {4}".format(
+            name, best, limit, ", ".join(loaded) or "none", "OK" if ok else "FAIL"))
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
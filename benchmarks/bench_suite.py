@@ -0,0 +1,212 @@
+"""
+Benchmark each stage of scoring, and the whole command line
+
+Scores a synthetic update file (see synthetic_pubmed.py), or one given with
+--xml, one stage at a time: XML parsing, preprocess_data, tokenization,
+get_batch_data, the ensemble, the CNN, the decision thresholds and
+save_predictions. Each stage is timed on its own, best of --repeat, and its peak
+Python and NumPy allocations are measured with tracemalloc in a separate,
+untimed run. Then the command line scores the file in a fresh process, as usual
+and with --pipeline, for the wall time and peak resident memory of a whole run.
+Without model files, the model stages and the whole runs are skipped.
+
+Results are written as JSON to --output, and compared with the limits in
+--thresholds. With --check, the script exits with status 1 if a stage is
+slower than its minimum citations per second, or (at the number of citations
+the limits were set for) uses more than its maximum memory.
+
+python benchmarks/bench_suite.py path/to/model_CNN_weights.hdf5 path/to/ensemble.joblib --citations 10000 --check
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from synthetic_pubmed import write_synthetic_update_file
+
+from BmCS.BmCS import get_args, load_config, load_models, parse_citations, cnn_input, decide_predictions, save_predictions
+from BmCS.preprocess_CNN_data import TITLE_MAX_WORDS, ABSTRACT_MAX_WORDS
+from BmCS.preprocess_voting_data import preprocess_data
+from BmCS.word_tokenizer import get_tokenizer
+
+
+DEFAULT_THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "suite_thresholds.json")
+
+
+def _time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _peak_mb(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+
+def _tokenize(citations, tokenizer):
+    # As get_batch_data tokenizes, up to the CNN input length
+    tokenize = get_tokenizer(tokenizer)
+    return ([tokenize(title.lower(), TITLE_MAX_WORDS) for title in citations.titles],
+            [tokenize(abstract.lower(), ABSTRACT_MAX_WORDS) for abstract in citations.abstracts])
+
+
+def _whole_run(bmcs_args):
+    """
+    Wall time and peak resident memory of the command line in a fresh process
+    """
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "BmCS"] + bmcs_args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               cwd=os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    _, status, usage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - start
+    if status != 0:
+        raise RuntimeError("BmCS {0} exited with status {1}".format(" ".join(bmcs_args), status))
+    # ru_maxrss is in KB on Linux
+    return seconds, usage.ru_maxrss / 1024
+
+
+def run_stages(path, bmcs_args, has_models, repeat, temp_dir):
+    """
+    Time and measure each stage, passing each one's output on to the next.
+    Returns the number of citations scored, and the results of each stage.
+    """
+
+    args = get_args().parse_args(bmcs_args)
+    journal_policy = load_config()
+    stages = {}
+
+    def run(name, func, num_citations=None):
+        seconds, result = _time(func, repeat)
+        peak_mb = _peak_mb(func)
+        if num_citations is None:
+            num_citations = len(result)
+        stages[name] = {'seconds': seconds, 'citations_per_second': num_citations / seconds, 'peak_mb': peak_mb}
+        print("{0:>12}: {1:.3f}s, {2:.0f} citations/s, peak {3:.0f} MB".format(name, seconds, num_citations / seconds, peak_mb))
+        return result
+
+    def skip(name):
+        stages[name] = None
+        print("{0:>12}: skipped, no model files".format(name))
+
+    citations = run('parse', lambda: parse_citations(path, args, journal_policy))
+    num_citations = len(citations)
+    run('preprocess', lambda: preprocess_data(citations), num_citations)
+    run('tokenize', lambda: _tokenize(citations, args.tokenizer), num_citations)
+    CNN_citations = run('vectorize', lambda: cnn_input(citations, args), num_citations)
+
+    if has_models:
+        o_sci_model, o_cnn_model = load_models(args)
+        voting_citations, _, _ = preprocess_data(citations)
+        voting_predictions = run('ensemble', lambda: o_sci_model.process(voting_citations))
+        cnn_predictions = run('cnn', lambda: o_cnn_model.process(CNN_citations))
+        adjusted_predictions, prediction_dict, pmids = run('thresholds', lambda: decide_predictions(citations, voting_predictions, cnn_predictions, journal_policy, args), num_citations)
+        run('save', lambda: save_predictions(adjusted_predictions, prediction_dict, pmids, temp_dir + "/", file_name="citation_predictions.txt", output_format=args.output_format), num_citations)
+    else:
+        for name in ['ensemble', 'cnn', 'thresholds', 'save']:
+            skip(name)
+
+    for name, extra_args in [('whole', []), ('pipeline', ["--pipeline"])]:
+        if not has_models:
+            skip(name)
+            continue
+        destination = os.path.join(temp_dir, name, "")
+        os.makedirs(destination)
+        seconds, peak_mb = _whole_run(bmcs_args + ["--dest", destination] + extra_args)
+        stages[name] = {'seconds': seconds, 'citations_per_second': num_citations / seconds, 'peak_mb': peak_mb}
+        print("{0:>12}: {1:.1f}s, {2:.0f} citations/s, peak RSS {3:.0f} MB".format(name, seconds, num_citations / seconds, peak_mb))
+
+    return num_citations, stages
+
+
+def check_thresholds(stages, num_citations, thresholds):
+    """
+    Compare the stage results with the limits. Returns a list of failures, as strings.
+    A stage may have either limit, or both. Memory limits only apply at the number of citations they were set for.
+    """
+
+    failures = []
+    for name, limits in thresholds['stages'].items():
+        result = stages.get(name)
+        if result is None:
+            continue
+        if 'min_citations_per_second' in limits and result['citations_per_second'] < limits['min_citations_per_second']:
+            failures.append("{0}: {1:.0f} citations/s, below {2:.0f}".format(name, result['citations_per_second'], limits['min_citations_per_second']))
+        if num_citations == thresholds['citations'] and 'max_peak_mb' in limits and result['peak_mb'] > limits['max_peak_mb']:
+            failures.append("{0}: peak {1:.0f} MB, above {2:.0f} MB".format(name, result['peak_mb'], limits['max_peak_mb']))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of scoring, and the whole command line")
+    parser.add_argument("weights", nargs="?", default=None, help="CNN weights file. Without model files, only the stages before the models run.")
+    parser.add_argument("ensemble", nargs="?", default=None, help="Ensemble file")
+    parser.add_argument("--citations", type=int, default=10000, help="Citations in the synthetic update file")
+    parser.add_argument("--xml", default=None, help="Update file to score, instead of a synthetic one")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cnn-backend", default="numpy")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="bench_suite_results.json", help="JSON results file")
+    parser.add_argument("--thresholds", default=DEFAULT_THRESHOLDS_PATH, help="JSON file of regression limits")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 if a stage is past its limits")
+    args = parser.parse_args()
+
+    has_models = args.weights is not None and args.ensemble is not None
+    temp_dir = tempfile.mkdtemp()
+    try:
+        path = args.xml
+        if path is None:
+            path = write_synthetic_update_file(os.path.join(temp_dir, "synthetic.xml"), args.citations, args.seed)
+        # All citations are scored, as by default, with the publication type and group threshold adjustments
+        bmcs_args = [args.weights or "", args.ensemble or "", "--path", os.path.abspath(path), "--cnn-backend", args.cnn_backend,
+                     "--pubtype-filter", "--group-thresh"]
+        print("{0}, {1:.1f} MB".format(args.xml or "{0} synthetic citations".format(args.citations), os.path.getsize(path) / 1e6))
+        num_citations, stages = run_stages(path, bmcs_args, has_models, args.repeat, temp_dir)
+    finally:
+        shutil.rmtree(temp_dir)
+
+    with open(args.thresholds) as f:
+        thresholds = json.load(f)
+    failures = check_thresholds(stages, num_citations, thresholds)
+
+    results = {
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'cnn_backend': args.cnn_backend,
+        'input': args.xml or "synthetic",
+        'citations': num_citations,
+        'stages': stages,
+        'failures': failures,
+        }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Wrote {0}".format(args.output))
+
+    for failure in failures:
+        print("Regression: {0}".format(failure))
+    if args.check and len(failures) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
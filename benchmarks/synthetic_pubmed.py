@@ -0,0 +1,351 @@
+"""
+Generate synthetic PubMed update files
+
+Writes a PubmedArticleSet of any size, from a thousand to millions of
+citations, shaped like a daily update file: a mix of indexing statuses,
+journals drawn from the selectively indexed, misindexed and group lists and
+beyond, Year, Year-Month and MedlineDate publication dates, unstructured and
+labelled abstracts (and none, for a fifth of citations), titles with inline
+markup and publication type prefixes, and author lists with many affiliations.
+Words are drawn from the vocabulary of the test citations with their
+frequencies, so tokenization and vectorization see realistic text.
+Files ending in .gz are gzipped. The same seed gives the same file.
+
+python benchmarks/synthetic_pubmed.py 100000 synthetic.xml.gz --seed 0
+"""
+
+import argparse
+import collections
+import gzip
+import json
+import os
+import random
+import re
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+from _data import TEST_XML_PATH, EMPTY_ABSTRACT_FRACTION, ABSTRACT_TOKENS_MEAN, ABSTRACT_TOKENS_SD, TITLE_TOKENS_MEAN, TITLE_TOKENS_SD
+
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BmCS", "config")
+JOURNAL_IDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "BmCS", "models", "journal_ids.txt")
+
+HEADER = ('<?xml version="1.0" encoding="utf-8"?>\n'
+          '<!DOCTYPE PubmedArticleSet PUBLIC "-//NLM//DTD PubMedArticle, 1st January 2024//EN" '
+          '"https://dtd.nlm.nih.gov/ncbi/pubmed/out/pubmed_240101.dtd">\n'
+          '<PubmedArticleSet>\n')
+FOOTER = '</PubmedArticleSet>\n'
+
+# Indexing statuses, roughly as they occur in daily update files
+STATUSES = ['MEDLINE', 'PubMed-not-MEDLINE', 'In-Data-Review', 'In-Process', 'Publisher']
+STATUS_WEIGHTS = [0.55, 0.12, 0.08, 0.17, 0.08]
+
+# Share of citations from journals in each config list, the rest from other journals
+SELECTIVELY_INDEXED_FRACTION = 0.15
+MISINDEXED_FRACTION = 0.02
+GROUP_FRACTION = 0.03
+NUM_OTHER_JOURNALS = 5000
+
+STRUCTURED_ABSTRACT_FRACTION = 0.35
+ABSTRACT_LABELS = [('BACKGROUND', 'BACKGROUND'), ('OBJECTIVE', 'OBJECTIVE'), ('METHODS', 'METHODS'),
+                   ('RESULTS', 'RESULTS'), ('CONCLUSIONS', 'CONCLUSIONS')]
+COPYRIGHT_FRACTION = 0.3
+
+# Title prefixes of the publication types marked for review, and the share of titles with one
+PUB_TYPE_PREFIXES = ['Erratum: ', 'Correction to: ', 'Comment on ', 'Reply to ', 'Retraction note: ', 'Author Correction: ', 'Publisher Correction: ']
+PUB_TYPE_PREFIX_FRACTION = 0.03
+MARKUP_FRACTION = 0.05
+PUBLICATION_TYPES = [('Review', 'D016454', 0.12), ('Case Reports', 'D002363', 0.05), ('Comment', 'D016420', 0.02),
+                     ('Editorial', 'D016421', 0.02), ('Letter', 'D016422', 0.03), ('Retraction of Publication', 'D016441', 0.002),
+                     ("Research Support, Non-U.S. Gov't", 'D013485', 0.2)]
+
+# Authors per citation: geometric with this mean, with a long tail of consortium papers
+AUTHORS_MEAN = 6
+CONSORTIUM_FRACTION = 0.01
+CONSORTIUM_AUTHORS = (50, 300)
+# Share of authors with 1, 2 and 3 affiliations
+AFFILIATIONS_PER_AUTHOR = [1, 2, 3]
+AFFILIATIONS_PER_AUTHOR_WEIGHTS = [0.8, 0.15, 0.05]
+
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+SEASONS = ['Spring', 'Summer', 'Fall', 'Winter']
+# Share of publication dates given as Year, Month and Day; Year and Month; Year; and MedlineDate
+PUB_DATE_WEIGHTS = [0.45, 0.3, 0.15, 0.1]
+PUB_YEARS = (1990, 2025)
+
+DEPARTMENTS = ['Medicine', 'Surgery', 'Pediatrics', 'Biochemistry', 'Epidemiology', 'Radiology', 'Psychiatry',
+               'Chemistry', 'Physics', 'Pharmacology', 'Neurology', 'Oncology', 'Public Health', 'Microbiology']
+INSTITUTIONS = ['University', 'University Hospital', 'Institute of Technology', 'Medical Center', 'Research Institute',
+                'School of Medicine', 'Cancer Center', 'Academy of Sciences']
+PLACES = [('Boston', 'MA, USA'), ('Bethesda', 'MD, USA'), ('London', 'UK'), ('Paris', 'France'), ('Beijing', 'China'),
+          ('Tokyo', 'Japan'), ('Berlin', 'Germany'), ('Toronto', 'ON, Canada'), ('Sydney', 'NSW, Australia'),
+          ('São Paulo', 'SP, Brazil'), ('Seoul', 'Korea'), ('Mumbai', 'India'), ('Madrid', 'Spain'), ('Zürich', 'Switzerland')]
+LAST_NAMES = ['Smith', 'Wang', 'Li', 'Zhang', 'García', 'Müller', 'Kim', 'Nguyen', 'Singh', 'Rossi', 'Tanaka',
+              'Silva', 'Novak', 'Cohen', "O'Brien", 'Kowalski', 'Andersson', 'Dubois', 'Ivanov', 'Ahmed']
+FORE_NAMES = ['John', 'Wei', 'Maria', 'Anna', 'David', 'Yuki', 'Ahmed', 'Sofia', 'Lars', 'Priya', 'José', 'Chen',
+              'Olga', 'Thomas', 'Fatima', 'Jean-Pierre', 'Emma', 'Hiroshi', 'Carlos', 'Ingrid']
+
+# Words drawn at a time, for speed
+_WORD_BLOCK = 1 << 20
+
+
+def load_vocabulary():
+    """
+    Words of the titles and abstracts of the test citations, and their relative frequencies
+    """
+
+    with open(TEST_XML_PATH, "rt", encoding="utf8") as f:
+        xml = f.read()
+    text = " ".join(re.findall(r"<(?:ArticleTitle|AbstractText)[^>]*>(.*?)</(?:ArticleTitle|AbstractText)>", xml, re.S))
+    text = re.sub(r"<[^>]+>", " ", text)
+    counts = collections.Counter(re.findall(r"[\w\-]+|[.,;:()%]", text))
+    words = sorted(counts)
+    frequencies = np.array([counts[word] for word in words], dtype=np.float64)
+    return words, frequencies / frequencies.sum()
+
+
+def journal_pool(rng):
+    """
+    Journal ids to draw from, with their relative frequencies
+    """
+
+    with open(os.path.join(CONFIG_DIR, "selectively_indexed_id_mapping.json")) as f:
+        selectively_indexed_ids = sorted(json.load(f))
+    with open(os.path.join(CONFIG_DIR, "misindexed_journal_ids.json")) as f:
+        misindexed_ids = sorted(json.load(f)['misindexed_ids'])
+    with open(os.path.join(CONFIG_DIR, "group_ids.json")) as f:
+        group_ids = sorted(set().union(*json.load(f).values()))
+
+    listed = set(selectively_indexed_ids) | set(misindexed_ids) | set(group_ids)
+    other_ids = []
+    if os.path.exists(JOURNAL_IDS_PATH):
+        with open(JOURNAL_IDS_PATH) as f:
+            other_ids = [line.split()[0] for line in f if len(line.split()) > 0 and line.split()[0] not in listed]
+    if len(other_ids) < NUM_OTHER_JOURNALS:
+        other_ids.extend("{0:09d}".format(100000000 + i) for i in range(NUM_OTHER_JOURNALS - len(other_ids)))
+    other_ids = list(rng.choice(other_ids, NUM_OTHER_JOURNALS, replace=False))
+
+    journal_ids, weights = [], []
+    for ids, fraction in [(selectively_indexed_ids, SELECTIVELY_INDEXED_FRACTION), (misindexed_ids, MISINDEXED_FRACTION),
+                          (group_ids, GROUP_FRACTION), (other_ids, 1 - SELECTIVELY_INDEXED_FRACTION - MISINDEXED_FRACTION - GROUP_FRACTION)]:
+        if len(ids) == 0:
+            continue
+        # A few journals publish most of the citations in each list
+        zipf = 1 / np.arange(1, len(ids) + 1)
+        journal_ids.extend(ids)
+        weights.extend(fraction * zipf / zipf.sum())
+
+    weights = np.array(weights)
+    return journal_ids, weights / weights.sum()
+
+
+class _Words(object):
+    """
+    Draws words with the vocabulary frequencies, in blocks
+    """
+
+    def __init__(self, rng, words, frequencies):
+        self._rng = rng
+        self._words = np.array([escape(word) for word in words], dtype=object)
+        self._frequencies = frequencies
+        self._block = []
+        self._position = 0
+
+    def take(self, num_words):
+        if self._position + num_words > len(self._block):
+            self._block = self._words[self._rng.choice(len(self._words), max(_WORD_BLOCK, num_words), p=self._frequencies)].tolist()
+            self._position = 0
+        words = self._block[self._position:self._position + num_words]
+        self._position += num_words
+        return words
+
+
+def write_synthetic_update_file(path, num_citations, seed=0, first_pmid=30000000):
+    """
+    Write a synthetic update file of num_citations citations to path, gzipped if it ends in .gz
+    """
+
+    # NumPy draws the columns of a chunk of citations, and random the choices within each citation
+    rng = np.random.default_rng(seed)
+    draw = random.Random(seed)
+    words, frequencies = load_vocabulary()
+    journal_ids, journal_weights = journal_pool(rng)
+    word_source = _Words(rng, words, frequencies)
+
+    if path.endswith(".gz"):
+        f = gzip.open(path, "wt", encoding="utf8", compresslevel=1)
+    else:
+        f = open(path, "wt", encoding="utf8")
+    with f:
+        f.write(HEADER)
+        # Columns of random choices are drawn for a chunk of citations at a time
+        for start in range(0, num_citations, 10000):
+            size = min(10000, num_citations - start)
+            f.writelines(_articles(rng, draw, word_source, journal_ids, journal_weights, first_pmid + start, size))
+        f.write(FOOTER)
+    return path
+
+
+def _articles(rng, draw, word_source, journal_ids, journal_weights, first_pmid, size):
+    statuses = rng.choice(STATUSES, size, p=STATUS_WEIGHTS)
+    journals = rng.choice(journal_ids, size, p=journal_weights)
+    title_lengths = np.clip(rng.normal(TITLE_TOKENS_MEAN, TITLE_TOKENS_SD, size).round(), 3, 60).astype(int)
+    abstract_lengths = np.clip(rng.normal(ABSTRACT_TOKENS_MEAN, ABSTRACT_TOKENS_SD, size).round(), 20, 900).astype(int)
+    abstract_kinds = rng.choice(3, size, p=[EMPTY_ABSTRACT_FRACTION,
+                                            (1 - EMPTY_ABSTRACT_FRACTION) * (1 - STRUCTURED_ABSTRACT_FRACTION),
+                                            (1 - EMPTY_ABSTRACT_FRACTION) * STRUCTURED_ABSTRACT_FRACTION])
+    num_authors = rng.geometric(1 / AUTHORS_MEAN, size)
+    consortium = rng.random(size) < CONSORTIUM_FRACTION
+    num_authors[consortium] = rng.integers(*CONSORTIUM_AUTHORS, consortium.sum())
+    pub_years = PUB_YEARS[1] - np.minimum(rng.geometric(0.15, size) - 1, PUB_YEARS[1] - PUB_YEARS[0])
+    date_kinds = rng.choice(len(PUB_DATE_WEIGHTS), size, p=PUB_DATE_WEIGHTS)
+
+    for i in range(size):
+        pmid = first_pmid + i
+        status = statuses[i]
+        pub_year = int(pub_years[i])
+
+        title = _sentence(draw, word_source, title_lengths[i])
+        if draw.random() < PUB_TYPE_PREFIX_FRACTION:
+            title = draw.choice(PUB_TYPE_PREFIXES) + title
+
+        pub_types = ['<PublicationType UI="D016428">Journal Article</PublicationType>']
+        for name, ui, fraction in PUBLICATION_TYPES:
+            if draw.random() < fraction:
+                pub_types.append('<PublicationType UI="{0}">{1}</PublicationType>'.format(ui, escape(name)))
+
+        date_completed = ""
+        if status == 'MEDLINE':
+            date_completed = "<DateCompleted><Year>{0}</Year><Month>{1:02d}</Month><Day>{2:02d}</Day></DateCompleted>\n      ".format(
+                    min(pub_year + 1, PUB_YEARS[1]), draw.randrange(1, 13), draw.randrange(1, 29))
+
+        yield ('<PubmedArticle>\n'
+               '    <MedlineCitation Status="{status}" Owner="{owner}">\n'
+               '      <PMID Version="1">{pmid}</PMID>\n'
+               '      {date_completed}<DateRevised><Year>{revised}</Year><Month>{month:02d}</Month><Day>{day:02d}</Day></DateRevised>\n'
+               '      <Article PubModel="Print-Electronic">\n'
+               '        <Journal>\n'
+               '          <ISSN IssnType="Electronic">{issn}</ISSN>\n'
+               '          <JournalIssue CitedMedium="Internet">\n'
+               '            <Volume>{volume}</Volume>\n'
+               '            <Issue>{issue}</Issue>\n'
+               '            <PubDate>{pub_date}</PubDate>\n'
+               '          </JournalIssue>\n'
+               '          <Title>Journal {journal}</Title>\n'
+               '          <ISOAbbreviation>J {journal}</ISOAbbreviation>\n'
+               '        </Journal>\n'
+               '        <ArticleTitle>{title}</ArticleTitle>\n'
+               '        <Pagination><MedlinePgn>{page}-{last_page}</MedlinePgn></Pagination>\n'
+               '{abstract}'
+               '        <AuthorList CompleteYN="Y">\n{authors}        </AuthorList>\n'
+               '        <Language>eng</Language>\n'
+               '        <PublicationTypeList>\n          {pub_types}\n        </PublicationTypeList>\n'
+               '      </Article>\n'
+               '      <MedlineJournalInfo>\n'
+               '        <Country>United States</Country>\n'
+               '        <MedlineTA>J {journal}</MedlineTA>\n'
+               '        <NlmUniqueID>{journal}</NlmUniqueID>\n'
+               '      </MedlineJournalInfo>\n'
+               '    </MedlineCitation>\n'
+               '    <PubmedData>\n'
+               '      <PublicationStatus>ppublish</PublicationStatus>\n'
+               '      <ArticleIdList><ArticleId IdType="pubmed">{pmid}</ArticleId></ArticleIdList>\n'
+               '    </PubmedData>\n'
+               '</PubmedArticle>\n').format(
+                status=status, owner="NLM" if status != 'Publisher' else "NOTNLM", pmid=pmid, date_completed=date_completed,
+                revised=PUB_YEARS[1], month=draw.randrange(1, 13), day=draw.randrange(1, 29),
+                issn="{0:04d}-{1:04d}".format(draw.randrange(10000), draw.randrange(10000)),
+                volume=draw.randrange(1, 200), issue=draw.randrange(1, 13), pub_date=_pub_date(draw, date_kinds[i], pub_year),
+                journal=journals[i], title=title, page=draw.randrange(1, 900), last_page=draw.randrange(900, 999),
+                abstract=_abstract(draw, word_source, abstract_kinds[i], abstract_lengths[i]),
+                authors=_authors(draw, num_authors[i]), pub_types="\n          ".join(pub_types))
+
+
+def _sentence(draw, word_source, num_words):
+    words = word_source.take(num_words)
+    if draw.random() < MARKUP_FRACTION:
+        # Inline markup, as for gene and species names
+        position = draw.randrange(len(words))
+        words[position] = "<i>{0}</i>".format(words[position])
+    text = " ".join(words)
+    return text[:1].upper() + text[1:] + "."
+
+
+def _abstract(draw, word_source, kind, num_words):
+    if kind == 0:
+        return ""
+
+    if kind == 1:
+        texts = ["          <AbstractText>{0}</AbstractText>\n".format(_paragraph(draw, word_source, num_words))]
+    else:
+        labels = ABSTRACT_LABELS[1:] if draw.random() < 0.5 else ABSTRACT_LABELS[:1] + ABSTRACT_LABELS[2:]
+        shares = [draw.random() + 1 for _ in labels]
+        section_words = [max(5, round(num_words * share / sum(shares))) for share in shares]
+        texts = ['          <AbstractText Label="{0}" NlmCategory="{1}">{2}</AbstractText>\n'.format(label, category, _paragraph(draw, word_source, section_num_words))
+                 for (label, category), section_num_words in zip(labels, section_words)]
+    if draw.random() < COPYRIGHT_FRACTION:
+        texts.append("          <CopyrightInformation>Copyright © {0} Elsevier Inc. All rights reserved.</CopyrightInformation>\n".format(draw.randrange(*PUB_YEARS)))
+
+    return "        <Abstract>\n{0}        </Abstract>\n".format("".join(texts))
+
+
+def _paragraph(draw, word_source, num_words):
+    sentences = []
+    while num_words > 0:
+        sentence_words = min(num_words, draw.randrange(8, 35))
+        sentences.append(_sentence(draw, word_source, sentence_words))
+        num_words -= sentence_words
+    return " ".join(sentences)
+
+
+def _authors(draw, num_authors):
+    authors = []
+    for _ in range(num_authors):
+        affiliations = []
+        for _ in range(draw.choices(AFFILIATIONS_PER_AUTHOR, AFFILIATIONS_PER_AUTHOR_WEIGHTS)[0]):
+            city, country = draw.choice(PLACES)
+            affiliation = "Department of {0}, {1} {2}, {1}, {3}.".format(
+                    draw.choice(DEPARTMENTS), city, draw.choice(INSTITUTIONS), country)
+            affiliations.append("            <AffiliationInfo><Affiliation>{0}</Affiliation></AffiliationInfo>\n".format(escape(affiliation)))
+        fore_name = draw.choice(FORE_NAMES)
+        authors.append('          <Author ValidYN="Y"><LastName>{0}</LastName><ForeName>{1}</ForeName><Initials>{2}</Initials>\n{3}          </Author>\n'.format(
+                escape(draw.choice(LAST_NAMES)), escape(fore_name), fore_name[0], "".join(affiliations)))
+    return "".join(authors)
+
+
+def _pub_date(draw, kind, year):
+    month = draw.choice(MONTHS)
+    if kind == 0:
+        return "<Year>{0}</Year><Month>{1}</Month><Day>{2:02d}</Day>".format(year, month, draw.randrange(1, 29))
+    if kind == 1:
+        return "<Year>{0}</Year><Month>{1}</Month>".format(year, month)
+    if kind == 2:
+        return "<Year>{0}</Year>".format(year)
+
+    # The MedlineDate forms of issues that span months, seasons or years
+    first_month = draw.randrange(11)
+    medline_dates = [
+        "{0} {1}-{2}".format(year, MONTHS[first_month], MONTHS[first_month + 1]),
+        "{0} {1}".format(year, SEASONS[draw.randrange(4)]),
+        "{0}-{1}".format(year - 1, year),
+        "{0} Dec-{1} Jan".format(year - 1, year),
+        "{0} {1} {2}-{3}".format(year, month, draw.randrange(1, 14), draw.randrange(14, 29)),
+        "{0} {1}".format(SEASONS[draw.randrange(4)], year),
+        ]
+    return "<MedlineDate>{0}</MedlineDate>".format(draw.choice(medline_dates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic PubMed update file")
+    parser.add_argument("citations", type=int, help="Number of citations, e.g. 1000 to 1000000")
+    parser.add_argument("path", help="Output file, gzipped if it ends in .gz")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    write_synthetic_update_file(args.path, args.citations, args.seed)
+    print("Wrote {0} citations to {1}, {2:.1f} MB".format(args.citations, args.path, os.path.getsize(args.path) / 1e6))
+
+
+if __name__ == "__main__":
+    main()